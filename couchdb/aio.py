@@ -0,0 +1,1063 @@
+# -*- coding: utf-8 -*-
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+
+"""Asynchronous client API for CouchDB based on `asyncio`.
+
+The classes in this module mirror `Server`, `Database` and `ViewResults` from
+`couchdb.client`, but every operation that talks to the server is a coroutine,
+and view results and continuous changes feeds are consumed using
+``async for``::
+
+    async def main():
+        async with AsyncServer() as server:
+            db = await server.create('python-tests')
+            await db.save({'_id': 'johndoe', 'type': 'Person'})
+            async for row in db.view('_all_docs'):
+                print(row.id)
+            await server.delete('python-tests')
+
+Because a single event loop can drive many requests at once, thousands of
+document reads can be issued concurrently (e.g. with `asyncio.gather`)
+without needing a thread per request. Connections are pooled per host just
+like in `couchdb.http.Session`; use `max_connections` to bound the number of
+sockets opened to a server.
+
+Errors are reported using the same exception types as the synchronous client,
+defined in `couchdb.http`.
+
+This module requires Python 3.6 or later.
+"""
+
+import asyncio
+import collections
+import errno
+import socket
+import ssl
+import time
+from http.client import parse_headers
+from io import BytesIO
+
+from couchdb import http, json, util
+from couchdb.client import DEFAULT_BASE_URL, Document, Row, \
+                           _doc_resource, _encode_view_options, \
+                           _path_from_name
+from couchdb.sampler import Sampler
+
+__all__ = ['AsyncServer', 'AsyncDatabase', 'AsyncViewResults',
+           'AsyncSession', 'AsyncResource', 'AsyncSampler']
+__docformat__ = 'restructuredtext en'
+
+
+class AsyncResponseBody(object):
+    """Body of a response that was not read by `AsyncSession.request`.
+
+    The connection is returned to the pool once the body has been read
+    completely; call `close()` to give up on a body that will not be
+    consumed.
+    """
+
+    def __init__(self, conn, conn_pool, url, msg, timeout, will_close):
+        self.conn = conn
+        self.conn_pool = conn_pool
+        self.url = url
+        self.timeout = timeout
+        self.will_close = will_close
+        self.chunked = msg.get('transfer-encoding') == 'chunked'
+        length = msg.get('content-length')
+        if self.chunked or length is None:
+            self.remaining = None
+        else:
+            self.remaining = int(length)
+
+    async def read(self):
+        """Read the complete body and return it as bytes."""
+        parts = []
+        async for chunk in self._iterraw():
+            parts.append(chunk)
+        return b''.join(parts)
+
+    async def iterchunks(self):
+        """Iterate over the body line by line, as used for continuous feeds.
+
+        Lines are yielded without their line terminator.
+        """
+        buf = b''
+        async for chunk in self._iterraw():
+            buf += chunk
+            lines = buf.split(b'\n')
+            buf = lines.pop()
+            for ln in lines:
+                yield ln.rstrip(b'\r')
+        if buf:
+            yield buf
+
+    async def _iterraw(self):
+        if self.conn is None:
+            return
+        reader = self.conn.reader
+        try:
+            if self.chunked:
+                while True:
+                    line = await self._wait(reader.readline())
+                    if not line:
+                        raise socket.error(errno.ECONNRESET)
+                    size = int(line.split(b';', 1)[0].strip(), 16)
+                    if not size:
+                        # Skip the trailer up to the final empty line.
+                        while (await self._wait(reader.readline())).strip():
+                            pass
+                        break
+                    chunk = await self._wait(reader.readexactly(size))
+                    await self._wait(reader.readexactly(2)) # crlf
+                    yield chunk
+            elif self.remaining is not None:
+                while self.remaining:
+                    chunk = await self._wait(
+                        reader.read(min(self.remaining, http.CHUNK_SIZE)))
+                    if not chunk:
+                        raise socket.error(errno.ECONNRESET)
+                    self.remaining -= len(chunk)
+                    yield chunk
+            else:
+                # No framing, the body is delimited by the connection close.
+                self.will_close = True
+                while True:
+                    chunk = await self._wait(reader.read(http.CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    yield chunk
+        except:
+            self.close()
+            raise
+        self._release_conn()
+
+    def _wait(self, awaitable):
+        return _wait(awaitable, self.timeout)
+
+    def _release_conn(self):
+        if self.conn is None:
+            return
+        if self.will_close:
+            self.conn_pool.discard(self.url, self.conn)
+        else:
+            self.conn_pool.release(self.url, self.conn)
+        self.conn_pool, self.url, self.conn = None, None, None
+
+    def close(self):
+        """Stop reading the body and close its connection, unless the body
+        has already been read completely.
+        """
+        if self.conn is not None:
+            # The rest of the body would have to be drained before the
+            # connection could be reused, which may never end for continuous
+            # feeds, so just close it.
+            self.conn_pool.discard(self.url, self.conn)
+            self.conn_pool, self.url, self.conn = None, None, None
+
+
+async def _wait(awaitable, timeout):
+    """Await the given awaitable, raising `socket.timeout` when it did not
+    complete within the given number of seconds, like blocking sockets do.
+    """
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise socket.timeout('timed out')
+
+
+class AsyncSession(object):
+    """Asynchronous counterpart of `couchdb.http.Session`."""
+
+    def __init__(self, timeout=None, max_redirects=5, retry_delays=[0],
+                 retryable_errors=http.RETRYABLE_ERRORS,
+                 max_connections=None, pool_timeout=None, idle_timeout=None,
+                 max_connection_age=None):
+        """Initialize an asynchronous HTTP client session.
+
+        The arguments have the same meaning as for `couchdb.http.Session`.
+        """
+        from couchdb import __version__ as VERSION
+        self.user_agent = 'CouchDB-Python/%s' % VERSION
+        self.max_redirects = max_redirects
+        self.perm_redirects = {}
+
+        self._disable_ssl_verification = False
+        self._timeout = timeout
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.idle_timeout = idle_timeout
+        self.max_connection_age = max_connection_age
+        self.connection_pool = self._create_connection_pool()
+
+        self.retry_delays = list(retry_delays) # We don't want this changing on us.
+        self.retryable_errors = set(retryable_errors)
+
+    def disable_ssl_verification(self):
+        """Disable verification of SSL certificates and re-initialize the
+        connection pool."""
+        self._disable_ssl_verification = True
+        self.connection_pool.close()
+        self.connection_pool = self._create_connection_pool()
+
+    def _create_connection_pool(self):
+        return AsyncConnectionPool(
+            self._timeout,
+            disable_ssl_verification=self._disable_ssl_verification,
+            max_connections=self.max_connections,
+            pool_timeout=self.pool_timeout,
+            idle_timeout=self.idle_timeout,
+            max_connection_age=self.max_connection_age)
+
+    def close(self):
+        """Close all idle connections."""
+        self.connection_pool.close()
+
+    async def request(self, method, url, body=None, headers=None,
+                      credentials=None, num_redirects=0):
+        if url in self.perm_redirects:
+            url = self.perm_redirects[url]
+        method = method.upper()
+
+        if headers is None:
+            headers = {}
+        headers.setdefault('Accept', 'application/json')
+        headers['User-Agent'] = self.user_agent
+
+        if hasattr(body, 'read'):
+            # Reading a file could block, so don't do it on the event loop.
+            body = await asyncio.get_event_loop().run_in_executor(None,
+                                                                  body.read)
+        if body is not None and not isinstance(body, util.strbase):
+            body = json.encode(body).encode('utf-8')
+            headers.setdefault('Content-Type', 'application/json')
+        if isinstance(body, util.utype):
+            body = body.encode('utf-8')
+        headers.setdefault('Content-Length', str(len(body or b'')))
+
+        authorization = http.basic_auth(credentials)
+        if authorization:
+            headers['Authorization'] = authorization
+
+        parts = util.urlsplit(url)
+        path_query = util.urlunsplit(('', '') + parts[2:4] + ('',)) or '/'
+        head = ['%s %s HTTP/1.1' % (method, path_query), 'Host: %s' % parts[1]]
+        for name, value in headers.items():
+            if isinstance(value, util.btype):
+                value = value.decode('latin-1')
+            head.append('%s: %s' % (name, value))
+        data = ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1')
+        if body:
+            data += body
+
+        pool = self.connection_pool
+        retries = iter(self.retry_delays)
+        while True:
+            conn = await pool.get(url)
+            try:
+                conn.writer.write(data)
+                await _wait(conn.writer.drain(), self._timeout)
+                version, status, msg = await self._read_head(conn)
+                break
+            except socket.error as e:
+                pool.discard(url, conn)
+                ecode = e.args[0] if e.args else None
+                if ecode not in self.retryable_errors:
+                    raise
+                try:
+                    delay = next(retries)
+                except StopIteration:
+                    # No more retries, raise last socket error.
+                    raise e
+                await asyncio.sleep(delay)
+            except:
+                pool.discard(url, conn)
+                raise
+
+        will_close = msg.get('connection', '').lower() == 'close' or \
+                version == 'HTTP/1.0'
+        data = None
+        if method == 'HEAD' or msg.get('content-length') == '0' or \
+                status < 200 or status in (204, 304):
+            if will_close:
+                pool.discard(url, conn)
+            else:
+                pool.release(url, conn)
+        else:
+            data = AsyncResponseBody(conn, pool, url, msg, self._timeout,
+                                     will_close)
+
+        # Handle redirects
+        if status == 303 or \
+                method in ('GET', 'HEAD') and status in (301, 302, 307):
+            if data is not None:
+                await data.read()
+            if num_redirects > self.max_redirects:
+                raise http.RedirectLimit('Redirection limit exceeded')
+            location = msg.get('location')
+            if status == 301:
+                self.perm_redirects[url] = location
+            elif status == 303:
+                method = 'GET'
+            return await self.request(method, location, body, headers,
+                                      num_redirects=num_redirects + 1)
+
+        # Handle errors
+        if status >= 400:
+            error = ''
+            if data is not None:
+                error = await data.read()
+                if 'application/json' in msg.get('content-type', ''):
+                    error = json.decode(error.decode('utf-8'))
+                    error = error.get('error'), error.get('reason')
+            raise http.http_error(status, error)
+
+        return status, msg, data
+
+    async def _read_head(self, conn):
+        reader = conn.reader
+        line = await _wait(reader.readline(), self._timeout)
+        if not line:
+            # The server closed the connection before sending a response,
+            # raise as ECONNRESET to simplify retry logic.
+            raise socket.error(errno.ECONNRESET)
+        parts = line.decode('latin-1').rstrip('\r\n').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise http.BadStatusLine(line)
+        head = []
+        while True:
+            line = await _wait(reader.readline(), self._timeout)
+            head.append(line)
+            if line in (b'\r\n', b'\n', b''):
+                break
+        msg = parse_headers(BytesIO(b''.join(head)))
+        status = int(parts[1])
+        if status == 100:
+            return await self._read_head(conn)
+        return parts[0], status, msg
+
+
+class _Connection(object):
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.connected_at = time.time()
+        self.released_at = None
+
+    def close(self):
+        self.writer.close()
+
+    def is_dropped(self):
+        # An idle connection should have nothing to read, so EOF means the
+        # server closed it while it sat in the pool.
+        return self.reader.at_eof() or self.writer.transport.is_closing()
+
+
+class AsyncConnectionPool(object):
+    """Asynchronous counterpart of `couchdb.http.ConnectionPool`.
+
+    Waiting for a connection when `max_connections` is reached suspends the
+    calling task instead of blocking the thread.
+    """
+
+    def __init__(self, timeout, disable_ssl_verification=False,
+                 max_connections=None, pool_timeout=None, idle_timeout=None,
+                 max_connection_age=None):
+        self.timeout = timeout
+        self.disable_ssl_verification = disable_ssl_verification
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.idle_timeout = idle_timeout
+        self.max_connection_age = max_connection_age
+        self.conns = {} # idle connections keyed by (scheme, host)
+        self.in_use = {} # number of checked out connections by (scheme, host)
+        self.waiters = {} # futures of tasks waiting for a connection
+        self.hits = self.misses = self.waits = self.evictions = 0
+        self.stale = 0
+
+    async def get(self, url):
+        key = util.urlsplit(url, 'http', False)[:2]
+        deadline = None
+        waited = False
+        while True:
+            conn = self._pop_idle(key)
+            if conn is not None:
+                self.hits += 1
+                self.in_use[key] = self.in_use.get(key, 0) + 1
+                return conn
+            in_use = self.in_use.get(key, 0)
+            if self.max_connections is None or in_use < self.max_connections:
+                self.misses += 1
+                self.in_use[key] = in_use + 1
+                break
+            if not waited:
+                waited = True
+                self.waits += 1
+                if self.pool_timeout is not None:
+                    deadline = time.time() + self.pool_timeout
+            await self._wait_for_release(key, deadline)
+
+        try:
+            return await self._connect(key)
+        except:
+            self.in_use[key] -= 1
+            self._wakeup(key)
+            raise
+
+    def release(self, url, conn):
+        key = util.urlsplit(url, 'http', False)[:2]
+        self.in_use[key] -= 1
+        if self._is_expired(conn):
+            self.evictions += 1
+            conn.close()
+        else:
+            conn.released_at = time.time()
+            self.conns.setdefault(key, collections.deque()).append(conn)
+        self._wakeup(key)
+
+    def discard(self, url, conn):
+        """Close the given connection instead of returning it to the pool."""
+        key = util.urlsplit(url, 'http', False)[:2]
+        self.in_use[key] -= 1
+        conn.close()
+        self._wakeup(key)
+
+    def stats(self):
+        """Return a dictionary with the pool counters, see
+        `couchdb.http.ConnectionPool.stats()`.
+        """
+        return {
+            'hits': self.hits, 'misses': self.misses,
+            'waits': self.waits, 'evictions': self.evictions,
+            'stale': self.stale,
+            'idle': sum(len(conns) for conns in self.conns.values()),
+            'in_use': sum(self.in_use.values()),
+        }
+
+    def close(self):
+        """Close all idle connections."""
+        for conns in self.conns.values():
+            while conns:
+                conns.pop().close()
+
+    async def _wait_for_release(self, key, deadline):
+        fut = asyncio.get_event_loop().create_future()
+        waiters = self.waiters.setdefault(key, collections.deque())
+        waiters.append(fut)
+        try:
+            if deadline is None:
+                await fut
+            else:
+                remaining = deadline - time.time()
+                if remaining > 0:
+                    try:
+                        await asyncio.wait_for(fut, remaining)
+                        return
+                    except asyncio.TimeoutError:
+                        pass
+                raise http.PoolTimeout('no connection to %s://%s available '
+                                       'within %s seconds' %
+                                       (key + (self.pool_timeout,)))
+        except:
+            if fut.done() and not fut.cancelled():
+                # We were woken up but won't use the connection, so pass the
+                # wakeup on to the next waiter.
+                self._wakeup(key)
+            raise
+        finally:
+            if fut in waiters:
+                waiters.remove(fut)
+
+    def _wakeup(self, key):
+        waiters = self.waiters.get(key)
+        while waiters:
+            fut = waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                break
+
+    def _pop_idle(self, key):
+        conns = self.conns.get(key)
+        if self.idle_timeout is not None:
+            # Idle connections are ordered by release time, so expired ones
+            # are always at the front.
+            cutoff = time.time() - self.idle_timeout
+            while conns and conns[0].released_at <= cutoff:
+                conns.popleft().close()
+                self.evictions += 1
+        while conns:
+            conn = conns.pop()
+            if self._is_expired(conn):
+                self.evictions += 1
+                conn.close()
+            elif conn.is_dropped():
+                self.stale += 1
+                conn.close()
+            else:
+                return conn
+
+    def _is_expired(self, conn):
+        if self.max_connection_age is None:
+            return False
+        return time.time() - conn.connected_at >= self.max_connection_age
+
+    async def _connect(self, key):
+        scheme, netloc = key
+        if scheme == 'http':
+            context, port = None, 80
+        elif scheme == 'https':
+            if self.disable_ssl_verification:
+                context = ssl._create_unverified_context()
+            else:
+                context = ssl.create_default_context()
+            port = 443
+        else:
+            raise ValueError('%s is not a supported scheme' % scheme)
+        parts = util.urlsplit('//' + netloc)
+        reader, writer = await _wait(
+            asyncio.open_connection(parts.hostname, parts.port or port,
+                                    ssl=context),
+            self.timeout)
+        return _Connection(reader, writer)
+
+
+class AsyncResource(object):
+    """Asynchronous counterpart of `couchdb.http.Resource`."""
+
+    def __init__(self, url, session, headers=None):
+        self.url, self.credentials = http.extract_credentials(url)
+        if session is None:
+            session = AsyncSession()
+        self.session = session
+        self.headers = headers or {}
+
+    def __call__(self, *path):
+        obj = type(self)(http.urljoin(self.url, *path), self.session)
+        obj.credentials = self.credentials
+        obj.headers = self.headers.copy()
+        return obj
+
+    def delete(self, path=None, headers=None, **params):
+        return self._request('DELETE', path, headers=headers, **params)
+
+    def get(self, path=None, headers=None, **params):
+        return self._request('GET', path, headers=headers, **params)
+
+    def head(self, path=None, headers=None, **params):
+        return self._request('HEAD', path, headers=headers, **params)
+
+    def post(self, path=None, body=None, headers=None, **params):
+        return self._request('POST', path, body=body, headers=headers,
+                             **params)
+
+    def put(self, path=None, body=None, headers=None, **params):
+        return self._request('PUT', path, body=body, headers=headers, **params)
+
+    def delete_json(self, path=None, headers=None, **params):
+        return self._request_json('DELETE', path, headers=headers, **params)
+
+    def get_json(self, path=None, headers=None, **params):
+        return self._request_json('GET', path, headers=headers, **params)
+
+    def post_json(self, path=None, body=None, headers=None, **params):
+        return self._request_json('POST', path, body=body, headers=headers,
+                                  **params)
+
+    def put_json(self, path=None, body=None, headers=None, **params):
+        return self._request_json('PUT', path, body=body, headers=headers,
+                                  **params)
+
+    async def _request(self, method, path=None, body=None, headers=None,
+                       **params):
+        all_headers = self.headers.copy()
+        all_headers.update(headers or {})
+        if path is not None:
+            url = http.urljoin(self.url, path, **params)
+        else:
+            url = http.urljoin(self.url, **params)
+        return await self.session.request(method, url, body=body,
+                                          headers=all_headers,
+                                          credentials=self.credentials)
+
+    async def _request_json(self, method, path=None, body=None, headers=None,
+                            **params):
+        status, headers, data = await self._request(method, path, body=body,
+                                                    headers=headers, **params)
+        if data is not None:
+            content = await data.read()
+            if 'application/json' in headers.get('content-type', ''):
+                data = json.decode(content.decode('utf-8'))
+            else:
+                data = content
+        return status, headers, data
+
+
+class AsyncServer(object):
+    """Asynchronous representation of a CouchDB server.
+
+    Apart from being coroutines, the methods behave like those of
+    `couchdb.client.Server`. Item access returns an `AsyncDatabase` without
+    checking that the database exists; the operations that would need a
+    request in the synchronous API are available as `contains()` and
+    `all_dbs()` instead.
+    """
+
+    def __init__(self, url=DEFAULT_BASE_URL, full_commit=True, session=None):
+        """Initialize the server object.
+
+        :param url: the URI of the server (for example
+                    ``http://localhost:5984/``)
+        :param full_commit: turn on the X-Couch-Full-Commit header
+        :param session: an `AsyncSession` instance or None for a default
+                        session
+        """
+        if isinstance(url, util.strbase):
+            self.resource = AsyncResource(url, session or AsyncSession())
+        else:
+            self.resource = url # treat as an AsyncResource object
+        if not full_commit:
+            self.resource.headers['X-Couch-Full-Commit'] = 'false'
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.resource.url)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getitem__(self, name):
+        """Return an `AsyncDatabase` object representing the database with the
+        specified name. No request is made to the server.
+        """
+        return AsyncDatabase(self.resource(name), name)
+
+    def close(self):
+        """Close the idle connections of the underlying session."""
+        self.resource.session.close()
+
+    async def contains(self, name):
+        """Return whether the server contains a database with the specified
+        name.
+        """
+        try:
+            await self.resource.head(name)
+            return True
+        except http.ResourceNotFound:
+            return False
+
+    async def all_dbs(self):
+        """Return the names of all databases."""
+        status, headers, data = await self.resource.get_json('_all_dbs')
+        return data
+
+    async def config(self):
+        """The configuration of the CouchDB server."""
+        status, headers, data = await self.resource.get_json('_config')
+        return data
+
+    async def version(self):
+        """The version string of the CouchDB server."""
+        status, headers, data = await self.resource.get_json()
+        return data['version']
+
+    async def stats(self, name=None):
+        """Server statistics.
+
+        :param name: name of single statistic, e.g. httpd/requests
+                     (None -- return all statistics)
+        """
+        if not name:
+            resource = self.resource('_stats')
+        else:
+            resource = self.resource('_stats', *name.split('/'))
+        status, headers, data = await resource.get_json()
+        return data
+
+    async def tasks(self):
+        """A list of tasks currently active on the server."""
+        status, headers, data = await self.resource.get_json('_active_tasks')
+        return data
+
+    async def uuids(self, count=None):
+        """Retrieve a batch of uuids
+
+        :param count: a number of uuids to fetch
+                      (None -- get as many as the server sends)
+        :return: a list of uuids
+        """
+        if count is None:
+            _, _, data = await self.resource.get_json('_uuids')
+        else:
+            _, _, data = await self.resource.get_json('_uuids', count=count)
+        return data['uuids']
+
+    async def create(self, name):
+        """Create a new database with the given name.
+
+        :return: an `AsyncDatabase` object representing the created database
+        :raise PreconditionFailed: if a database with that name already exists
+        """
+        await self.resource.put_json(name)
+        return self[name]
+
+    async def delete(self, name):
+        """Delete the database with the specified name.
+
+        :raise ResourceNotFound: if a database with that name does not exist
+        """
+        await self.resource.delete_json(name)
+
+    async def replicate(self, source, target, **options):
+        """Replicate changes from the source database to the target database.
+        """
+        data = {'source': source, 'target': target}
+        data.update(options)
+        status, headers, data = await self.resource.post_json('_replicate',
+                                                              data)
+        return data
+
+
+class AsyncDatabase(object):
+    """Asynchronous representation of a database on a CouchDB server.
+
+    Apart from being coroutines, the methods behave like those of
+    `couchdb.client.Database`.
+    """
+
+    def __init__(self, url, name=None, session=None):
+        if isinstance(url, util.strbase):
+            if not url.startswith('http'):
+                url = DEFAULT_BASE_URL + url
+            self.resource = AsyncResource(url, session)
+        else:
+            self.resource = url
+        self.name = name
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.name)
+
+    async def contains(self, id):
+        """Return whether the database contains a document with the specified
+        ID.
+        """
+        try:
+            await _doc_resource(self.resource, id).head()
+            return True
+        except http.ResourceNotFound:
+            return False
+
+    async def info(self):
+        """Return information about the database as a dictionary."""
+        _, _, data = await self.resource.get_json()
+        self.name = data['db_name']
+        return data
+
+    async def get(self, id, default=None, **options):
+        """Return the document with the specified ID, or `default` if no
+        document with the ID was found.
+
+        :rtype: `Document`
+        """
+        try:
+            _, _, data = await _doc_resource(self.resource, id).get_json(
+                **options)
+        except http.ResourceNotFound:
+            return default
+        if hasattr(data, 'items'):
+            return Document(data)
+        else:
+            return data
+
+    async def save(self, doc, **options):
+        """Create a new document or update an existing document.
+
+        :return: (id, rev) tuple of the save document
+        """
+        if '_id' in doc:
+            func = _doc_resource(self.resource, doc['_id']).put_json
+        else:
+            func = self.resource.post_json
+        _, _, data = await func(body=doc, **options)
+        id, rev = data['id'], data.get('rev')
+        doc['_id'] = id
+        if rev is not None: # Not present for batch='ok'
+            doc['_rev'] = rev
+        return id, rev
+
+    async def delete(self, doc):
+        """Delete the given document from the database.
+
+        :raise ResourceConflict: if the document was updated in the database
+        """
+        if doc['_id'] is None:
+            raise ValueError('document ID cannot be None')
+        await _doc_resource(self.resource, doc['_id']).delete_json(
+            rev=doc['_rev'])
+
+    async def update(self, documents, **options):
+        """Perform a bulk update or insertion of the given documents using a
+        single HTTP request.
+
+        :return: a list of ``(success, docid, rev_or_exc)`` tuples, see
+                 `couchdb.client.Database.update()`
+        """
+        docs = []
+        for doc in documents:
+            if isinstance(doc, dict):
+                docs.append(doc)
+            elif hasattr(doc, 'items'):
+                docs.append(dict(doc.items()))
+            else:
+                raise TypeError('expected dict, got %s' % type(doc))
+
+        content = options
+        content.update(docs=docs)
+        _, _, data = await self.resource.post_json('_bulk_docs',
+                                                   body=content)
+
+        results = []
+        for idx, result in enumerate(data):
+            if 'error' in result:
+                if result['error'] == 'conflict':
+                    exc_type = http.ResourceConflict
+                else:
+                    exc_type = http.ServerError
+                results.append((False, result['id'],
+                                exc_type(result['reason'])))
+            else:
+                doc = documents[idx]
+                if isinstance(doc, dict):
+                    doc.update({'_id': result['id'], '_rev': result['rev']})
+                results.append((True, result['id'], result['rev']))
+
+        return results
+
+    def view(self, name, wrapper=None, **options):
+        """Execute a predefined view.
+
+        The returned `AsyncViewResults` object does not make a request until
+        it is iterated over with ``async for`` or its `fetch()` method is
+        awaited.
+
+        :rtype: `AsyncViewResults`
+        """
+        path = _path_from_name(name, '_view')
+        return AsyncViewResults(self.resource(*path), options,
+                                wrapper=wrapper)
+
+    async def _changes(self, **opts):
+        _, _, data = await self.resource.get('_changes', **opts)
+        lines = data.iterchunks()
+        try:
+            async for ln in lines:
+                if not ln: # skip heartbeats
+                    continue
+                doc = json.decode(ln.decode('utf-8'))
+                if 'last_seq' in doc: # consume the rest of the response if
+                    async for ln in lines: # this was the last line, allows
+                        pass               # conn reuse
+                yield doc
+        finally:
+            data.close()
+
+    async def _changes_json(self, **opts):
+        _, _, data = await self.resource.get_json('_changes', **opts)
+        return data
+
+    def changes(self, **opts):
+        """Retrieve a changes feed from the database.
+
+        For ``feed='continuous'``, this returns an asynchronous iterator over
+        change notification dicts to be used with ``async for``; otherwise it
+        returns a coroutine resolving to the decoded response.
+
+        :param opts: optional query string parameters
+        """
+        if opts.get('feed') == 'continuous':
+            return self._changes(**opts)
+        return self._changes_json(**opts)
+
+
+class AsyncViewResults(object):
+    """Asynchronous counterpart of `couchdb.client.ViewResults`.
+
+    The view is requested when iterated over with ``async for``, or when
+    `fetch()` is awaited. The `rows`, `total_rows`, `offset` and `update_seq`
+    properties are `None` until then.
+
+    Unless `fetch()` has been awaited, ``async for`` yields the rows while
+    the response is still being received, without keeping them in memory, so
+    that `rows` remains `None`; every such iteration makes a new request.
+    """
+
+    def __init__(self, resource, options, wrapper=None):
+        self.resource = resource
+        self.options = options
+        self.wrapper = wrapper
+        self._rows = self._total_rows = self._offset = self._update_seq = None
+
+    def __repr__(self):
+        return '<%s %r %r>' % (type(self).__name__, self.resource.url,
+                               self.options)
+
+    def __getitem__(self, key):
+        options = self.options.copy()
+        if type(key) is slice:
+            if key.start is not None:
+                options['startkey'] = key.start
+            if key.stop is not None:
+                options['endkey'] = key.stop
+        else:
+            options['key'] = key
+        return AsyncViewResults(self.resource, options, self.wrapper)
+
+    async def __aiter__(self):
+        if self._rows is not None:
+            for row in self._rows:
+                yield row
+            return
+        wrapper = self.wrapper or Row
+        self._total_rows = self._update_seq = None
+        self._offset = 0
+        parser = json._StreamParser('rows')
+        body = await self._request(decode=False)
+        try:
+            async for chunk in body._iterraw():
+                parser.feed(chunk)
+                for row in self._parse(parser):
+                    yield wrapper(row)
+            parser.feed(b'')
+            for row in self._parse(parser):
+                yield wrapper(row)
+        finally:
+            body.close()
+
+    def _parse(self, parser):
+        """Yield the rows the parser has been fed, recording the other
+        members of the response read before them.
+        """
+        while True:
+            item = parser.parse()
+            if item is None or item is json._MORE:
+                return
+            name, value = item
+            if name == 'rows':
+                yield value
+            elif name == 'total_rows':
+                self._total_rows = value
+            elif name == 'offset':
+                self._offset = value
+            elif name == 'update_seq':
+                self._update_seq = value
+
+    async def _request(self, decode=True):
+        options = self.options
+        if decode:
+            post, get = self.resource.post_json, self.resource.get_json
+        else:
+            post, get = self.resource.post, self.resource.get
+        if 'keys' in options:
+            options = options.copy()
+            keys = {'keys': options.pop('keys')}
+            _, _, data = await post(body=keys,
+                                    **_encode_view_options(options))
+        else:
+            _, _, data = await get(**_encode_view_options(options))
+        return data
+
+    async def fetch(self):
+        """Request the view and return this object."""
+        data = await self._request()
+        wrapper = self.wrapper or Row
+        self._rows = [wrapper(row) for row in data['rows']]
+        self._total_rows = data.get('total_rows')
+        self._offset = data.get('offset', 0)
+        self._update_seq = data.get('update_seq')
+        return self
+
+    @property
+    def rows(self):
+        """The list of rows returned by the view."""
+        return self._rows
+
+    @property
+    def total_rows(self):
+        """The total number of rows in this view."""
+        return self._total_rows
+
+    @property
+    def offset(self):
+        """The offset of the results from the first row in the view."""
+        return self._offset
+
+    @property
+    def update_seq(self):
+        """The database update sequence that the view reflects, if requested
+        with the `update_seq=true` query option.
+        """
+        return self._update_seq
+
+
+class AsyncSampler(Sampler):
+    """Asynchronous variant of `couchdb.sampler.Sampler` for an `AsyncServer`.
+
+    `sample()` is a coroutine, and `start()` schedules the sampling as a task
+    on the running event loop, which `stop()` cancels. The methods that read
+    the buffered samples are the same as those of `Sampler`.
+    """
+
+    def __init__(self, server, *args, **kwargs):
+        super(AsyncSampler, self).__init__(server, *args, **kwargs)
+        self._task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop()
+
+    def start(self):
+        """Start sampling in a task on the current event loop."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Cancel the sampling task."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sample()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+            await asyncio.sleep(self.interval)
+
+    async def sample(self):
+        """Take a sample now and add it to the buffer.
+
+        :return: the ``(timestamp, values)`` tuple of the sample
+        """
+        stats = await self.server.stats() if self.stats else None
+        tasks = await self.server.tasks() if self.tasks else None
+        infos = []
+        for name, db in self._databases:
+            infos.append((name, await db.info()))
+        return self._add(stats, tasks, infos)
+
+    def _database(self, name):
+        return self.server[name]
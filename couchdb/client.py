@@ -23,22 +23,40 @@ False
 >>> del server['python-tests']
 """
 
+import array
 import itertools
 import mimetypes
 import os
+import threading
 from types import FunctionType
 from inspect import getsource
 from textwrap import dedent
 import warnings
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from couchdb import http, json, util
 
-__all__ = ['Server', 'Database', 'Document', 'ViewResults', 'Row']
+__all__ = ['Server', 'Database', 'Document', 'BulkWriter', 'BulkResult',
+           'ChangesResults', 'ViewCache', 'ViewResults', 'Row', 'CompactRow']
 __docformat__ = 'restructuredtext en'
 
 
 DEFAULT_BASE_URL = os.environ.get('COUCHDB_URL', 'http://localhost:5984/')
 
+# View options that select the rows to return, which `Database.scanview()`
+# sets for every range itself.
+_RANGE_OPTIONS = ('key', 'keys', 'startkey', 'endkey', 'startkey_docid',
+                  'endkey_docid', 'inclusive_end', 'descending', 'skip',
+                  'limit')
+
 
 class Server(object):
     """Representation of a CouchDB server.
@@ -73,10 +91,16 @@ class Server(object):
         """Initialize the server object.
 
         :param url: the URI of the server (for example
-                    ``http://localhost:5984/``)
+                    ``http://localhost:5984/``), or a list of the URIs of
+                    the nodes of a cluster, which are used through a
+                    `http.ClusterSession` unless a `session` is given
         :param full_commit: turn on the X-Couch-Full-Commit header
         :param session: an http.Session instance or None for a default session
         """
+        if isinstance(url, (list, tuple)):
+            if session is None:
+                session = http.ClusterSession(url)
+            url = url[0]
         if isinstance(url, util.strbase):
             self.resource = http.Resource(url, session or http.Session())
         else:
@@ -279,6 +303,15 @@ class Database(object):
     applicable for Python 2.7.9+):
 
     >>> db.resource.session.disable_ssl_verification()
+
+    The `get()`, `save()`, `delete()`, `update()`, `view()` and `changes()`
+    methods accept a ``request_timeout`` keyword argument with an
+    `http.Timeout` (or a socket timeout in seconds) for that call, which
+    overrides the time limits of the session, for example to give up on a
+    document lookup quickly while a longpoll request may take minutes::
+
+        from couchdb.http import Timeout
+        doc = db.get('JohnDoe', request_timeout=Timeout(total=0.5))
     """
 
     def __init__(self, url, name=None, session=None):
@@ -524,7 +557,7 @@ class Database(object):
         data = json.decode(data.read().decode('utf-8'))
         return data['rev']
 
-    def delete(self, doc):
+    def delete(self, doc, request_timeout=None):
         """Delete the given document from the database.
 
         Use this method in preference over ``__del__`` to ensure you're
@@ -553,7 +586,8 @@ class Database(object):
         """
         if doc['_id'] is None:
             raise ValueError('document ID cannot be None')
-        _doc_resource(self.resource, doc['_id']).delete_json(rev=doc['_rev'])
+        _doc_resource(self.resource, doc['_id']).delete_json(
+            rev=doc['_rev'], request_timeout=request_timeout)
 
     def get(self, id, default=None, **options):
         """Return the document with the specified ID.
@@ -574,6 +608,80 @@ class Database(object):
         else:
             return data
 
+    def get_many(self, ids, batch=500, workers=1, bulk_get=False,
+                 **options):
+        """Return the documents with the specified IDs, fetching them with one
+        request per `batch` of IDs instead of one request per document.
+
+        >>> server = Server()
+        >>> db = server.create('python-tests')
+        >>> db['gotham'] = dict(type='City', name='Gotham City')
+        >>> db['metropolis'] = dict(type='City', name='Metropolis')
+
+        >>> for doc in db.get_many(['metropolis', 'smallville', 'gotham']):
+        ...     print(doc and doc['name'])
+        Metropolis
+        None
+        Gotham City
+
+        >>> del server['python-tests']
+
+        By default, the documents are requested from ``_all_docs`` with the
+        IDs as ``keys`` and ``include_docs=true``. If `bulk_get` is true, the
+        ``_bulk_get`` endpoint of CouchDB 2.x and later is used instead, which
+        accepts options such as ``attachments`` and ``revs`` like `get()`.
+        With `workers` greater than one, that many batches are requested
+        concurrently, each in a separate thread.
+
+        :param ids: a sequence of document IDs
+        :param batch: the maximum number of IDs to request at once
+        :param workers: the maximum number of batches to request concurrently
+        :param bulk_get: whether to use ``_bulk_get`` instead of ``_all_docs``
+        :param options: optional query string parameters
+        :return: a list with a `Document` for every ID in `ids`, in the same
+                 order, or `None` where the document is missing or deleted
+        :rtype: ``list``
+        """
+        if batch < 1:
+            raise ValueError('batch must be 1 or more')
+        ids = list(ids)
+        fetch = self._bulk_get if bulk_get else self._all_docs_get
+        options = _encode_view_options(options)
+        batches = [ids[idx:idx + batch] for idx in range(0, len(ids), batch)]
+        results = _map_threaded(lambda keys: fetch(keys, options), batches,
+                                workers)
+        return list(itertools.chain.from_iterable(results))
+
+    def _all_docs_get(self, ids, options):
+        _, _, data = self.resource.post_json('_all_docs', body={'keys': ids},
+                                             include_docs='true', **options)
+        return [Document(row['doc']) if row.get('doc') else None
+                for row in data['rows']]
+
+    def _bulk_get(self, ids, options):
+        body = {'docs': [{'id': id} for id in ids]}
+        _, _, data = self.resource.post_json('_bulk_get', body=body,
+                                             **options)
+        docs = []
+        for result in data['results']:
+            for item in result['docs']:
+                doc = item.get('ok')
+                if doc is not None and not doc.get('_deleted'):
+                    docs.append(Document(doc))
+                    break
+            else:
+                docs.append(None)
+        return docs
+
+    def bulk_writer(self, **options):
+        """Return a `BulkWriter` that saves the documents written to it to
+        this database in batches.
+
+        :param options: the options of the `BulkWriter`
+        :rtype: `BulkWriter`
+        """
+        return BulkWriter(self, **options)
+
     def revisions(self, id, **options):
         """Return all available revisions of the given document.
 
@@ -691,7 +799,7 @@ class Database(object):
         doc['_rev'] = data['rev']
 
     def query(self, map_fun, reduce_fun=None, language='javascript',
-              wrapper=None, **options):
+              wrapper=None, stream=False, **options):
         """Execute an ad-hoc query (a "temp view") against the database.
 
         >>> server = Server()
@@ -725,13 +833,15 @@ class Database(object):
                          server to use
         :param wrapper: an optional callable that should be used to wrap the
                         result rows
+        :param stream: whether to yield the rows while the response is being
+                       received instead of collecting them in a list
         :param options: optional query string parameters
         :return: the view reults
         :rtype: `ViewResults`
         """
         return TemporaryView(self.resource('_temp_view'), map_fun,
                              reduce_fun, language=language,
-                             wrapper=wrapper)(**options)
+                             wrapper=wrapper)(stream=stream, **options)
 
     def update(self, documents, **options):
         """Perform a bulk update or insertion of the given documents using a
@@ -763,45 +873,130 @@ class Database(object):
         to a dictionary. Effectively this means you can also use this method
         with `mapping.Document` objects.
 
-        :param documents: a sequence of dictionaries or `Document` objects, or
-                          objects providing a ``items()`` method that can be
-                          used to convert them to a dictionary
+        The documents are encoded one at a time while the request body is
+        sent, and the response is decoded while it is received, so `documents`
+        can also be a generator producing more documents than would fit in
+        memory at once. The ``_id`` and ``_rev`` of the dictionaries are only
+        updated if `documents` is a sequence, though, as the documents
+        produced by an iterator are not kept for the response.
+
+        :param documents: a sequence or iterable of dictionaries or `Document`
+                          objects, or objects providing a ``items()`` method
+                          that can be used to convert them to a dictionary
         :return: an iterable over the resulting documents
         :rtype: ``list``
 
         :since: version 0.2
         """
-        docs = []
-        for doc in documents:
-            if isinstance(doc, dict):
-                docs.append(doc)
-            elif hasattr(doc, 'items'):
-                docs.append(dict(doc.items()))
-            else:
-                raise TypeError('expected dict, got %s' % type(doc))
-
-        content = options
-        content.update(docs=docs)
-        _, _, data = self.resource.post_json('_bulk_docs', body=content)
+        if not hasattr(documents, '__getitem__'):
+            sequence = None
+        else:
+            sequence = documents
+        request_timeout = options.pop('request_timeout', None)
+        body = _BulkDocsBody(documents, options)
+        _, _, data = self.resource.post('_bulk_docs', body=body, headers={
+            'Content-Type': 'application/json'
+        }, request_timeout=request_timeout)
 
         results = []
-        for idx, result in enumerate(data):
-            if 'error' in result:
-                if result['error'] == 'conflict':
-                    exc_type = http.ResourceConflict
+        try:
+            for idx, (_, result) in enumerate(json.iterdecode(data)):
+                if 'error' in result:
+                    if result['error'] == 'conflict':
+                        exc_type = http.ResourceConflict
+                    else:
+                        # XXX: Any other error types mappable to exceptions
+                        # here?
+                        exc_type = http.ServerError
+                    results.append((False, result['id'],
+                                    exc_type(result['reason'])))
                 else:
-                    # XXX: Any other error types mappable to exceptions here?
-                    exc_type = http.ServerError
-                results.append((False, result['id'],
-                                exc_type(result['reason'])))
-            else:
-                doc = documents[idx]
-                if isinstance(doc, dict): # XXX: Is this a good idea??
-                    doc.update({'_id': result['id'], '_rev': result['rev']})
-                results.append((True, result['id'], result['rev']))
+                    if sequence is not None:
+                        doc = sequence[idx]
+                        if isinstance(doc, dict): # XXX: Is this a good idea??
+                            doc.update({'_id': result['id'],
+                                        '_rev': result['rev']})
+                    results.append((True, result['id'], result['rev']))
+        finally:
+            data.close()
 
         return results
 
+    def upsert_many(self, docs, merge=None, max_attempts=3, batch=500,
+                    **options):
+        """Create or update the given documents, whether or not they exist
+        in the database yet, using bulk requests.
+
+        >>> server = Server()
+        >>> db = server.create('python-tests')
+        >>> db['gotham'] = dict(type='City', name='Gotham City')
+
+        >>> for result in db.upsert_many([
+        ...     dict(_id='gotham', population=8000000),
+        ...     dict(_id='metropolis', type='City', name='Metropolis')
+        ... ], merge=lambda current, doc: dict(current, **doc)):
+        ...     print(repr(result)) #doctest: +ELLIPSIS
+        (True, u'gotham', u'2-...')
+        (True, u'metropolis', u'1-...')
+        >>> print('%(name)s %(population)d' % db['gotham'])
+        Gotham City 8000000
+
+        >>> del server['python-tests']
+
+        The current revisions of the documents are fetched with `get_many()`
+        and the documents are written with `update()`. Where a document
+        already exists, it is replaced by the result of calling `merge` with
+        the current document and the given one, or by the given document if
+        no `merge` function is provided. Documents that are updated
+        concurrently in the meantime are fetched, merged and written again,
+        for up to `max_attempts` attempts in total.
+
+        The given documents are not modified.
+
+        :param docs: a sequence of dictionaries with an ``_id``
+        :param merge: a function that takes the current and the given
+                      document and returns the document to save
+        :param max_attempts: the maximum number of times a document is
+                             written
+        :param batch: the maximum number of documents to fetch at once
+        :param options: options passed to `update()`
+        :return: a list with a ``(success, docid, rev_or_exc)`` tuple for
+                 every document in `docs`, in the same order, where
+                 ``rev_or_exc`` is a `ResourceConflict` if the document was
+                 still updated concurrently after `max_attempts` attempts
+        :rtype: ``list``
+        """
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be 1 or more')
+        docs = list(docs)
+        for doc in docs:
+            if doc.get('_id') is None:
+                raise ValueError('document ID cannot be None')
+        results = [None] * len(docs)
+        pending = list(range(len(docs)))
+        for attempt in range(max_attempts):
+            currents = self.get_many([docs[idx]['_id'] for idx in pending],
+                                     batch=batch)
+            writes = []
+            for idx, current in zip(pending, currents):
+                doc = docs[idx]
+                if current is None:
+                    new = dict(doc)
+                    new.pop('_rev', None)
+                else:
+                    new = merge(current, doc) if merge else dict(doc)
+                    new = dict(new, _id=current.id, _rev=current.rev)
+                writes.append(new)
+            conflicts = []
+            for idx, result in zip(pending, self.update(writes, **options)):
+                results[idx] = result
+                if isinstance(result[2], http.ResourceConflict):
+                    conflicts.append(idx)
+            pending = conflicts
+            if not pending:
+                break
+        return results
+
     def purge(self, docs):
         """Perform purging (complete removing) of the given documents.
 
@@ -821,7 +1016,7 @@ class Database(object):
         _, _, data = self.resource.post_json('_purge', body=content)
         return data
 
-    def view(self, name, wrapper=None, **options):
+    def view(self, name, wrapper=None, stream=False, **options):
         """Execute a predefined view.
 
         >>> server = Server()
@@ -840,15 +1035,17 @@ class Database(object):
                      slash
         :param wrapper: an optional callable that should be used to wrap the
                         result rows
+        :param stream: whether to yield the rows while the response is being
+                       received instead of collecting them in a list
         :param options: optional query string parameters
         :return: the view results
         :rtype: `ViewResults`
         """
         path = _path_from_name(name, '_view')
         return PermanentView(self.resource(*path), '/'.join(path),
-                             wrapper=wrapper)(**options)
+                             wrapper=wrapper)(stream=stream, **options)
 
-    def iterview(self, name, batch, wrapper=None, **options):
+    def iterview(self, name, batch, wrapper=None, prefetch=0, **options):
         """Iterate the rows in a view, fetching rows in batches and yielding
         one row at a time.
 
@@ -856,6 +1053,10 @@ class Database(object):
         documents added, changed or deleted between requests may be missed or
         repeated.
 
+        If `prefetch` is given, the next batches are fetched in a background
+        thread while the rows of the current one are processed, with up to
+        `prefetch` batches waiting to be yielded.
+
         :param name: the name of the view; for custom views, use the format
                      ``design_docid/viewname``, that is, the document ID of the
                      design document and the name of the view, separated by a
@@ -863,9 +1064,103 @@ class Database(object):
         :param batch: number of rows to fetch per HTTP request.
         :param wrapper: an optional callable that should be used to wrap the
                         result rows
+        :param prefetch: the number of batches to fetch ahead
         :param options: optional query string parameters
         :return: row generator
         """
+        batches = self._iterview_batches(name, batch, wrapper, options)
+        if prefetch > 0:
+            batches = _iter_threaded([batches], 1, True, prefetch)
+        for rows in batches:
+            for row in rows:
+                yield row
+
+    def scanview(self, name, batch, workers=4, splits=None, ordered=True,
+                 wrapper=None, **options):
+        """Iterate the rows in a view like `iterview()`, but split the view
+        into key ranges that are fetched concurrently in separate threads.
+
+        >>> server = Server()
+        >>> db = server.create('python-tests')
+        >>> db.update([dict(_id=str(i)) for i in range(10)]) #doctest: +ELLIPSIS
+        [...]
+        >>> print(' '.join(row.id for row in db.scanview('_all_docs', 2)))
+        0 1 2 3 4 5 6 7 8 9
+
+        >>> del server['python-tests']
+
+        Unless `splits` gives the keys at which the ranges should start, the
+        view is split into `workers` ranges of about the same number of rows,
+        found by requesting the rows at evenly spaced offsets. If `ordered` is
+        true, the rows are yielded in the order of the view, while the
+        following ranges are fetched ahead by up to two batches each.
+        Otherwise, rows are yielded in the order their batches arrive, which
+        keeps all workers busy.
+
+        As with `iterview()`, rows emitted for documents changed during the
+        scan may be missed or repeated.
+
+        :param name: the name of the view, as for `iterview()`
+        :param batch: number of rows to fetch per HTTP request
+        :param workers: number of ranges to fetch concurrently
+        :param splits: an optional sorted sequence of the keys at which to
+                       split the view
+        :param ordered: whether to yield the rows in the order of the view
+        :param wrapper: an optional callable that should be used to wrap the
+                        result rows
+        :param options: optional query string parameters, except those
+                        selecting a range of rows; views with a reduce
+                        function must be scanned with ``reduce=False``
+        :return: row generator
+        """
+        for option in _RANGE_OPTIONS:
+            if option in options:
+                raise ValueError('%s is not supported by scanview' % option)
+        if options.get('reduce'):
+            raise ValueError('scanview cannot scan reduced rows')
+        if workers < 1:
+            raise ValueError('workers must be 1 or more')
+        if splits is None:
+            bounds = self._sample_view(name, workers, options)
+        else:
+            bounds = [(key, None) for key in splits]
+        bounds = [None] + bounds + [None]
+        sources = []
+        for start, end in zip(bounds, bounds[1:]):
+            range_options = dict(options)
+            if start is not None:
+                range_options['startkey'] = start[0]
+                if start[1] is not None:
+                    range_options['startkey_docid'] = start[1]
+            if end is not None:
+                range_options.update(endkey=end[0], inclusive_end=False)
+                if end[1] is not None:
+                    range_options['endkey_docid'] = end[1]
+            sources.append(self._iterview_batches(name, batch, wrapper,
+                                                  range_options))
+        prefetch = 2 if ordered else 2 * workers
+        for rows in _iter_threaded(sources, workers, ordered, prefetch):
+            for row in rows:
+                yield row
+
+    def _sample_view(self, name, count, options):
+        """Return ``(key, docid)`` tuples of the rows splitting the view into
+        `count` ranges of about the same size.
+        """
+        options = dict(options)
+        options.pop('include_docs', None)
+        total = self.view(name, limit=0, **options).total_rows
+        if total is None:
+            # Reduced results have no offsets to sample.
+            raise ValueError('%s must be scanned with reduce=False' % name)
+        offsets = sorted(set(total * idx // count for idx in range(1, count)))
+        def sample(skip):
+            rows = self.view(name, limit=1, skip=skip, **options).rows
+            return (rows[0].key, rows[0].id) if rows else None
+        samples = _map_threaded(sample, offsets, count)
+        return [sample for sample in samples if sample is not None]
+
+    def _iterview_batches(self, name, batch, wrapper, options):
         # Check sane batch size.
         if batch <= 0:
             raise ValueError('batch must be 1 or more')
@@ -881,8 +1176,7 @@ class Database(object):
             rows = list(self.view(name, wrapper, **options))
 
             # Yield rows from this batch.
-            for row in itertools.islice(rows, loop_limit):
-                yield row
+            yield rows[:loop_limit]
 
             # Decrement limit counter.
             if limit is not None:
@@ -961,17 +1255,240 @@ class Database(object):
                     pass
             yield doc
 
-    def changes(self, **opts):
+    def changes(self, stream=False, **opts):
         """Retrieve a changes feed from the database.
 
+        For the continuous feed, an iterator over the change notifications is
+        returned. Otherwise, the response is returned as a dictionary, unless
+        `stream` is true, in which case a `ChangesResults` object is returned
+        that decodes the changes while they are being received, so that long
+        feeds don't need to be held in memory as a whole.
+
+        :param stream: whether to decode the results of a normal or longpoll
+                       feed one at a time
         :param opts: optional query string parameters
         :return: an iterable over change notification dicts
         """
         if opts.get('feed') == 'continuous':
             return self._changes(**opts)
+        if stream:
+            return ChangesResults(self.resource, opts)
         _, _, data = self.resource.get_json('_changes', **opts)
         return data
 
+    def iterchanges(self, batch=1000, since=0, follow=False, **opts):
+        """Iterate the changes of the database, requesting them in batches of
+        `batch` changes, starting after the sequence `since`.
+
+        >>> server = Server()
+        >>> db = server.create('python-tests')
+        >>> db.update([dict(_id=str(i)) for i in range(5)]) #doctest: +ELLIPSIS
+        [...]
+        >>> print(' '.join(change['id'] for change in db.iterchanges(2)))
+        0 1 2 3 4
+
+        >>> del server['python-tests']
+
+        Each batch is requested from the sequence the previous one ended
+        with, and its changes are decoded while the response is being
+        received. Unless `follow` is true, the iteration ends with the first
+        batch that is not full, or after which the server reports no pending
+        changes; otherwise the longpoll feed is used to keep waiting for new
+        changes until the caller stops iterating.
+
+        :param batch: number of changes to request at a time
+        :param since: the sequence to start after
+        :param follow: whether to wait for new changes once all existing ones
+                       have been yielded
+        :param opts: optional query string parameters
+        :return: an iterator over change notification dicts
+        """
+        if batch < 1:
+            raise ValueError('batch must be 1 or more')
+        opts['feed'] = 'longpoll' if follow else 'normal'
+        opts['limit'] = batch
+        while True:
+            count = 0
+            results = ChangesResults(self.resource, dict(opts, since=since))
+            with results:
+                for change in results:
+                    count += 1
+                    since = change['seq']
+                    yield change
+            if results.last_seq is not None:
+                since = results.last_seq
+            if not follow and (count < batch or results.pending == 0):
+                break
+
+
+class _BulkDocsBody(object):
+    """File-like request body for ``_bulk_docs`` that encodes the documents
+    one at a time as the body is read.
+
+    The body can be rewound to be sent again if the documents are a sequence,
+    or if nothing has been read yet. Whether a document without an ``_id``
+    has been encoded is kept in `missing_ids`, which the retry policy uses to
+    decide whether the request may be repeated.
+    """
+
+    def __init__(self, documents, options):
+        head = json.encode(options)[:-1]
+        if options:
+            head += ', '
+        head += '"docs": ['
+        self._head = head.encode('utf-8')
+        self._documents = documents
+        self._sequence = hasattr(documents, '__getitem__')
+        self._reset()
+
+    def _reset(self):
+        self._pieces = itertools.chain([self._head],
+                                       self._encode(self._documents), [b']}'])
+        self._rest = b''
+        self._started = False
+        self.missing_ids = False
+
+    def _encode(self, documents):
+        for idx, doc in enumerate(documents):
+            if isinstance(doc, dict):
+                data = doc
+            elif hasattr(doc, 'items'):
+                data = dict(doc.items())
+            else:
+                raise TypeError('expected dict, got %s' % type(doc))
+            if not data.get('_id'):
+                self.missing_ids = True
+            data = json.encode(data).encode('utf-8')
+            yield b', ' + data if idx else data
+
+    def rewind(self):
+        if not self._started:
+            return True
+        if not self._sequence:
+            return False
+        self._reset()
+        return True
+
+    def read(self, size=-1):
+        self._started = True
+        pieces = [self._rest]
+        length = len(self._rest)
+        while size < 0 or length < size:
+            piece = next(self._pieces, None)
+            if piece is None:
+                break
+            pieces.append(piece)
+            length += len(piece)
+        data = b''.join(pieces)
+        if size < 0:
+            self._rest = b''
+        else:
+            data, self._rest = data[:size], data[size:]
+        return data
+
+
+def _iter_threaded(iterables, workers, ordered, prefetch):
+    """Iterate over the items of the given iterables, which are consumed by up
+    to `workers` threads in the background.
+
+    If `ordered` is true, the items are yielded in order, iterable by
+    iterable, with up to `prefetch` items of every iterable waiting to be
+    yielded. Otherwise, items are yielded as soon as they are available, with
+    up to `prefetch` items waiting in total. An exception raised by an
+    iterable is re-raised when it would be its turn. The threads stop once the
+    generator is closed.
+    """
+    iterables = list(iterables)
+    if ordered:
+        queues = [queue.Queue(prefetch) for _ in iterables]
+    else:
+        queues = [queue.Queue(prefetch)] * len(iterables)
+    pending = iter(enumerate(iterables))
+    lock = threading.Lock()
+    stopped = threading.Event()
+    def put(q, item):
+        while not stopped.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    def work():
+        while True:
+            with lock:
+                try:
+                    idx, iterable = next(pending)
+                except StopIteration:
+                    return
+            try:
+                for item in iterable:
+                    if not put(queues[idx], ('item', item)):
+                        return
+            except Exception as e:
+                put(queues[idx], ('error', e))
+                return
+            if not put(queues[idx], ('done', None)):
+                return
+    threads = [threading.Thread(target=work)
+               for _ in range(min(workers, len(iterables)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        remaining = len(iterables)
+        for q in (queues if ordered else queues[:1]):
+            while remaining:
+                kind, item = q.get()
+                if kind == 'error':
+                    raise item
+                elif kind == 'done':
+                    remaining -= 1
+                    if ordered:
+                        break
+                else:
+                    yield item
+    finally:
+        stopped.set()
+
+
+def _map_threaded(func, items, workers):
+    """Return the list of results of calling `func` on every item, using up
+    to `workers` threads. The first exception raised by a call is re-raised
+    once all threads are done, and no further calls are started after it.
+    """
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    results = [None] * len(items)
+    pending = iter(enumerate(items))
+    lock = threading.Lock()
+    errors = []
+    def work():
+        while True:
+            with lock:
+                if errors:
+                    return
+                try:
+                    idx, item = next(pending)
+                except StopIteration:
+                    return
+            try:
+                results[idx] = func(item)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                return
+    threads = [threading.Thread(target=work)
+               for _ in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
 
 def _doc_resource(base, doc_id):
     """Return the resource for the given document id.
@@ -1023,6 +1540,309 @@ class Document(dict):
         return self.get('_rev')
 
 
+class BulkResult(object):
+    """The pending result of saving a document through a `BulkWriter`."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+
+    def __repr__(self):
+        return '<%s %s>' % (type(self).__name__,
+                            'done' if self.done() else 'pending')
+
+    def done(self):
+        """Return whether the batch holding the document was saved."""
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the document to be saved and return the
+        ``(success, docid, rev_or_exc)`` tuple, as found in the results of
+        `Database.update()`, or `None` if `timeout` seconds pass first.
+        """
+        if not self._event.wait(timeout):
+            return None
+        return self._result
+
+    def _set(self, result):
+        self._result = result
+        self._event.set()
+
+
+class BulkWriter(object):
+    """Saves documents written one at a time in batches through
+    ``_bulk_docs``, using background threads.
+
+    >>> server = Server()
+    >>> db = server.create('python-tests')
+    >>> with db.bulk_writer(max_docs=2) as writer:
+    ...     results = [writer.write({'_id': str(i)}) for i in range(3)]
+    >>> [result.result()[:2] for result in results]
+    [(True, u'0'), (True, u'1'), (True, u'2')]
+
+    >>> del server['python-tests']
+
+    A batch is saved when it holds `max_docs` documents, or `max_bytes`
+    bytes of encoded JSON, or when its first document was written
+    `max_latency` seconds ago. The batches are saved by `workers` threads,
+    and at most `max_pending` batches wait for a thread; once that many are
+    waiting, `write()` blocks until the server catches up.
+
+    The result of every document is available through the `BulkResult`
+    returned by `write()`, and passed to the `callback` if one is given. If a
+    batch cannot be saved at all, the result of each of its documents holds
+    the exception. Exceptions raised by the callback are re-raised by
+    `flush()` or `close()`.
+    """
+
+    def __init__(self, db, max_docs=1000, max_bytes=1024 * 1024,
+                 max_latency=1.0, workers=2, max_pending=None, callback=None,
+                 **options):
+        """Initialize the writer and start its threads.
+
+        :param db: the `Database` to save the documents to
+        :param max_docs: the number of documents to save per batch
+        :param max_bytes: the approximate size of the JSON body of a batch
+                          in bytes
+        :param max_latency: the maximum number of seconds that a document
+                            waits for its batch to fill up
+        :param workers: the number of batches to save concurrently
+        :param max_pending: the number of full batches that may wait for a
+                            worker before `write()` blocks (defaults to
+                            `workers`)
+        :param callback: a function called with each document and its
+                         ``(success, docid, rev_or_exc)`` result, from one of
+                         the worker threads
+        :param options: options passed to `Database.update()`, such as
+                        ``new_edits``
+        """
+        if max_docs < 1:
+            raise ValueError('max_docs must be 1 or more')
+        if workers < 1:
+            raise ValueError('workers must be 1 or more')
+        if max_pending is None:
+            max_pending = workers
+        elif max_pending < 1:
+            raise ValueError('max_pending must be 1 or more')
+        self.db = db
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.callback = callback
+        self.options = options
+        self.closed = False
+        self._lock = threading.Condition()
+        self._batch = []
+        self._bytes = 0
+        self._started = None
+        self._errors = []
+        self._pending = 0 # batches taken but not saved yet
+        self._queue = queue.Queue(max_pending)
+        self._workers = [threading.Thread(target=self._save_batches,
+                                          name='couchdb-bulk-writer')
+                         for _ in range(workers)]
+        self._timer = threading.Thread(target=self._flush_late,
+                                       name='couchdb-bulk-timer')
+        for thread in self._workers + [self._timer]:
+            thread.daemon = True
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, doc):
+        """Add a document to the current batch.
+
+        :param doc: a dictionary or `Document`, or an object providing an
+                    ``items()`` method
+        :return: the pending result of saving the document
+        :rtype: `BulkResult`
+        """
+        if self.closed:
+            raise ValueError('write to closed BulkWriter')
+        if isinstance(doc, dict):
+            data = doc
+        elif hasattr(doc, 'items'):
+            data = dict(doc.items())
+        else:
+            raise TypeError('expected dict, got %s' % type(doc))
+        size = len(json.encode(data)) + 1
+        result = BulkResult()
+        batch = None
+        with self._lock:
+            if not self._batch:
+                self._started = http._clock()
+                self._lock.notify_all()
+            self._batch.append((doc, data.get('_id'), result))
+            self._bytes += size
+            if len(self._batch) >= self.max_docs or \
+                    self._bytes >= self.max_bytes:
+                batch = self._take()
+        if batch:
+            self._queue.put(batch)
+        return result
+
+    def flush(self):
+        """Save the current batch and wait until all batches are saved."""
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._queue.put(batch)
+        with self._lock:
+            while self._pending:
+                self._lock.wait()
+        if self._errors:
+            error = self._errors.pop(0)
+            del self._errors[:]
+            raise error
+
+    def close(self):
+        """Save the remaining documents and stop the threads."""
+        if self.closed:
+            return
+        with self._lock:
+            self.closed = True
+            self._lock.notify_all()
+        # The timer may be about to queue a batch, which has to come before
+        # the workers are told to stop.
+        self._timer.join()
+        try:
+            self.flush()
+        finally:
+            for _ in self._workers:
+                self._queue.put(None)
+            for thread in self._workers:
+                thread.join()
+
+    def _take(self):
+        batch = self._batch
+        if batch:
+            self._pending += 1
+        self._batch = []
+        self._bytes = 0
+        return batch
+
+    def _flush_late(self):
+        with self._lock:
+            while not self.closed:
+                if not self._batch:
+                    self._lock.wait()
+                    continue
+                remaining = self._started + self.max_latency - http._clock()
+                if remaining > 0:
+                    self._lock.wait(remaining)
+                    continue
+                batch = self._take()
+                self._lock.release()
+                try:
+                    self._queue.put(batch)
+                finally:
+                    self._lock.acquire()
+
+    def _save_batches(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            try:
+                self._save(batch)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                    self._lock.notify_all()
+
+    def _save(self, batch):
+        try:
+            results = self.db.update([doc for doc, _, _ in batch],
+                                     **self.options)
+        except Exception as e:
+            results = [(False, docid, e) for _, docid, _ in batch]
+        for (doc, _, result), value in zip(batch, results):
+            result._set(value)
+            if self.callback is not None:
+                try:
+                    self.callback(doc, value)
+                except Exception as e:
+                    self._errors.append(e)
+
+
+class ChangesResults(object):
+    """Representation of a normal or longpoll changes feed response, whose
+    ``results`` are decoded one at a time while the response is being
+    received.
+
+    >>> server = Server()
+    >>> db = server.create('python-tests')
+    >>> db.update([dict(_id='a'), dict(_id='b')]) #doctest: +ELLIPSIS
+    [...]
+    >>> with db.changes(stream=True) as changes:
+    ...     for change in changes:
+    ...         print(change['id'])
+    ...     print(changes.last_seq == change['seq'])
+    a
+    b
+    True
+
+    >>> del server['python-tests']
+
+    The `last_seq` and `pending` properties are `None` until they have been
+    read, which happens after the last change. The connection is returned to
+    the pool once the whole response has been read, or when the results are
+    closed using `close()` or the ``with`` statement. Every iteration after
+    the response was read makes a new request.
+    """
+
+    def __init__(self, resource, options):
+        self.resource = resource
+        self.options = options
+        self.last_seq = self.pending = None
+        self._body = self._items = None
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.options)
+
+    def __iter__(self):
+        if self._items is None:
+            self._open()
+        return self._iterresults()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Finish reading the response, so that its connection can be
+        reused.
+        """
+        body, self._body = self._body, None
+        self._items = None
+        if body is not None:
+            body.close()
+
+    def _open(self):
+        self.last_seq = self.pending = None
+        _, _, self._body = self.resource.get('_changes', **self.options)
+        self._items = json.iterdecode(self._body, 'results')
+
+    def _iterresults(self):
+        items = self._items
+        for name, value in items:
+            if name == 'results':
+                yield value
+            elif name == 'last_seq':
+                self.last_seq = value
+            elif name == 'pending':
+                self.pending = value
+        # Reading the whole response has released the connection.
+        if self._items is items:
+            self._body = self._items = None
+
+
 class View(object):
     """Abstract representation of a view or query."""
 
@@ -1033,15 +1853,29 @@ class View(object):
             self.resource = url
         self.wrapper = wrapper
 
-    def __call__(self, **options):
-        return ViewResults(self, options)
+    def __call__(self, stream=False, **options):
+        return ViewResults(self, options, stream=stream)
 
     def __iter__(self):
         return iter(self())
 
+    def _row_type(self):
+        session = getattr(self.resource, 'session', None)
+        return self.wrapper or getattr(session, 'row_type', None) or Row
+
+    def _view_cache(self):
+        return getattr(getattr(self.resource, 'session', None), 'view_cache',
+                       None)
+
+    def _cache_key(self, options, wrapper):
+        return None
+
     def _exec(self, options):
         raise NotImplementedError
 
+    def _open(self, options):
+        raise NotImplementedError
+
 
 class PermanentView(View):
     """Representation of a permanent view on the server."""
@@ -1057,6 +1891,37 @@ class PermanentView(View):
         _, _, data = _call_viewlike(self.resource, options)
         return data
 
+    def _open(self, options):
+        _, _, data = _call_viewlike(self.resource, options, stream=True)
+        return data
+
+    def _cache_key(self, options, wrapper):
+        if 'keys' in options:
+            return None
+        options = _encode_view_options(options)
+        options.pop('request_timeout', None)
+        # Results requested with and without stale share an entry, so that
+        # the ones stored for stale requests are revalidated by others.
+        options.pop('stale', None)
+        return self.resource.url, wrapper, tuple(sorted(options.items()))
+
+    def _revalidate(self, options, etag):
+        """Request the view unless the results with the given ETag are still
+        current, returning the ETag and the decoded results, or `None` in
+        place of the latter if they are current.
+        """
+        headers = {'If-None-Match': etag} if etag else None
+        status, msg, data = self.resource.get(headers=headers,
+                                              **_encode_view_options(options))
+        # The session returns its own cached response for a 304 if it has
+        # one with the same ETag, so compare the ETags as well as checking
+        # the status.
+        if status == 304 or etag and msg.get('etag') == etag:
+            if data is not None:
+                data.close()
+            return etag, None
+        return msg.get('etag'), json.decode(data.read().decode('utf-8'))
+
 
 class TemporaryView(View):
     """Representation of a temporary view."""
@@ -1079,6 +1944,14 @@ class TemporaryView(View):
                                self.reduce_fun)
 
     def _exec(self, options):
+        _, _, data = self._post(self.resource.post_json, options)
+        return data
+
+    def _open(self, options):
+        _, _, data = self._post(self.resource.post, options)
+        return data
+
+    def _post(self, post, options):
         body = {'map': self.map_fun, 'language': self.language}
         if self.reduce_fun:
             body['reduce'] = self.reduce_fun
@@ -1086,10 +1959,9 @@ class TemporaryView(View):
             options = options.copy()
             body['keys'] = options.pop('keys')
         content = json.encode(body).encode('utf-8')
-        _, _, data = self.resource.post_json(body=content, headers={
+        return post(body=content, headers={
             'Content-Type': 'application/json'
         }, **_encode_view_options(options))
-        return data
 
 
 def _encode_view_options(options):
@@ -1098,6 +1970,9 @@ def _encode_view_options(options):
     """
     retval = {}
     for name, value in options.items():
+        if name == 'request_timeout': # not a view option
+            retval[name] = value
+            continue
         if name in ('key', 'startkey', 'endkey') \
                 or not isinstance(value, util.strbase):
             value = json.encode(value)
@@ -1105,15 +1980,124 @@ def _encode_view_options(options):
     return retval
 
 
-def _call_viewlike(resource, options):
+def _call_viewlike(resource, options, stream=False):
     """Call a resource that takes view-like options.
+
+    Unless `stream` is true, the JSON response body is decoded.
     """
     if 'keys' in options:
         options = options.copy()
         keys = {'keys': options.pop('keys')}
-        return resource.post_json(body=keys, **_encode_view_options(options))
+        post = resource.post if stream else resource.post_json
+        return post(body=keys, **_encode_view_options(options))
     else:
-        return resource.get_json(**_encode_view_options(options))
+        get = resource.get if stream else resource.get_json
+        return get(**_encode_view_options(options))
+
+
+# Values of the ``stale`` view option that allow results from a `ViewCache` to
+# be used without asking the server.
+_STALE_OK = ('ok', 'update_after')
+
+
+class ViewCache(object):
+    """Thread-safe cache of decoded view results, which saves decoding the
+    response and wrapping the rows again when a view hasn't changed.
+
+    Set it as the `view_cache` of an `http.Session` to cache the results of
+    the permanent views requested through that session::
+
+        session = http.Session(view_cache=ViewCache(max_entries=500))
+        db = Database('http://localhost:5984/dashboard', session=session)
+
+    The results are keyed by the URL of the view, its options except for
+    ``stale``, and the row type. Before cached results are used, they are revalidated by sending
+    their ``ETag`` in an ``If-None-Match`` header, as CouchDB changes the
+    ``ETag`` of a view whenever its index is updated. If the view is queried
+    with the ``stale=ok`` or ``stale=update_after`` option, the cached results
+    are used without making a request at all. Views queried with ``keys`` are
+    not cached.
+
+    The cached rows are shared by all results using them, and must not be
+    modified.
+    """
+
+    def __init__(self, max_entries=100):
+        """Initialize the cache.
+
+        :param max_entries: maximum number of cached view results; the least
+                            recently used ones are evicted first
+        """
+        self.max_entries = max_entries
+        self.by_key = {} # cache entries keyed by view and options
+        # Entries are [prev, next, key, etag, results] lists, forming a
+        # circular doubly linked list in order of use, as in `http.Cache`.
+        self.root = root = []
+        root[:] = [root, root, None, None, None]
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def get(self, key):
+        """Return the ``(etag, results)`` tuple stored for the given key, or
+        `None`.
+        """
+        with self.lock:
+            entry = self.by_key.get(key)
+            if entry is None:
+                return None
+            self._unlink(entry)
+            self._link(entry)
+            return entry[3], entry[4]
+
+    def put(self, key, etag, results):
+        """Store the results of a view with the given ETag."""
+        with self.lock:
+            entry = self.by_key.get(key)
+            if entry is not None:
+                self._unlink(entry)
+            self._link([None, None, key, etag, results])
+            while len(self.by_key) > self.max_entries:
+                self._unlink(self.root[1])
+
+    def record(self, hit):
+        """Count a use of cached results, or results that had to be
+        decoded.
+        """
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self):
+        """Remove all cached results."""
+        with self.lock:
+            self.by_key.clear()
+            self.root[:] = [self.root, self.root, None, None, None]
+
+    def stats(self):
+        """Return a dictionary with the ``hits`` and ``misses`` counters, and
+        the current number of ``entries``.
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self.by_key)}
+
+    def _link(self, entry):
+        # Must be called with the lock held.
+        last = self.root[0]
+        entry[0], entry[1] = last, self.root
+        last[1] = self.root[0] = entry
+        self.by_key[entry[2]] = entry
+
+    def _unlink(self, entry):
+        # Must be called with the lock held.
+        prev, next = entry[0], entry[1]
+        prev[1], next[0] = next, prev
+        del self.by_key[entry[2]]
 
 
 class ViewResults(object):
@@ -1158,13 +2142,34 @@ class ViewResults(object):
     >>> list(results[['City', 'Gotham City']])
     [<Row id=u'gotham', key=[u'City', u'Gotham City'], value=u'Gotham City'>]
 
+    With ``stream=True``, the rows are not collected in a list. Instead,
+    iterating yields them while the response is being received, and the
+    `total_rows`, `offset` and `update_seq` properties are available as soon
+    as they have been read, which for the former two is before the rows:
+
+    >>> with db.query(map_fun, stream=True) as results:
+    ...     print(results.total_rows)
+    ...     for row in results:
+    ...         print(row.value)
+    3
+    Gotham City
+    John Doe
+    Mary Jane
+
+    The connection is returned to the pool once all rows have been read, or
+    when the results are closed using `close()` or the ``with`` statement.
+    Every iteration after the rows were read makes a new request.
+
     >>> del server['python-tests']
     """
 
-    def __init__(self, view, options):
+    def __init__(self, view, options, stream=False):
         self.view = view
         self.options = options
+        self.stream = stream
         self._rows = self._total_rows = self._offset = self._update_seq = None
+        self._streamed = False
+        self._body = self._items = self._next_row = None
 
     def __repr__(self):
         return '<%s %r %r>' % (type(self).__name__, self.view, self.options)
@@ -1176,31 +2181,204 @@ class ViewResults(object):
                 options['startkey'] = key.start
             if key.stop is not None:
                 options['endkey'] = key.stop
-            return ViewResults(self.view, options)
+            return ViewResults(self.view, options, stream=self.stream)
         else:
             options['key'] = key
-            return ViewResults(self.view, options)
+            return ViewResults(self.view, options, stream=self.stream)
 
     def __iter__(self):
+        if self.stream:
+            return self._iterstream()
         return iter(self.rows)
 
     def __len__(self):
+        if self.stream:
+            raise TypeError('streamed view results have no len()')
         return len(self.rows)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Finish reading the response of streamed results, so that its
+        connection can be reused.
+        """
+        body, self._body = self._body, None
+        self._items = self._next_row = None
+        if body is not None:
+            body.close()
+
+    def iterrows(self):
+        """Iterate over the rows of the view while the response is still
+        being received, without keeping them in memory.
+
+        Every call makes a new request, and the rows aren't cached for later
+        access via the `rows` property. The `total_rows`, `offset` and
+        `update_seq` properties reflect the part of the response that has
+        been read so far; CouchDB sends the former two before the rows.
+
+        >>> server = Server()
+        >>> db = server.create('python-tests')
+        >>> db.update([dict(_id='a'), dict(_id='b')]) #doctest: +ELLIPSIS
+        [...]
+        >>> results = db.view('_all_docs')
+        >>> for row in results.iterrows():
+        ...     print('%s %d' % (row.id, results.total_rows))
+        a 2
+        b 2
+
+        >>> del server['python-tests']
+
+        :return: an iterator over the rows
+        """
+        self.close()
+        self._open()
+        for row in self._iterstream():
+            yield row
+
+    def to_columns(self, names=('key', 'value'), use_numpy=None):
+        """Return the given members of the rows of the view as columns, which
+        are read straight from the response without creating `Row` objects.
+
+        >>> server = Server()
+        >>> db = server.create('python-tests')
+        >>> db.update([dict(_id='a'), dict(_id='b')]) #doctest: +ELLIPSIS
+        [...]
+        >>> columns = db.view('_all_docs').to_columns(['id', 'key'],
+        ...                                           use_numpy=False)
+        >>> print(columns['id'])
+        [u'a', u'b']
+
+        >>> del server['python-tests']
+
+        A column holding only integers is an ``array.array`` of type ``q``,
+        one holding only numbers of which some are floats is an
+        ``array.array`` of type ``d``, and any other column is a `list`. If
+        NumPy is installed, the columns are returned as NumPy arrays unless
+        `use_numpy` is false, with the ``object`` data type for columns that
+        aren't numeric.
+
+        Like `iterrows()`, every call makes a new request.
+
+        :param names: the names of the row members to return, such as
+                      ``id``, ``key``, ``value`` or ``doc``
+        :param use_numpy: whether to return NumPy arrays, defaulting to
+                          whether NumPy is installed
+        :return: a dictionary of the columns by name
+        :rtype: `dict`
+        """
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and numpy is None:
+            raise ImportError('NumPy is not installed')
+        columns = [(name, _Column()) for name in names]
+        self.close()
+        self._open()
+        while True:
+            row = self._read_row()
+            if row is None:
+                break
+            for name, column in columns:
+                column.append(row.get(name))
+        if use_numpy:
+            return dict((name, column.to_numpy()) for name, column in columns)
+        return dict((name, column.values) for name, column in columns)
+
+    def _open(self):
+        self._streamed = True
+        self._total_rows = self._update_seq = None
+        self._offset = 0
+        self._body = self.view._open(self.options)
+        self._items = json.iterdecode(self._body, 'rows')
+
+    def _read_row(self):
+        """Return the next row of a streamed response, or `None` at its end,
+        recording the other members of the response read before it.
+        """
+        if self._items is None:
+            return None
+        for name, value in self._items:
+            if name == 'rows':
+                return value
+            elif name == 'total_rows':
+                self._total_rows = value
+            elif name == 'offset':
+                self._offset = value
+            elif name == 'update_seq':
+                self._update_seq = value
+        # Reading the whole response has released the connection.
+        self._body = self._items = None
+        return None
+
+    def _iterstream(self):
+        if self._items is None:
+            self._open()
+        wrapper = self.view._row_type()
+        while True:
+            row, self._next_row = self._next_row, None
+            if row is None:
+                row = self._read_row()
+                if row is None:
+                    return
+            yield wrapper(row)
+
+    def _fetch_header(self):
+        if self.stream:
+            if not self._streamed:
+                self._open()
+                self._next_row = self._read_row()
+        elif self._rows is None and not self._streamed:
+            self._fetch()
+
     def _fetch(self):
-        data = self.view._exec(self.options)
-        wrapper = self.view.wrapper or Row
+        wrapper = self.view._row_type()
+        cache = self.view._view_cache()
+        key = None
+        if cache is not None:
+            key = self.view._cache_key(self.options, wrapper)
+        if key is None:
+            data = self.view._exec(self.options)
+            self._set_results(data, wrapper)
+            return
+
+        entry = cache.get(key)
+        if entry is not None and self.options.get('stale') in _STALE_OK:
+            cache.record(hit=True)
+            results = entry[1]
+        else:
+            etag, data = self.view._revalidate(self.options,
+                                               entry and entry[0])
+            cache.record(hit=data is None)
+            if data is not None:
+                results = self._set_results(data, wrapper)
+                if etag:
+                    cache.put(key, etag, results)
+                return
+            results = entry[1]
+        rows, self._total_rows, self._offset, self._update_seq = results
+        self._rows = list(rows)
+
+    def _set_results(self, data, wrapper):
         self._rows = [wrapper(row) for row in data['rows']]
         self._total_rows = data.get('total_rows')
         self._offset = data.get('offset', 0)
         self._update_seq = data.get('update_seq')
+        return (tuple(self._rows), self._total_rows, self._offset,
+                self._update_seq)
 
     @property
     def rows(self):
         """The list of rows returned by the view.
 
+        This property is not available for streamed results.
+
         :rtype: `list`
         """
+        if self.stream:
+            raise TypeError('streamed view results have no list of rows')
         if self._rows is None:
             self._fetch()
         return self._rows
@@ -1213,8 +2391,7 @@ class ViewResults(object):
 
         :rtype: `int` or ``NoneType`` for reduce views
         """
-        if self._rows is None:
-            self._fetch()
+        self._fetch_header()
         return self._total_rows
 
     @property
@@ -1225,8 +2402,7 @@ class ViewResults(object):
 
         :rtype: `int`
         """
-        if self._rows is None:
-            self._fetch()
+        self._fetch_header()
         return self._offset
 
     @property
@@ -1239,11 +2415,51 @@ class ViewResults(object):
 
         :rtype: `int` or `NoneType` depending on the query options
         """
-        if self._rows is None:
-            self._fetch()
+        self._fetch_header()
         return self._update_seq
 
 
+# Integers are stored as 64 bit, where the array module supports it.
+_INT_TYPECODE = 'q' if 'q' in getattr(array, 'typecodes', '') else 'l'
+_NUMBER_TYPES = (int, util.ltype, float)
+
+
+class _Column(object):
+    """A column of view results, which is kept in a typed array for as long
+    as all values are numbers.
+    """
+
+    def __init__(self):
+        self.values = array.array(_INT_TYPECODE)
+
+    def append(self, value):
+        values = self.values
+        if type(values) is array.array:
+            kind = type(value)
+            if kind is float and values.typecode != 'd':
+                values = self.values = array.array('d', values)
+            if kind in _NUMBER_TYPES:
+                try:
+                    values.append(value)
+                    return
+                except OverflowError:
+                    pass
+            values = self.values = list(values)
+        values.append(value)
+
+    def to_numpy(self):
+        if type(self.values) is array.array:
+            if not self.values:
+                return numpy.zeros(0, dtype=self.values.typecode)
+            return numpy.frombuffer(self.values, dtype=self.values.typecode)
+        # Assign the items one by one, so that lists aren't taken as further
+        # dimensions of the array.
+        column = numpy.empty(len(self.values), dtype=object)
+        for idx, value in enumerate(self.values):
+            column[idx] = value
+        return column
+
+
 class Row(dict):
     """Representation of a row as returned by database views."""
 
@@ -1280,3 +2496,58 @@ class Row(dict):
         doc = self.get('doc')
         if doc:
             return Document(doc)
+
+
+class CompactRow(object):
+    """Memory efficient representation of a row as returned by database
+    views, for keeping many rows in memory at once.
+
+    The rows have the same properties as `Row`, but instead of being
+    dictionaries, they only store these properties. Use the class as the
+    `wrapper` of a view, or as the `row_type` of an `http.Session` to use it
+    for all views without a wrapper:
+
+    >>> server = Server()
+    >>> db = server.create('python-tests')
+    >>> db['gotham'] = dict(type='City', name='Gotham City')
+
+    >>> for row in db.view('_all_docs', wrapper=CompactRow):
+    ...     print('%s %s' % (row.id, row['key']))
+    gotham gotham
+
+    >>> del server['python-tests']
+
+    Item access is supported for the names of the properties, so that the
+    rows can be used with `Database.iterview()`.
+    """
+
+    __slots__ = ('id', 'key', 'value', 'error', '_doc')
+
+    def __init__(self, row):
+        self.id = row.get('id')
+        self.key = row.get('key')
+        self.value = row.get('value')
+        self.error = row.get('error')
+        self._doc = row.get('doc')
+
+    def __repr__(self):
+        items = ['%s=%r' % (name, getattr(self, name))
+                 for name in ('id', 'key', 'error', 'value')
+                 if getattr(self, name) is not None]
+        return '<%s %s>' % (type(self).__name__, ', '.join(items))
+
+    def __getitem__(self, name):
+        if name == 'doc':
+            return self._doc
+        elif name in ('id', 'key', 'value', 'error'):
+            return getattr(self, name)
+        raise KeyError(name)
+
+    @property
+    def doc(self):
+        """The associated document for the row. This is only present when the
+        view was accessed with ``include_docs=True`` as a query parameter,
+        otherwise this property will be `None`.
+        """
+        if self._doc:
+            return Document(self._doc)
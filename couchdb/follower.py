@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+
+"""Following the changes feed of a database across connection failures.
+
+>>> from couchdb import Server
+>>> server = Server()
+>>> db = server.create('python-tests')
+>>> db.update([dict(_id='a'), dict(_id='b'), dict(_id='c')]) #doctest: +ELLIPSIS
+[...]
+>>> follower = ChangesFollower(db, batch_size=2)
+>>> for batch in follower:
+...     print([change['id'] for change in batch])
+...     if batch[-1]['id'] == 'c':
+...         follower.stop()
+[u'a', u'b']
+[u'c']
+>>> del server['python-tests']
+
+A `ChangesFollower` reads the continuous changes feed, and hands the changes
+to the caller in batches of up to `batch_size` changes, or fewer if no more
+changes arrive within `batch_timeout` seconds. When the connection fails or
+the server responds with an error, it reconnects from the sequence of the
+last change it received, waiting longer after every consecutive failure.
+
+Once the caller asks for the next batch, the previous one is taken to be
+processed, and its last sequence is saved to the `checkpoint` store, from
+which the follower resumes when it is created again. Checkpoints can be kept
+in a file, in a ``_local`` document of the database, or by any callable::
+
+    follower = ChangesFollower(db, checkpoint=FileCheckpoint('indexer.seq'),
+                               include_docs=True)
+    follower.run(index_documents)
+"""
+
+import errno
+import os
+import random
+import socket
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from http.client import HTTPException
+except ImportError:
+    from httplib import HTTPException
+
+from couchdb import http, json
+
+__all__ = ['ChangesFollower', 'FileCheckpoint', 'LocalCheckpoint']
+__docformat__ = 'restructuredtext en'
+
+_END = object()
+
+
+class ChangesFollower(object):
+    """Iterable over the changes of a database in batches, which reconnects
+    to the continuous feed when needed.
+    """
+
+    def __init__(self, db, since=None, checkpoint=None, batch_size=100,
+                 batch_timeout=1.0, heartbeat=1000, backoff=0.5,
+                 max_backoff=60, **options):
+        """Initialize the follower.
+
+        :param db: the `client.Database` to follow
+        :param since: the sequence to start after, overriding the checkpoint;
+                      without either, the feed is followed from the start
+        :param checkpoint: an object with ``load()`` and ``save(seq)``
+                           methods, such as a `FileCheckpoint` or
+                           `LocalCheckpoint`, or a callable that is called
+                           with each sequence to save
+        :param batch_size: the maximum number of changes per batch
+        :param batch_timeout: the number of seconds to wait for more changes
+                              before yielding an incomplete batch
+        :param heartbeat: the interval of the heartbeats the server sends on
+                          an idle feed, in milliseconds; a connection that is
+                          silent for twice this long is taken to be broken
+        :param backoff: the number of seconds to wait before the first
+                        reconnection attempt, doubling after every failed one
+        :param max_backoff: the maximum number of seconds to wait between
+                            reconnection attempts
+        :param options: further query string parameters of the changes feed,
+                        such as ``filter`` or ``include_docs``, except for
+                        ``feed``
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be 1 or more')
+        for name in ('feed', 'request_timeout'):
+            if name in options:
+                raise ValueError('%s is set by the follower' % name)
+        self.db = db
+        if checkpoint is not None and not hasattr(checkpoint, 'save'):
+            checkpoint = _CallableCheckpoint(checkpoint)
+        self.checkpoint = checkpoint
+        if since is None and checkpoint is not None:
+            since = checkpoint.load()
+        self.since = since if since is not None else 0
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.heartbeat = heartbeat
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.options = options
+        self.failures = 0
+        self.last_error = None
+        self._stopped = threading.Event()
+
+    def __iter__(self):
+        """Yield lists of changes until `stop()` is called.
+
+        The sequence of the last change of a batch is saved to the checkpoint
+        when the next batch is requested.
+        """
+        # The feed is read by a thread, so that an incomplete batch is
+        # yielded on time even when the server is quiet for longer.
+        self._stopped = stopped = threading.Event()
+        closed = threading.Event()
+        changes = queue.Queue(self.batch_size)
+        reader = threading.Thread(target=self._read,
+                                  args=(changes, stopped, closed),
+                                  name='couchdb-changes-follower')
+        reader.daemon = True
+        reader.start()
+        batch = []
+        started = None
+        seq = self.since
+        try:
+            while True:
+                if batch:
+                    timeout = max(started + self.batch_timeout - time.time(),
+                                  0)
+                else:
+                    timeout = self.heartbeat / 1000.0
+                try:
+                    change = changes.get(timeout=timeout)
+                except queue.Empty:
+                    change = None
+                if change is _END:
+                    break
+                elif isinstance(change, Exception):
+                    raise change
+                elif change is not None:
+                    if not batch:
+                        started = time.time()
+                    batch.append(change)
+                    seq = change['seq']
+                if not batch:
+                    continue
+                if len(batch) >= self.batch_size or \
+                        time.time() - started >= self.batch_timeout:
+                    yield batch
+                    batch = []
+                    self._commit(seq)
+                    if stopped.is_set():
+                        return
+            if batch:
+                yield batch
+                self._commit(seq)
+        finally:
+            stopped.set()
+            closed.set()
+
+    def run(self, handler):
+        """Call `handler` with every batch of changes until `stop()` is
+        called.
+        """
+        for batch in self:
+            handler(batch)
+
+    def stop(self):
+        """Stop following the changes after the current batch, or once the
+        next heartbeat or reconnection attempt is due.
+        """
+        self._stopped.set()
+
+    def _commit(self, seq):
+        self.since = seq
+        if self.checkpoint is not None:
+            self.checkpoint.save(seq)
+
+    def _read(self, changes, stopped, closed):
+        """Put the changes of the feed into the `changes` queue, followed by
+        `_END` or the error that ended the feed, until `closed` is set.
+        """
+        def put(item):
+            while not closed.is_set():
+                try:
+                    changes.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+        try:
+            for change in self._follow(stopped):
+                if change is not None:
+                    put(change)
+        except Exception as e:
+            put(e)
+        else:
+            put(_END)
+
+    def _follow(self, stopped):
+        """Yield the changes of the feed, and `None` for every heartbeat or
+        when the feed has been idle for a while, reconnecting as needed, until
+        `stopped` is set.
+        """
+        since = self.since
+        read_timeout = self.heartbeat / 1000.0 * 2
+        while not stopped.is_set():
+            try:
+                _, _, data = self.db.resource.get(
+                    '_changes', feed='continuous', since=since,
+                    heartbeat=self.heartbeat,
+                    request_timeout=http.Timeout(read=read_timeout),
+                    **self.options)
+                for line in data.iterchunks():
+                    self.failures = 0
+                    if not line:
+                        yield None
+                    else:
+                        change = json.decode(line.decode('utf-8'))
+                        if 'last_seq' in change:
+                            # The server ended the feed, so reconnect.
+                            since = change['last_seq']
+                            yield None
+                        else:
+                            since = change['seq']
+                            yield change
+                    if stopped.is_set():
+                        return
+                data = None
+            except (socket.error, ValueError, HTTPException,
+                    http.ServerError) as e:
+                data = None
+                if isinstance(e, http.ServerError) and e.args[0][0] < 500:
+                    raise
+                self.last_error = e
+                self.failures += 1
+                delay = min(self.backoff * 2 ** (self.failures - 1),
+                            self.max_backoff)
+                yield None
+                stopped.wait(delay * random.uniform(0.5, 1))
+
+
+class FileCheckpoint(object):
+    """Checkpoint store keeping the sequence in a file, which is replaced
+    atomically on every save.
+    """
+
+    def __init__(self, path):
+        """Initialize the store.
+
+        :param path: the path of the file
+        """
+        self.path = path
+
+    def load(self):
+        """Return the saved sequence, or `None` if there is none."""
+        try:
+            with open(self.path) as fileobj:
+                return json.decode(fileobj.read())
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+
+    def save(self, seq):
+        """Save the given sequence."""
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp, 'w') as fileobj:
+            fileobj.write(json.encode(seq))
+        getattr(os, 'replace', os.rename)(tmp, self.path)
+
+
+class LocalCheckpoint(object):
+    """Checkpoint store keeping the sequence in a ``_local`` document of a
+    database, which is not replicated.
+    """
+
+    def __init__(self, db, name):
+        """Initialize the store.
+
+        :param db: the `client.Database` to store the document in, usually
+                   the one that is followed
+        :param name: the name of the document, without the ``_local/``
+                     prefix
+        """
+        self.db = db
+        self.id = '_local/' + name
+        self._rev = None
+
+    def load(self):
+        """Return the saved sequence, or `None` if there is none."""
+        doc = self.db.get(self.id)
+        if doc is None:
+            return None
+        self._rev = doc.rev
+        return doc.get('seq')
+
+    def save(self, seq):
+        """Save the given sequence."""
+        doc = {'_id': self.id, 'seq': seq}
+        if self._rev is None:
+            current = self.db.get(self.id)
+            if current is not None:
+                self._rev = current.rev
+        if self._rev is not None:
+            doc['_rev'] = self._rev
+        self._rev = self.db.save(doc)[1]
+
+
+class _CallableCheckpoint(object):
+
+    def __init__(self, save):
+        self.save = save
+
+    def load(self):
+        return None
@@ -12,34 +12,48 @@ standard library.
 """
 
 from base64 import b64encode
-from datetime import datetime
+from email.message import Message
+from email.utils import mktime_tz, parsedate_tz
 import errno
+import io
+import os
+import random
+import select
 import socket
+import stat
 import time
 import sys
 import ssl
+import zlib
 
 try:
-    from threading import Lock
+    from threading import Condition, Lock, local
 except ImportError:
-    from dummy_threading import Lock
+    from dummy_threading import Condition, Lock, local
 
 try:
-    from http.client import BadStatusLine, HTTPConnection, HTTPSConnection
+    import sqlite3
 except ImportError:
-    from httplib import BadStatusLine, HTTPConnection, HTTPSConnection
+    sqlite3 = None
 
 try:
-    from email.Utils import parsedate
+    memoryview
+except NameError: # Python 2.6
+    memoryview = None
+
+try:
+    from http.client import BadStatusLine, HTTPConnection, HTTPSConnection
 except ImportError:
-    from email.utils import parsedate
+    from httplib import BadStatusLine, HTTPConnection, HTTPSConnection
 
 from couchdb import json
 from couchdb import util
 
 __all__ = ['HTTPError', 'PreconditionFailed', 'ResourceNotFound',
            'ResourceConflict', 'ServerError', 'Unauthorized', 'RedirectLimit',
-           'Session', 'Resource']
+           'PoolTimeout', 'RequestTimeout', 'Timeout', 'Session',
+           'ClusterSession', 'Resource', 'Cache', 'SQLiteCache',
+           'RequestHooks', 'RequestInfo', 'RetryPolicy', 'url_template']
 __docformat__ = 'restructuredtext en'
 
 
@@ -114,22 +128,312 @@ class Unauthorized(HTTPError):
     """
 
 
+class RequestTimeout(socket.timeout):
+    """Exception raised when the total time allowed for a request (see
+    `Timeout`) has been used up.
+    """
+
+
 class RedirectLimit(Exception):
     """Exception raised when a request is redirected more often than allowed
     by the maximum number of redirections.
     """
 
 
+class PoolTimeout(Exception):
+    """Exception raised when no connection to a host became available in the
+    connection pool within the configured waiting time.
+    """
+
+
+def http_error(status, error):
+    """Return the exception to raise for the given HTTP error status.
+
+    :param status: the HTTP status code, 400 or higher
+    :param error: the ``(error, reason)`` tuple from a JSON error response,
+                  or the raw response body
+    :rtype: `HTTPError`
+    """
+    if status == 401:
+        return Unauthorized(error)
+    elif status == 404:
+        return ResourceNotFound(error)
+    elif status == 409:
+        return ResourceConflict(error)
+    elif status == 412:
+        return PreconditionFailed(error)
+    else:
+        return ServerError((status, error))
+
+
 CHUNK_SIZE = 1024 * 8
 
+# Default size of the buffer used for sending file-like request bodies
+UPLOAD_CHUNK_SIZE = 1024 * 256
+
+# Space reserved in front of the data of a request body chunk for its size
+# line, which is at most 16 hex digits and CRLF
+_CHUNK_HEADER_SIZE = 18
+
+# Request bodies smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 1024
+
+# Default maximum size of the response bodies that are read completely so that
+# they can be stored in a cache passed to a Session
+CACHE_MAX_BODY_SIZE = 1024 * 1024
+
+
+class DeflateDecoder(object):
+    """Decoder for the ``deflate`` content coding.
+
+    Servers disagree on whether ``deflate`` means zlib-wrapped or raw deflate
+    data, so try the former first and fall back to the latter.
+    """
+
+    def __init__(self):
+        self.first = True
+        self.obj = zlib.decompressobj()
+
+    def decompress(self, data):
+        if not self.first:
+            return self.obj.decompress(data)
+        self.first = False
+        try:
+            return self.obj.decompress(data)
+        except zlib.error:
+            self.obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self.obj.decompress(data)
+
+    def flush(self):
+        return self.obj.flush()
+
+
+def content_decoder(encoding):
+    """Return a decompression object for the given ``Content-Encoding`` header
+    value, or `None` if the content is not encoded in a supported format.
+
+    >>> content_decoder(None)
+    >>> data = zlib.compress(b'foo')
+    >>> decoder = content_decoder('deflate')
+    >>> decoder.decompress(data) + decoder.flush()
+    b'foo'
+    """
+    if encoding:
+        encoding = encoding.strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        return DeflateDecoder()
+
+
+def gzip_compress(data):
+    """Compress the given bytes in gzip format.
+
+    >>> decoder = content_decoder('gzip')
+    >>> decoder.decompress(gzip_compress(b'foo')) + decoder.flush()
+    b'foo'
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decode_content(resp, data):
+    decoder = content_decoder(resp.getheader('content-encoding'))
+    if decoder is None or not data:
+        return data
+    return decoder.decompress(data) + decoder.flush()
+
+
+def _is_regular_file(body):
+    try:
+        return stat.S_ISREG(os.fstat(body.fileno()).st_mode)
+    except (AttributeError, EnvironmentError, ValueError):
+        # Also covers io.UnsupportedOperation for in-memory files.
+        return False
+
+
+def _body_length(body):
+    """Return the number of bytes remaining in a file-like request body, or
+    `None` if it can't be determined without reading the body.
+    """
+    if isinstance(body, io.TextIOBase):
+        # The encoded size of text isn't known in advance.
+        return None
+    if _is_regular_file(body):
+        return max(os.fstat(body.fileno()).st_size - body.tell(), 0)
+    try:
+        if not body.seekable():
+            return None
+        pos = body.tell()
+        body.seek(0, os.SEEK_END)
+        end = body.tell()
+        body.seek(pos)
+    except (AttributeError, EnvironmentError, ValueError):
+        return None
+    return end - pos
+
+
+def _body_position(body):
+    """Return the position of a seekable file-like request body, so that it
+    can be sent again by `_rewind_body()`, or `None`.
+    """
+    if body is None or isinstance(body, util.strbase) or \
+            hasattr(body, 'rewind'):
+        return None
+    try:
+        if body.seekable():
+            return body.tell()
+    except (AttributeError, EnvironmentError, ValueError):
+        pass
+    return None
+
+
+def _rewind_body(body, position):
+    """Prepare a request body to be sent again, returning whether that's
+    possible.
+    """
+    if body is None or isinstance(body, util.strbase):
+        return True
+    rewind = getattr(body, 'rewind', None)
+    if rewind is not None:
+        return rewind()
+    if position is None:
+        return False
+    try:
+        body.seek(position)
+    except (AttributeError, EnvironmentError, ValueError):
+        return False
+    return True
+
+
+class _GzipBody(object):
+    """File-like request body compressing another one in gzip format while
+    it is read.
+    """
+
+    def __init__(self, body, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.position = _body_position(body)
+        self._reset()
+
+    def _reset(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                            16 + zlib.MAX_WBITS)
+        self._rest = b''
+        self._done = self._started = False
+
+    def read(self, size=-1):
+        self._started = True
+        pieces = [self._rest]
+        length = len(self._rest)
+        while not self._done and (size < 0 or length < size):
+            chunk = self.body.read(self.chunk_size)
+            if isinstance(chunk, util.utype):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                piece = self._compressor.compress(chunk)
+            else:
+                piece = self._compressor.flush()
+                self._done = True
+            pieces.append(piece)
+            length += len(piece)
+        data = b''.join(pieces)
+        if size < 0:
+            self._rest = b''
+        else:
+            data, self._rest = data[:size], data[size:]
+        return data
+
+    def rewind(self):
+        if not self._started:
+            return True
+        if not _rewind_body(self.body, self.position):
+            return False
+        self._reset()
+        return True
+
+
+def _send_body(conn, body, length, chunk_size):
+    """Send `length` bytes of a file-like request body, returning the number
+    of bytes sent.
+
+    Regular files are sent by the kernel using ``sendfile()`` where
+    available, other objects are read into a reusable buffer.
+    """
+    sendfile = getattr(conn.sock, 'sendfile', None)
+    if sendfile is not None and _is_regular_file(body):
+        return sendfile(body, body.tell(), length)
+    readinto = getattr(body, 'readinto', None) if memoryview else None
+    if readinto is not None:
+        buf = memoryview(bytearray(min(chunk_size, length)))
+    sent = 0
+    while sent < length:
+        size = min(chunk_size, length - sent)
+        if readinto is not None:
+            n = readinto(buf[:size])
+            chunk = buf[:n or 0]
+        else:
+            chunk = body.read(size)
+            if isinstance(chunk, util.utype):
+                chunk = chunk.encode('utf-8')
+        if not len(chunk):
+            raise ValueError('Request body is shorter than its Content-Length')
+        conn.send(chunk)
+        sent += len(chunk)
+    return sent
+
+
+def _send_chunked(conn, body, chunk_size):
+    """Send a file-like request body of unknown size using the chunked
+    transfer encoding, returning the number of bytes of the body sent.
+    """
+    readinto = getattr(body, 'readinto', None) if memoryview else None
+    if readinto is None:
+        sent = 0
+        while True:
+            chunk = body.read(chunk_size)
+            if not chunk:
+                break
+            if isinstance(chunk, util.utype):
+                chunk = chunk.encode('utf-8')
+            status = ('%x\r\n' % len(chunk)).encode('utf-8')
+            conn.send(status + chunk + b'\r\n')
+            sent += len(chunk)
+        conn.send(b'0\r\n\r\n')
+        return sent
+
+    # Read the data into a buffer with room for the chunk framing around
+    # it, so that every chunk is sent with a single call without copying.
+    buf = memoryview(bytearray(_CHUNK_HEADER_SIZE + chunk_size + 2))
+    start = _CHUNK_HEADER_SIZE
+    sent = 0
+    while True:
+        n = readinto(buf[start:start + chunk_size])
+        if not n:
+            break
+        status = ('%x\r\n' % n).encode('utf-8')
+        buf[start - len(status):start] = status
+        buf[start + n:start + n + 2] = b'\r\n'
+        conn.send(buf[start - len(status):start + n + 2])
+        sent += n
+    conn.send(b'0\r\n\r\n')
+    return sent
+
+
 class ResponseBody(object):
 
-    def __init__(self, resp, conn_pool, url, conn):
+    def __init__(self, resp, conn_pool, url, conn, info=None):
         self.resp = resp
         self.chunked = self.resp.msg.get('transfer-encoding') == 'chunked'
         self.conn_pool = conn_pool
         self.url = url
         self.conn = conn
+        # Compressed content is decoded incrementally, the decoded data that
+        # wasn't returned to the caller yet is kept in the buffer.
+        self.decoder = content_decoder(self.resp.msg.get('content-encoding'))
+        self.buffer = b''
+        self.info = info
 
     def __del__(self):
         if not self.chunked:
@@ -146,10 +450,39 @@ class ResponseBody(object):
                 # when it ends and we can only do blocking reads). Finding
                 # out whether it might in fact end would be relatively onerous
                 # and require a layering violation.
-                self.conn.close()
+                self.conn_pool.discard(self.url, self.conn)
+                self._finish()
+
+    def _received(self, data):
+        if self.info is not None:
+            self.info.bytes_received += len(data)
+
+    def _finish(self):
+        if self.info is not None:
+            self.info.finish()
+            self.info = None
 
     def read(self, size=None):
+        if self.decoder is not None:
+            return self._read_decoded(size)
         bytes = self.resp.read(size)
+        self._received(bytes)
+        if size is None or len(bytes) < size:
+            self.close()
+        return bytes
+
+    def _read_decoded(self, size):
+        while size is None or len(self.buffer) < size:
+            chunk = self.resp.read(CHUNK_SIZE)
+            self._received(chunk)
+            if not chunk:
+                self.buffer += self.decoder.flush()
+                break
+            self.buffer += self.decoder.decompress(chunk)
+        if size is None:
+            bytes, self.buffer = self.buffer, b''
+        else:
+            bytes, self.buffer = self.buffer[:size], self.buffer[size:]
         if size is None or len(bytes) < size:
             self.close()
         return bytes
@@ -157,10 +490,12 @@ class ResponseBody(object):
     def _release_conn(self):
         self.conn_pool.release(self.url, self.conn)
         self.conn_pool, self.url, self.conn = None, None, None
+        self._finish()
 
     def close(self):
         while not self.resp.isclosed():
             chunk = self.resp.read(CHUNK_SIZE)
+            self._received(chunk)
             if not chunk:
                 self.resp.close()
         if self.conn:
@@ -176,13 +511,158 @@ class ResponseBody(object):
                 self.resp.fp.read(2) #crlf
                 self.resp.close()
                 self._release_conn()
+                if self.decoder is not None:
+                    data, self.buffer = self.buffer + self.decoder.flush(), b''
+                    for ln in data.splitlines():
+                        yield ln
                 break
             chunk = self.resp.fp.read(chunksz)
+            self._received(chunk)
+            if self.decoder is not None:
+                # Decoded lines can span several chunks, only yield the
+                # complete ones.
+                chunk = self.buffer + self.decoder.decompress(chunk)
+                chunk, sep, self.buffer = chunk.rpartition(b'\n')
             for ln in chunk.splitlines():
                 yield ln
             self.resp.fp.read(2) #crlf
 
 
+# Timestamps passed to request hooks only make sense relative to each other,
+# so use a clock that isn't affected by system time updates where available.
+_clock = getattr(time, 'monotonic', time.time)
+
+# Placeholders for user supplied path segments, keyed by the (templated)
+# segment preceding them.
+_TEMPLATE_PLACEHOLDERS = {
+    None: '{db}', '{db}': '{docid}', '_local': '{docid}',
+    '_design': '{ddoc}', '{docid}': '{attachment}', '{ddoc}': '{attachment}',
+    '_view': '{view}', '_show': '{func}', '_list': '{func}',
+    '_update': '{func}',
+}
+
+
+def url_template(url):
+    """Return the path of the given URL with database names, document IDs
+    and similar user supplied segments replaced by placeholders, which is
+    suitable for grouping request metrics without creating a separate series
+    per document.
+
+    >>> url_template('http://localhost:5984/_all_dbs')
+    '/_all_dbs'
+    >>> url_template('http://localhost:5984/mydb/doc1?rev=1-abc')
+    '/{db}/{docid}'
+    >>> url_template('http://localhost:5984/mydb/doc1/image.png')
+    '/{db}/{docid}/{attachment}'
+    >>> url_template('http://localhost:5984/mydb/_design/app/_view/by_date')
+    '/{db}/_design/{ddoc}/_view/{view}'
+
+    :param url: the request URL
+    :return: the templated path
+    :rtype: `str`
+    """
+    segments = []
+    for segment in util.urlsplit(url)[2].split('/'):
+        if not segment:
+            continue
+        if not segment.startswith('_'):
+            previous = segments[-1] if segments else None
+            segment = _TEMPLATE_PLACEHOLDERS.get(previous, '{path}')
+        segments.append(segment)
+    return '/' + '/'.join(segments)
+
+
+class RequestInfo(object):
+    """Timing and size information about a single HTTP request, as passed to
+    the methods of `RequestHooks`.
+
+    All timestamps are taken from a monotonic clock where available, so only
+    the differences between them are meaningful. Timestamps for phases that
+    didn't happen (yet) are `None`; `connect_started_at` and `connected_at`
+    are only set when a new connection had to be opened for the request.
+    """
+
+    def __init__(self, method, url, hooks=()):
+        self.method = method
+        self.url = url
+        self.template = url_template(url)
+        self.hooks = hooks
+        self.status = None
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.error = None
+        self.started_at = _clock()
+        self.connect_started_at = None
+        self.connected_at = None
+        self.acquired_at = None
+        self.sent_at = None
+        self.response_at = None
+        self.finished_at = None
+
+    def __repr__(self):
+        return '<%s %r %r %s>' % (type(self).__name__, self.method,
+                                  self.template, self.status)
+
+    @property
+    def duration(self):
+        """Seconds from the start of the request until the response body was
+        completely read or released, or `None` if that didn't happen yet.
+        """
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    @property
+    def ttfb(self):
+        """Seconds from the start of the request until the response headers
+        were received, or `None` if they weren't received (yet).
+        """
+        if self.response_at is None:
+            return None
+        return self.response_at - self.started_at
+
+    def notify(self, event):
+        for hook in self.hooks:
+            getattr(hook, event)(self)
+
+    def finish(self, error=None):
+        if self.finished_at is not None:
+            return
+        self.error = error
+        self.finished_at = _clock()
+        self.notify('request_finished')
+
+
+class RequestHooks(object):
+    """Base class for request lifecycle hooks, which can be passed to a
+    `Session` to collect metrics or traces of the requests it makes. All
+    methods are called with a `RequestInfo` and do nothing by default.
+
+    Hooks are called synchronously on the thread making the request, so they
+    should be cheap. For every request that was started, `request_finished`
+    is called exactly once, including when the request failed with an
+    exception (which is then available as ``info.error``). Requests that
+    follow redirects are reported as separate requests.
+    """
+
+    def request_started(self, info):
+        """Called before a connection is acquired for the request."""
+
+    def connection_acquired(self, info):
+        """Called when a connection was taken from the pool, or opened."""
+
+    def response_started(self, info):
+        """Called when the status line and headers of the response were
+        received.
+        """
+
+    def request_finished(self, info):
+        """Called when the response body was completely read, or released
+        before that, or when the request failed.
+        """
+
+
 RETRYABLE_ERRORS = frozenset([
     errno.EPIPE, errno.ETIMEDOUT,
     errno.ECONNRESET, errno.ECONNREFUSED, errno.ECONNABORTED,
@@ -191,54 +671,434 @@ RETRYABLE_ERRORS = frozenset([
 ])
 
 
+# Methods that can be repeated without changing the result
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS',
+                                'COPY'])
+
+
+class RetryPolicy(object):
+    """Policy for retrying failed requests with exponential backoff.
+
+    A `Session` using a retry policy retries requests that failed with one of
+    the session's retryable socket errors, or with one of the given response
+    `statuses`. By default only requests using an idempotent method are
+    retried, plus requests to ``_bulk_docs`` in which every document has an
+    ``_id``, as saving those again can't create duplicates. A streamed
+    ``_bulk_docs`` body tells whether it has encoded a document without an
+    ``_id`` so far through its ``missing_ids`` attribute. Requests with a
+    file-like body are only retried if the body can be sent again, i.e. if it
+    is seekable, or has a ``rewind()`` method returning whether it could be
+    reset to its start.
+
+    The delay before retry number ``n`` (counting from 0) is picked randomly
+    between 0 and ``min(max_backoff, backoff * 2 ** n)`` ("full jitter"), so
+    that clients that failed at the same time don't retry at the same time.
+    If the response has a ``Retry-After`` header, that delay is used instead,
+    unless it exceeds `max_retry_after`, in which case the request isn't
+    retried.
+
+    To prevent retries from multiplying the load on a server that is already
+    struggling, retries are limited by a budget shared by all requests using
+    the policy: it starts with `budget` tokens, every retry spends one, and
+    every request adds `budget_ratio` tokens up to the initial amount. The
+    default allows bursts of 10 retries, and retrying 10% of requests when
+    failures persist.
+
+    >>> policy = RetryPolicy(backoff=0.5, jitter=False)
+    >>> [policy.next_delay(attempt) for attempt in range(4)]
+    [0.5, 1.0, 2.0, None]
+    >>> policy.next_delay(0, retry_after='7')
+    7.0
+    >>> policy.stats()['retries']
+    4
+    """
+
+    def __init__(self, max_retries=3, backoff=0.1, max_backoff=10,
+                 jitter=True, statuses=(429, 502, 503, 504),
+                 methods=IDEMPOTENT_METHODS,
+                 max_retry_after=60, budget=10, budget_ratio=0.1):
+        """Initialize the retry policy.
+
+        :param max_retries: maximum number of retries per request
+        :param backoff: delay in seconds before the first retry, doubled for
+                        every following retry
+        :param max_backoff: maximum delay in seconds between retries
+        :param jitter: whether to randomize the delays
+        :param statuses: response status codes that are retried
+        :param methods: HTTP methods that are retried
+        :param max_retry_after: maximum number of seconds a ``Retry-After``
+                                header may ask to wait
+        :param budget: number of retries that can be made in a burst, or
+                       `None` for no limit
+        :param budget_ratio: number of retries earned by every request
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(methods)
+        self.max_retry_after = max_retry_after
+        self.budget = budget
+        self.budget_ratio = budget_ratio
+        self.tokens = budget
+        self.lock = Lock()
+        self.requests = self.retries = 0
+        self.status_retries = self.error_retries = 0
+        self.exhausted = self.budget_exhausted = 0
+
+    def is_retryable(self, method, url, body=None):
+        """Return whether a request may be retried.
+
+        >>> policy = RetryPolicy()
+        >>> policy.is_retryable('GET', 'http://localhost:5984/db/doc')
+        True
+        >>> policy.is_retryable('POST', 'http://localhost:5984/db')
+        False
+        >>> policy.is_retryable('POST', 'http://localhost:5984/db/_bulk_docs',
+        ...                     {'docs': [{'_id': 'a'}, {'_id': 'b'}]})
+        True
+        >>> policy.is_retryable('POST', 'http://localhost:5984/db/_bulk_docs',
+        ...                     {'docs': [{'_id': 'a'}, {}]})
+        False
+
+        :param method: the HTTP method
+        :param url: the request URL
+        :param body: the request body, before it's encoded as JSON
+        :rtype: `bool`
+        """
+        if method in self.methods:
+            return True
+        if method != 'POST' or \
+                not util.urlsplit(url)[2].endswith('/_bulk_docs'):
+            return False
+        if isinstance(body, dict) and body.get('docs'):
+            return all(isinstance(doc, dict) and doc.get('_id')
+                       for doc in body['docs'])
+        if hasattr(body, 'read') and hasattr(body, 'missing_ids'):
+            return not body.missing_ids
+        return False
+
+    def next_delay(self, attempt, retry_after=None, status=None):
+        """Return the number of seconds to wait before retrying a request,
+        or `None` if it shouldn't be retried. A returned delay counts as a
+        retry, which is paid for from the budget.
+
+        :param attempt: the number of retries of this request so far
+        :param retry_after: the value of the ``Retry-After`` response header
+        :param status: the response status code, or `None` if the request
+                       failed with a socket error
+        :rtype: `float`
+        """
+        delay = None
+        if retry_after is not None:
+            delay = _parse_retry_after(retry_after)
+            if delay is not None and delay > self.max_retry_after:
+                return None
+        if delay is None:
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+            if self.jitter:
+                delay = random.uniform(0, delay)
+        self.lock.acquire()
+        try:
+            if attempt >= self.max_retries:
+                self.exhausted += 1
+                return None
+            if self.budget is not None:
+                if self.tokens < 1:
+                    self.budget_exhausted += 1
+                    return None
+                self.tokens -= 1
+            self.retries += 1
+            if status is None:
+                self.error_retries += 1
+            else:
+                self.status_retries += 1
+        finally:
+            self.lock.release()
+        return float(delay)
+
+    def request_started(self):
+        """Add to the retry budget for a new request."""
+        self.lock.acquire()
+        try:
+            self.requests += 1
+            if self.budget is not None:
+                self.tokens = min(self.budget, self.tokens + self.budget_ratio)
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        """Return a dictionary of counters: the number of `requests`, the
+        number of `retries` in total and split into `status_retries` and
+        `error_retries` (for socket errors), the number of requests that gave
+        up after `max_retries` (`exhausted`) or because the budget was used
+        up (`budget_exhausted`), and the remaining budget (`tokens`).
+
+        :rtype: `dict`
+        """
+        self.lock.acquire()
+        try:
+            return {
+                'requests': self.requests, 'retries': self.retries,
+                'status_retries': self.status_retries,
+                'error_retries': self.error_retries,
+                'exhausted': self.exhausted,
+                'budget_exhausted': self.budget_exhausted,
+                'tokens': self.tokens,
+            }
+        finally:
+            self.lock.release()
+
+
+def _parse_retry_after(value):
+    """Return the number of seconds to wait according to a ``Retry-After``
+    header, which is either a number of seconds or an HTTP date.
+
+    >>> _parse_retry_after('120')
+    120.0
+    >>> _parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT')
+    0.0
+    >>> _parse_retry_after('soon')
+    """
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(mktime_tz(date) - time.time(), 0.0)
+
+
+class Timeout(object):
+    """Time limits for requests, in seconds, where `None` means no limit.
+
+    `connect` limits establishing a new connection, and `read` limits every
+    single send or receive operation on the connection, i.e. how long the
+    server may stay silent. `total` limits the whole request from its start
+    until the response headers are received and, unless the response body is
+    streamed, the body has been read. That includes waiting for a connection
+    from the pool, retries and redirects; when the time is up, the request is
+    abandoned with a `RequestTimeout`, and no further retries are started.
+    Every connect and read timeout is shortened to the time remaining.
+
+    Where a `Timeout` is accepted, a plain number ``n`` can be given instead,
+    which is the same as ``Timeout(connect=n, read=n)``.
+
+    >>> Timeout(total=10, read=2)
+    Timeout(total=10, connect=None, read=2)
+    """
+
+    def __init__(self, total=None, connect=None, read=None):
+        self.total = total
+        self.connect = connect
+        self.read = read
+
+    def __repr__(self):
+        return '%s(total=%r, connect=%r, read=%r)' % (
+            type(self).__name__, self.total, self.connect, self.read)
+
+    def __eq__(self, other):
+        return isinstance(other, Timeout) and \
+            (self.total, self.connect, self.read) == \
+            (other.total, other.connect, other.read)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def with_defaults(self, defaults):
+        """Return a copy of this `Timeout` in which the limits that aren't
+        set are taken from the `defaults`.
+
+        >>> Timeout(total=10).with_defaults(Timeout(read=2, total=30))
+        Timeout(total=10, connect=None, read=2)
+        """
+        return Timeout(*[value if value is not None else default
+                         for value, default in
+                         zip((self.total, self.connect, self.read),
+                             (defaults.total, defaults.connect,
+                              defaults.read))])
+
+
+def _as_timeout(value):
+    if value is None:
+        return Timeout()
+    if isinstance(value, Timeout):
+        return value
+    return Timeout(connect=value, read=value)
+
+
+class _Deadline(object):
+    """The time limits of a request in progress."""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires_at = None
+        if timeout.total is not None:
+            self.expires_at = _clock() + timeout.total
+
+    def remaining(self):
+        if self.expires_at is None:
+            return None
+        return self.expires_at - _clock()
+
+    def check(self):
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise RequestTimeout('request not completed within %s seconds' %
+                                 self.timeout.total)
+        return remaining
+
+    def allows(self, delay):
+        """Return whether there's time left to retry after `delay`."""
+        remaining = self.remaining()
+        return remaining is None or delay < remaining
+
+    def _limit(self, timeout):
+        remaining = self.check()
+        if remaining is None or timeout is not None and timeout < remaining:
+            return timeout
+        return remaining
+
+    def connect_timeout(self):
+        return self._limit(self.timeout.connect)
+
+    def read_timeout(self):
+        return self._limit(self.timeout.read)
+
+
 class Session(object):
 
     def __init__(self, cache=None, timeout=None, max_redirects=5,
-                 retry_delays=[0], retryable_errors=RETRYABLE_ERRORS):
+                 retry_delays=[0], retryable_errors=RETRYABLE_ERRORS,
+                 max_connections=None, pool_timeout=None, idle_timeout=None,
+                 max_connection_age=None, compression=False,
+                 compress_requests=False, hooks=None,
+                 upload_chunk_size=UPLOAD_CHUNK_SIZE, retry_policy=None,
+                 row_type=None, view_cache=None, cache_max_body_size=None):
         """Initialize an HTTP client session.
 
-        :param cache: an instance with a dict-like interface or None to allow
-                      Session to create a dict for caching.
-        :param timeout: socket timeout in number of seconds, or `None` for no
-                        timeout (the default)
-        :param retry_delays: list of request retry delays.
+        :param cache: a `Cache` instance, which may be shared with other
+                      sessions, or None to let the Session create its own.
+                      For backwards compatibility, a dictionary of cached
+                      responses keyed by URL is also accepted.
+        :param timeout: a `Timeout` with the default time limits for
+                        requests, or a socket timeout in number of seconds,
+                        or `None` for no timeout (the default)
+        :param retry_delays: list of request retry delays, used for requests
+                             that failed with a socket error if no
+                             `retry_policy` is given
+        :param max_connections: maximum number of connections per host, or
+                                `None` for no limit (the default)
+        :param pool_timeout: number of seconds to wait for a connection when
+                             `max_connections` is reached, or `None` to wait
+                             indefinitely (the default)
+        :param idle_timeout: number of seconds after which unused connections
+                             are closed, or `None` to keep them open (the
+                             default)
+        :param max_connection_age: number of seconds after which connections
+                                   are no longer reused, or `None` for no
+                                   limit (the default)
+        :param compression: whether to ask the server for gzip or deflate
+                            compressed responses, which are decompressed
+                            transparently
+        :param compress_requests: whether to gzip JSON request bodies of at
+                                  least `COMPRESS_MIN_SIZE` bytes, such as
+                                  those of bulk requests, and file-like
+                                  bodies with the ``application/json``
+                                  content type and no ``Content-Length``,
+                                  which are compressed while they are sent
+        :param hooks: a list of `RequestHooks` to notify about the progress of
+                      every request, more can be appended to the ``hooks``
+                      attribute later
+        :param upload_chunk_size: the number of bytes to read at a time from
+                                  file-like request bodies that can't be
+                                  sent with ``sendfile()``
+        :param retry_policy: a `RetryPolicy` deciding which requests are
+                             retried after socket errors and error responses,
+                             and how long to wait in between
+        :param row_type: the class used for the rows of view results that are
+                         requested through this session without a `wrapper`,
+                         such as `client.CompactRow`, or `None` for
+                         `client.Row` (the default)
+        :param view_cache: a `client.ViewCache` keeping the decoded results of
+                           the views requested through this session, or
+                           `None` for no such cache (the default)
+        :param cache_max_body_size: the size in bytes up to which the bodies
+                                    of responses with an ``ETag`` are read
+                                    completely so that they can be cached;
+                                    larger ones are streamed and not cached.
+                                    Defaults to `CACHE_MAX_BODY_SIZE` if a
+                                    `cache` is given, and to `CHUNK_SIZE`
+                                    otherwise
         """
         from couchdb import __version__ as VERSION
         self.user_agent = 'CouchDB-Python/%s' % VERSION
-        # XXX We accept a `cache` dict arg, but the ref gets overwritten later
-        # during cache cleanup. Do we remove the cache arg (does using a shared
-        # Session instance cover the same use cases?) or fix the cache cleanup?
-        # For now, let's just assign the dict to the Cache instance to retain
-        # current behaviour.
-        if cache is not None:
-            cache_by_url = cache
+        if cache_max_body_size is None:
+            cache_max_body_size = CHUNK_SIZE if cache is None \
+                else CACHE_MAX_BODY_SIZE
+        self.cache_max_body_size = cache_max_body_size
+        if cache is None:
             cache = Cache()
-            cache.by_url = cache_by_url
-        else:
+        elif not hasattr(cache, 'put'):
+            cache_by_url = cache
             cache = Cache()
+            for url, response in cache_by_url.items():
+                cache.put(url, response)
         self.cache = cache
         self.max_redirects = max_redirects
         self.perm_redirects = {}
 
         self._disable_ssl_verification = False
-        self._timeout = timeout
-        self.connection_pool = ConnectionPool(
-            self._timeout,
-            disable_ssl_verification=self._disable_ssl_verification)
+        self.timeout = _as_timeout(timeout)
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.idle_timeout = idle_timeout
+        self.max_connection_age = max_connection_age
+        self.connection_pool = self._create_connection_pool()
+        self.compression = compression
+        self.compress_requests = compress_requests
+        self.hooks = list(hooks or [])
+        self.upload_chunk_size = upload_chunk_size
 
         self.retry_delays = list(retry_delays) # We don't want this changing on us.
         self.retryable_errors = set(retryable_errors)
+        self.retry_policy = retry_policy
+        self.row_type = row_type
+        self.view_cache = view_cache
 
     def disable_ssl_verification(self):
         """Disable verification of SSL certificates and re-initialize the
         ConnectionPool. Only applicable on Python 2.7.9+ as previous versions
         of Python don't verify SSL certs."""
         self._disable_ssl_verification = True
-        self.connection_pool = ConnectionPool(self._timeout,
-            disable_ssl_verification=self._disable_ssl_verification)
+        self.connection_pool = self._create_connection_pool()
+
+    def _create_connection_pool(self):
+        return ConnectionPool(
+            self.timeout.connect,
+            disable_ssl_verification=self._disable_ssl_verification,
+            max_connections=self.max_connections,
+            pool_timeout=self.pool_timeout,
+            idle_timeout=self.idle_timeout,
+            max_connection_age=self.max_connection_age)
 
     def request(self, method, url, body=None, headers=None, credentials=None,
-                num_redirects=0):
+                num_redirects=0, timeout=None):
+        """Send an HTTP request and return a ``(status, headers, body)``
+        tuple for the response.
+
+        :param timeout: a `Timeout` with time limits for this request, which
+                        override the ones given to the session, or a socket
+                        timeout in number of seconds
+        """
+        if isinstance(timeout, _Deadline):
+            deadline = timeout # redirected request
+        else:
+            deadline = _Deadline(
+                _as_timeout(timeout).with_defaults(self.timeout))
+
         if url in self.perm_redirects:
             url = self.perm_redirects[url]
         method = method.upper()
@@ -247,6 +1107,18 @@ class Session(object):
             headers = {}
         headers.setdefault('Accept', 'application/json')
         headers['User-Agent'] = self.user_agent
+        if self.compression:
+            headers.setdefault('Accept-Encoding', 'gzip, deflate')
+
+        # The retry policy looks at the body as given, as a streamed body
+        # can tell more about its content once it has been read.
+        request_body = body
+        if self.retry_policy is not None:
+            self.retry_policy.request_started()
+
+        def _retryable():
+            return self.retry_policy is not None and \
+                self.retry_policy.is_retryable(method, url, request_body)
 
         cached_resp = None
         if method in ('GET', 'HEAD'):
@@ -254,26 +1126,72 @@ class Session(object):
             if cached_resp is not None:
                 etag = cached_resp[1].get('etag')
                 if etag:
-                    headers['If-None-Match'] = etag
+                    headers.setdefault('If-None-Match', etag)
+                if headers.get('If-None-Match', etag) != etag:
+                    # A 304 refers to the caller's own response.
+                    cached_resp = None
 
         if (body is not None and not isinstance(body, util.strbase) and
                 not hasattr(body, 'read')):
             body = json.encode(body).encode('utf-8')
             headers.setdefault('Content-Type', 'application/json')
+            if self.compress_requests and len(body) >= COMPRESS_MIN_SIZE \
+                    and 'Content-Encoding' not in headers:
+                body = gzip_compress(body)
+                headers['Content-Encoding'] = 'gzip'
+        elif self.compress_requests and hasattr(body, 'read') and \
+                'Content-Encoding' not in headers and \
+                'Content-Length' not in headers and \
+                headers.get('Content-Type') == 'application/json':
+            # A streamed JSON body, such as that of a bulk update
+            body = _GzipBody(body, self.upload_chunk_size)
+            headers['Content-Encoding'] = 'gzip'
+        position = _body_position(body)
 
         if body is None:
             headers.setdefault('Content-Length', '0')
         elif isinstance(body, util.strbase):
             headers.setdefault('Content-Length', str(len(body)))
-        else:
-            headers['Transfer-Encoding'] = 'chunked'
+        elif 'Content-Length' not in headers:
+            length = _body_length(body)
+            if length is None:
+                headers['Transfer-Encoding'] = 'chunked'
+            else:
+                headers['Content-Length'] = str(length)
 
         authorization = basic_auth(credentials)
         if authorization:
             headers['Authorization'] = authorization
 
         path_query = util.urlunsplit(('', '') + util.urlsplit(url)[2:4] + ('',))
-        conn = self.connection_pool.get(url)
+        info = RequestInfo(method, url, self.hooks)
+        info.notify('request_started')
+
+        def _get_connection():
+            while True:
+                try:
+                    return self.connection_pool.get(url, info, deadline)
+                except RequestTimeout:
+                    raise
+                except socket.error as e:
+                    # Nothing was sent yet, so this is safe to retry for any
+                    # request.
+                    if self.retry_policy is None or \
+                            e.args[0] not in self.retryable_errors:
+                        raise
+                    delay = self.retry_policy.next_delay(info.retries)
+                    if delay is None or not deadline.allows(delay):
+                        raise
+                    info.retries += 1
+                    time.sleep(delay)
+
+        try:
+            conn = _get_connection()
+        except:
+            info.finish(sys.exc_info()[1])
+            raise
+        info.acquired_at = _clock()
+        info.notify('connection_acquired')
 
         def _try_request_with_retries(retries):
             while True:
@@ -283,16 +1201,26 @@ class Session(object):
                     ecode = e.args[0]
                     if ecode not in self.retryable_errors:
                         raise
+                    # The body may have been read partially.
+                    if not _rewind_body(body, position):
+                        raise
                     try:
                         delay = next(retries)
                     except StopIteration:
                         # No more retries, raise last socket error.
                         raise e
-                    finally:
-                        time.sleep(delay)
-                        conn.close()
+                    if not deadline.allows(delay):
+                        raise e
+                    time.sleep(delay)
+                    conn.close()
+                    info.retries += 1
+                    info.bytes_sent = 0
 
         def _try_request():
+            if conn.sock is None:
+                conn.timeout = deadline.connect_timeout()
+                conn.connect()
+            conn.sock.settimeout(deadline.read_timeout())
             try:
                 conn.putrequest(method, path_query, skip_accept_encoding=True)
                 for header in headers:
@@ -302,38 +1230,99 @@ class Session(object):
                 else:
                     if isinstance(body, util.strbase):
                         if isinstance(body, util.utype):
-                            conn.endheaders(body.encode('utf-8'))
+                            data = body.encode('utf-8')
                         else:
-                            conn.endheaders(body)
-                    else: # assume a file-like object and send in chunks
+                            data = body
+                        conn.endheaders(data)
+                        info.bytes_sent += len(data)
+                    else: # assume a file-like object
                         conn.endheaders()
-                        while 1:
-                            chunk = body.read(CHUNK_SIZE)
-                            if not chunk:
-                                break
-                            if isinstance(chunk, util.utype):
-                                chunk = chunk.encode('utf-8')
-                            status = ('%x\r\n' % len(chunk)).encode('utf-8')
-                            conn.send(status + chunk + b'\r\n')
-                        conn.send(b'0\r\n\r\n')
+                        if 'Content-Length' in headers:
+                            info.bytes_sent += _send_body(
+                                conn, body, int(headers['Content-Length']),
+                                self.upload_chunk_size)
+                        else:
+                            info.bytes_sent += _send_chunked(
+                                conn, body, self.upload_chunk_size)
+                info.sent_at = _clock()
                 return conn.getresponse()
             except BadStatusLine as e:
                 # httplib raises a BadStatusLine when it cannot read the status
                 # line saying, "Presumably, the server closed the connection
                 # before sending a valid response."
-                # Raise as ECONNRESET to simplify retry logic.
-                if e.line == '' or e.line == "''":
+                # Raise as ECONNRESET to simplify retry logic. Python 2.7.18
+                # puts a message in place of the empty status line.
+                if not e.line or e.line == "''" or \
+                        e.line.startswith('No status line received'):
                     raise socket.error(errno.ECONNRESET)
                 else:
                     raise
 
-        resp = _try_request_with_retries(iter(self.retry_delays))
+        def _policy_delays():
+            while _retryable():
+                delay = self.retry_policy.next_delay(info.retries)
+                if delay is None:
+                    break
+                yield delay
+
+        if self.retry_policy is None:
+            retries = iter(self.retry_delays)
+        else:
+            retries = _policy_delays()
+
+        def _read_body():
+            try:
+                data = resp.read()
+            except:
+                self.connection_pool.discard(url, conn)
+                info.finish(sys.exc_info()[1])
+                raise
+            info.bytes_received += len(data)
+            return data
+
+        while True:
+            try:
+                resp = _try_request_with_retries(retries)
+            except:
+                # The connection is in an unknown state, so don't let it count
+                # against the pool limits any longer.
+                self.connection_pool.discard(url, conn)
+                info.finish(sys.exc_info()[1])
+                raise
+            if self.retry_policy is None or \
+                    resp.status not in self.retry_policy.statuses or \
+                    not _retryable() or not _rewind_body(body, position):
+                break
+            delay = self.retry_policy.next_delay(
+                info.retries, resp.getheader('retry-after'), resp.status)
+            if delay is None or not deadline.allows(delay):
+                break
+            _read_body()
+            self.connection_pool.release(url, conn)
+            info.retries += 1
+            info.bytes_sent = 0
+            time.sleep(delay)
+            try:
+                conn = _get_connection()
+            except:
+                info.finish(sys.exc_info()[1])
+                raise
+
         status = resp.status
+        info.status = status
+        info.response_at = _clock()
+        info.notify('response_started')
 
-        # Handle conditional response
-        if status == 304 and method in ('GET', 'HEAD'):
-            resp.read()
+        def _read_all():
+            data = _read_body()
             self.connection_pool.release(url, conn)
+            info.finish()
+            return data
+
+        # Handle conditional response, unless the caller sent its own
+        # If-None-Match header
+        if status == 304 and cached_resp is not None:
+            _read_all()
             status, msg, data = cached_resp
             if data is not None:
                 data = util.StringIO(data)
@@ -344,8 +1333,7 @@ class Session(object):
         # Handle redirects
         if status == 303 or \
                 method in ('GET', 'HEAD') and status in (301, 302, 307):
-            resp.read()
-            self.connection_pool.release(url, conn)
+            _read_all()
             if num_redirects > self.max_redirects:
                 raise RedirectLimit('Redirection limit exceeded')
             location = resp.getheader('location')
@@ -354,27 +1342,28 @@ class Session(object):
             elif status == 303:
                 method = 'GET'
             return self.request(method, location, body, headers,
-                                num_redirects=num_redirects + 1)
+                                num_redirects=num_redirects + 1,
+                                timeout=deadline)
 
         data = None
         streamed = False
+        length = int(resp.getheader('content-length', sys.maxsize))
 
         # Read the full response for empty responses so that the connection is
         # in good state for the next request
-        if method == 'HEAD' or resp.getheader('content-length') == '0' or \
+        if method == 'HEAD' or length == 0 or \
                 status < 200 or status in (204, 304):
-            resp.read()
-            self.connection_pool.release(url, conn)
+            _read_all()
 
-        # Buffer small non-JSON response bodies
-        elif int(resp.getheader('content-length', sys.maxsize)) < CHUNK_SIZE:
-            data = resp.read()
-            self.connection_pool.release(url, conn)
+        # Buffer small non-JSON response bodies, and those that can be cached
+        elif length < CHUNK_SIZE or method == 'GET' and \
+                'etag' in resp.msg and length <= self.cache_max_body_size:
+            data = _decode_content(resp, _read_all())
 
         # For large or chunked response bodies, do not buffer the full body,
         # and instead return a minimal file-like object
         else:
-            data = ResponseBody(resp, self.connection_pool, url, conn)
+            data = ResponseBody(resp, self.connection_pool, url, conn, info)
             streamed = True
 
         # Handle errors
@@ -384,23 +1373,14 @@ class Session(object):
                 data = json.decode(data.decode('utf-8'))
                 error = data.get('error'), data.get('reason')
             elif method != 'HEAD':
-                error = resp.read()
-                self.connection_pool.release(url, conn)
+                error = _decode_content(resp, _read_all())
             else:
                 error = ''
-            if status == 401:
-                raise Unauthorized(error)
-            elif status == 404:
-                raise ResourceNotFound(error)
-            elif status == 409:
-                raise ResourceConflict(error)
-            elif status == 412:
-                raise PreconditionFailed(error)
-            else:
-                raise ServerError((status, error))
+            raise http_error(status, error)
 
         # Store cachable responses
-        if not streamed and method == 'GET' and 'etag' in resp.msg:
+        if not streamed and method == 'GET' and status == 200 and \
+                'etag' in resp.msg:
             self.cache.put(url, (status, resp.msg, data))
 
         if not streamed and data is not None:
@@ -409,32 +1389,428 @@ class Session(object):
         return status, resp.msg, data
 
 
-def cache_sort(i):
-    return datetime.fromtimestamp(time.mktime(parsedate(i[1][1]['Date'])))
+class ClusterSession(Session):
+    """Session spreading requests over the nodes of a CouchDB cluster.
+
+    Requests for URLs starting with any of the node URLs are sent to the
+    available node with the fewest outstanding requests (or, with
+    ``balance='latency'``, the one that has been responding fastest). The
+    node URLs must differ only in scheme, host and port, so usually a
+    `client.Server` is simply created with a list of node URLs instead of a
+    single one, which creates a `ClusterSession`::
+
+        server = Server(['http://10.0.0.1:5984/', 'http://10.0.0.2:5984/'])
+
+    A node that fails with a socket error `failure_threshold` times in a row
+    is taken out of rotation for `recovery_timeout` seconds, after which a
+    single request is let through to probe whether it has recovered. Requests
+    that failed with a socket error are repeated on another node, provided
+    that they may be retried: requests using an idempotent method, or those
+    the session's `RetryPolicy` considers retryable. If all nodes are down,
+    requests are still sent to the one that failed longest ago rather than
+    failing without trying.
+    """
+
+    def __init__(self, nodes, balance='outstanding', failure_threshold=3,
+                 recovery_timeout=30, **options):
+        """Initialize the session.
+
+        :param nodes: list of the base URLs of the nodes
+        :param balance: ``'outstanding'`` to prefer the node with the fewest
+                        requests in progress, or ``'latency'`` to prefer the
+                        node with the lowest average response time
+        :param failure_threshold: number of consecutive socket errors after
+                                  which a node is considered down
+        :param recovery_timeout: number of seconds after which a node that is
+                                 down is tried again
+        :param options: other arguments for `Session`
+        """
+        if not nodes:
+            raise ValueError('at least one node URL is required')
+        if balance not in ('outstanding', 'latency'):
+            raise ValueError('unknown balancing strategy %r' % balance)
+        Session.__init__(self, **options)
+        self.nodes = [_Node(extract_credentials(url)[0]) for url in nodes]
+        self.balance = balance
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.lock = Lock()
+
+    def request(self, method, url, body=None, headers=None, credentials=None,
+                num_redirects=0, timeout=None):
+        path = None
+        for node in self.nodes:
+            if url == node.url or url.startswith(node.url + '/'):
+                path = url[len(node.url):]
+                break
+        if path is None:
+            return Session.request(self, method, url, body, headers,
+                                   credentials, num_redirects, timeout)
+
+        if not isinstance(timeout, _Deadline):
+            # All attempts share the time limits.
+            timeout = _Deadline(
+                _as_timeout(timeout).with_defaults(self.timeout))
+        position = _body_position(body)
+
+        def _can_failover():
+            if self.retry_policy is not None:
+                failover = self.retry_policy.is_retryable(method, url, body)
+            else:
+                failover = method.upper() in IDEMPOTENT_METHODS
+            return failover and _rewind_body(body, position)
+
+        tried = set()
+        while True:
+            node = self._choose(tried)
+            tried.add(node)
+            start = _clock()
+            try:
+                # Headers are modified by the request, e.g. for caching.
+                result = Session.request(
+                    self, method, node.url + path, body, dict(headers or {}),
+                    credentials, num_redirects, timeout)
+            except RequestTimeout:
+                self._finished(node, start, failed=False)
+                raise
+            except socket.error:
+                self._finished(node, start, failed=True)
+                if len(tried) == len(self.nodes) or not _can_failover():
+                    raise
+                continue
+            except:
+                # HTTP errors mean that the node is working.
+                self._finished(node, start, failed=False)
+                raise
+            self._finished(node, start, failed=False)
+            return result
+
+    def _choose(self, tried):
+        now = _clock()
+        self.lock.acquire()
+        try:
+            candidates = [node for node in self.nodes if node not in tried]
+            available = [node for node in candidates if
+                         node.down_since is None or not node.probing and
+                         now - node.down_since >= self.recovery_timeout]
+            if available:
+                if self.balance == 'latency':
+                    node = min(available, key=lambda node: (
+                        node.latency or 0, node.outstanding))
+                else:
+                    node = min(available, key=lambda node: (
+                        node.outstanding, node.latency or 0))
+            else:
+                node = min(candidates, key=lambda node: node.down_since)
+            if node.down_since is not None:
+                node.probing = True
+            node.outstanding += 1
+            node.requests += 1
+            return node
+        finally:
+            self.lock.release()
+
+    def _finished(self, node, start, failed):
+        now = _clock()
+        self.lock.acquire()
+        try:
+            node.outstanding -= 1
+            if failed:
+                node.errors += 1
+                node.failures += 1
+                if node.probing or node.failures >= self.failure_threshold:
+                    node.down_since = now
+                node.probing = False
+                return
+            elapsed = now - start
+            if node.latency is None:
+                node.latency = elapsed
+            else:
+                node.latency += (elapsed - node.latency) * _Node.LATENCY_WEIGHT
+            node.failures = 0
+            node.down_since = None
+            node.probing = False
+        finally:
+            self.lock.release()
+
+    def node_stats(self):
+        """Return a list of dictionaries describing the state of every node:
+        its `url`, whether it's `up`, the number of `outstanding` requests,
+        the moving average of the response time in seconds (`latency`), and
+        the number of `requests` and socket `errors`.
+
+        :rtype: `list`
+        """
+        self.lock.acquire()
+        try:
+            return [{'url': node.url, 'up': node.down_since is None,
+                     'outstanding': node.outstanding,
+                     'latency': node.latency, 'requests': node.requests,
+                     'errors': node.errors}
+                    for node in self.nodes]
+        finally:
+            self.lock.release()
+
+
+class _Node(object):
+
+    # Weight of a new response time in the moving average
+    LATENCY_WEIGHT = 0.2
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.outstanding = self.requests = self.errors = 0
+        self.latency = None
+        self.failures = 0
+        self.down_since = None
+        self.probing = False
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.url)
+
 
 class Cache(object):
-    """Content cache."""
+    """Thread-safe cache of responses, keyed by URL.
+
+    When the cache holds more than `max_entries` responses, or more than
+    `max_bytes` bytes of response headers and bodies, the least recently used
+    responses are evicted one at a time. Responses that were stored more than
+    `ttl` seconds ago are treated as missing. A single instance can be shared
+    between `Session` objects.
+
+    >>> cache = Cache(max_entries=2)
+    >>> cache.put('a', (200, {}, b'a'))
+    >>> cache.put('b', (200, {}, b'b'))
+    >>> cache.get('a')
+    (200, {}, b'a')
+    >>> cache.put('c', (200, {}, b'c'))
+    >>> cache.get('b')
+    >>> sorted(cache.stats().items())
+    [('bytes', 2), ('entries', 2), ('evictions', 1), ('hits', 1), ('misses', 1)]
+    """
 
-    # Some random values to limit memory use
-    keep_size, max_size = 10, 75
+    def __init__(self, max_entries=75, max_bytes=None, ttl=None):
+        """Initialize the cache.
 
-    def __init__(self):
-        self.by_url = {}
+        :param max_entries: maximum number of cached responses, or `None` for
+                            no limit
+        :param max_bytes: maximum total size of cached responses in bytes, or
+                          `None` for no limit (the default)
+        :param ttl: number of seconds responses are kept for, or `None` to
+                    keep them until they are evicted (the default)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.by_url = {} # cache entries keyed by URL
+        # Entries are [prev, next, url, response, size, stored_at] lists,
+        # forming a circular doubly linked list in order of use. The root
+        # entry's next is the least and its prev the most recently used.
+        self.root = root = []
+        root[:] = [root, root, None, None, 0, None]
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.by_url)
 
     def get(self, url):
-        return self.by_url.get(url)
+        self.lock.acquire()
+        try:
+            entry = self.by_url.get(url)
+            if entry is not None and self.ttl is not None and \
+                    time.time() - entry[5] >= self.ttl:
+                self._unlink(entry)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._unlink(entry)
+            self._link(entry)
+            return entry[3]
+        finally:
+            self.lock.release()
 
     def put(self, url, response):
-        self.by_url[url] = response
-        if len(self.by_url) > self.max_size:
-            self._clean()
+        size = _response_size(response)
+        self.lock.acquire()
+        try:
+            entry = self.by_url.get(url)
+            if entry is not None:
+                self._unlink(entry)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._link([None, None, url, response, size, time.time()])
+            while self.max_entries is not None and \
+                    len(self.by_url) > self.max_entries or \
+                    self.max_bytes is not None and self.size > self.max_bytes:
+                self._unlink(self.root[1])
+                self.evictions += 1
+        finally:
+            self.lock.release()
 
     def remove(self, url):
-        self.by_url.pop(url, None)
+        self.lock.acquire()
+        try:
+            entry = self.by_url.get(url)
+            if entry is not None:
+                self._unlink(entry)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """Remove all cached responses."""
+        self.lock.acquire()
+        try:
+            self.by_url.clear()
+            self.root[:2] = [self.root, self.root]
+            self.size = 0
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        """Return a dictionary with the ``hits``, ``misses`` and ``evictions``
+        counters, and the current number of ``entries`` and their size in
+        ``bytes``.
+        """
+        self.lock.acquire()
+        try:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self.by_url), 'bytes': self.size}
+        finally:
+            self.lock.release()
 
-    def _clean(self):
-        ls = sorted(self.by_url.items(), key=cache_sort)
-        self.by_url = dict(ls[-self.keep_size:])
+    def _link(self, entry):
+        # Must be called with the lock held.
+        last = self.root[0]
+        entry[0], entry[1] = last, self.root
+        last[1] = self.root[0] = entry
+        self.by_url[entry[2]] = entry
+        self.size += entry[4]
+
+    def _unlink(self, entry):
+        # Must be called with the lock held.
+        prev, next = entry[0], entry[1]
+        prev[1], next[0] = next, prev
+        del self.by_url[entry[2]]
+        self.size -= entry[4]
+
+
+def _response_size(response):
+    status, msg, data = response
+    size = len(data or b'')
+    if msg:
+        for name, value in msg.items():
+            size += len(name) + len(value)
+    return size
+
+
+class SQLiteCache(object):
+    """Cache of responses stored in an SQLite database on local disk.
+
+    As the database file can be opened by several processes at once, this
+    lets e.g. the workers of a pre-forking web server share cached responses,
+    and keep them across restarts, so that they can be revalidated with
+    ``If-None-Match`` instead of being downloaded again::
+
+        session = Session(cache=SQLiteCache('/var/cache/myapp/couchdb.db'))
+
+    When the cache holds more than `max_entries` responses, the ones that
+    were stored first are removed. Responses that were stored more than `ttl`
+    seconds ago are treated as missing.
+    """
+
+    def __init__(self, path, max_entries=None, ttl=None, timeout=5.0):
+        """Initialize the cache, creating the database file if needed.
+
+        :param path: the path of the database file
+        :param max_entries: maximum number of cached responses, or `None` for
+                            no limit (the default)
+        :param ttl: number of seconds responses are kept for, or `None` for
+                    no limit (the default)
+        :param timeout: number of seconds to wait for other processes to
+                        release a lock on the database
+        """
+        if sqlite3 is None:
+            raise ImportError('the sqlite3 module is required for SQLiteCache')
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.timeout = timeout
+        self.hits = self.misses = 0
+        # SQLite connections must be used by a single thread only, and not be
+        # inherited by forked processes.
+        self.local = local()
+        db = self._db()
+        db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                   'url TEXT PRIMARY KEY, status INTEGER, headers TEXT, '
+                   'body BLOB, stored_at REAL)')
+        db.execute('CREATE INDEX IF NOT EXISTS responses_stored_at '
+                   'ON responses (stored_at)')
+        db.commit()
+
+    def _db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None or self.local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.timeout)
+            db.execute('PRAGMA journal_mode=WAL')
+            self.local.db, self.local.pid = db, os.getpid()
+        return db
+
+    def get(self, url):
+        row = self._db().execute(
+            'SELECT status, headers, body, stored_at FROM responses '
+            'WHERE url = ?', (url,)).fetchone()
+        if row is None or self.ttl is not None and \
+                time.time() - row[3] >= self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        status, headers, body = row[:3]
+        msg = Message()
+        for name, value in json.decode(headers):
+            msg[name] = value
+        if body is not None:
+            body = util.btype(body)
+        return status, msg, body
+
+    def put(self, url, response):
+        status, msg, data = response
+        headers = json.encode(list(msg.items()))
+        if data is not None:
+            data = sqlite3.Binary(data)
+        db = self._db()
+        db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                   (url, status, headers, data, time.time()))
+        if self.max_entries is not None:
+            count = db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            if count > self.max_entries:
+                db.execute('DELETE FROM responses WHERE url IN (SELECT url '
+                           'FROM responses ORDER BY stored_at LIMIT ?)',
+                           (count - self.max_entries,))
+        db.commit()
+
+    def remove(self, url):
+        db = self._db()
+        db.execute('DELETE FROM responses WHERE url = ?', (url,))
+        db.commit()
+
+    def clear(self):
+        """Remove all cached responses."""
+        db = self._db()
+        db.execute('DELETE FROM responses')
+        db.commit()
+
+    def stats(self):
+        """Return a dictionary with the ``hits`` and ``misses`` counters of
+        this instance, and the number of ``entries`` in the database.
+        """
+        count = self._db().execute('SELECT COUNT(*) FROM responses')
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': count.fetchone()[0]}
 
 
 class InsecureHTTPSConnection(HTTPSConnection):
@@ -448,59 +1824,263 @@ class InsecureHTTPSConnection(HTTPSConnection):
 
 
 class ConnectionPool(object):
-    """HTTP connection pool."""
+    """HTTP connection pool.
+
+    Idle connections are kept per ``(scheme, host)`` and reused most recently
+    released first. When `max_connections` is set, no more than that many
+    connections (idle or in use) are opened to a single host, and `get()`
+    blocks until another caller releases one, raising `PoolTimeout` if none
+    became available within `pool_timeout` seconds.
+
+    Connections that have been idle for longer than `idle_timeout` seconds,
+    or that were opened more than `max_connection_age` seconds ago, are closed
+    rather than reused. Before an idle connection is handed out, its socket is
+    polled without blocking; if it is readable, the server has closed it (or
+    sent unsolicited data) while it sat in the pool, so it is dropped as well.
+    """
 
-    def __init__(self, timeout, disable_ssl_verification=False):
+    def __init__(self, timeout, disable_ssl_verification=False,
+                 max_connections=None, pool_timeout=None, idle_timeout=None,
+                 max_connection_age=None):
         self.timeout = timeout
         self.disable_ssl_verification = disable_ssl_verification
-        self.conns = {} # HTTP connections keyed by (scheme, host)
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.idle_timeout = idle_timeout
+        self.max_connection_age = max_connection_age
+        self.conns = {} # idle HTTP connections keyed by (scheme, host)
+        self.in_use = {} # number of checked out connections by (scheme, host)
+        self.checked_out = set()
+        self.released_at = {} # time of last release keyed by idle connection
+        self.connected_at = {} # time of creation keyed by connection
+        self.hits = self.misses = self.waits = self.evictions = 0
+        self.stale = 0
         self.lock = Lock()
+        self.cond = Condition(self.lock)
 
-    def get(self, url):
+    def get(self, url, info=None, deadline=None):
+        key = util.urlsplit(url, 'http', False)[:2]
 
-        scheme, host = util.urlsplit(url, 'http', False)[:2]
-
-        # Try to reuse an existing connection.
+        # Try to reuse an existing connection, or reserve a slot for a new one.
         self.lock.acquire()
         try:
-            conns = self.conns.setdefault((scheme, host), [])
-            if conns:
-                conn = conns.pop(-1)
-            else:
-                conn = None
+            conn = self._checkout(key, deadline)
         finally:
             self.lock.release()
 
         # Create a new connection if nothing was available.
         if conn is None:
-            if scheme == 'http':
-                cls = HTTPConnection
-            elif scheme == 'https':
-                if self.disable_ssl_verification:
-                    cls = InsecureHTTPSConnection
+            if info is not None:
+                info.connect_started_at = _clock()
+            try:
+                if deadline is None:
+                    conn = self._connect(key, self.timeout)
                 else:
-                    cls = HTTPSConnection
-            else:
-                raise ValueError('%s is not a supported scheme' % scheme)
-            conn = cls(host, timeout=self.timeout)
-            conn.connect()
+                    conn = self._connect(key, deadline.connect_timeout())
+            except:
+                self.lock.acquire()
+                try:
+                    self.in_use[key] -= 1
+                    self.cond.notify()
+                finally:
+                    self.lock.release()
+                raise
+            self.lock.acquire()
+            try:
+                self.checked_out.add(conn)
+                self.connected_at[conn] = time.time()
+            finally:
+                self.lock.release()
+            if info is not None:
+                info.connected_at = _clock()
 
         return conn
 
     def release(self, url, conn):
-        scheme, host = util.urlsplit(url, 'http', False)[:2]
+        key = util.urlsplit(url, 'http', False)[:2]
+        self.lock.acquire()
+        try:
+            if conn in self.released_at:
+                return # already back in the pool
+            known = self._checkin(key, conn)
+            conns = self.conns.setdefault(key, [])
+            if self._is_expired(conn) or not known and \
+                    self.max_connections is not None and \
+                    len(conns) + self.in_use.get(key, 0) >= \
+                    self.max_connections:
+                # Too old, or not handed out by this pool and there is no
+                # room left.
+                self.evictions += 1
+                self._close(conn)
+                self.cond.notify()
+                return
+            conns.append(conn)
+            self.released_at[conn] = time.time()
+            self._evict_idle(key)
+            self.cond.notify()
+        finally:
+            self.lock.release()
+
+    def discard(self, url, conn):
+        """Close the given connection instead of returning it to the pool."""
+        key = util.urlsplit(url, 'http', False)[:2]
+        self.lock.acquire()
+        try:
+            if conn in self.released_at:
+                del self.released_at[conn]
+                self.conns[key].remove(conn)
+            self._checkin(key, conn)
+            self.connected_at.pop(conn, None)
+            self.cond.notify()
+        finally:
+            self.lock.release()
+        conn.close()
+
+    def stats(self):
+        """Return a dictionary with the pool counters.
+
+        The ``hits`` and ``misses`` counters track whether `get()` could reuse
+        an idle connection or had to open a new one, ``waits`` counts the
+        calls that had to wait for a connection because `max_connections`
+        was reached, ``evictions`` counts connections that were closed by
+        the pool because of `idle_timeout` or `max_connection_age`, and
+        ``stale`` counts idle connections found to be closed by the server.
+        ``idle`` and ``in_use`` are the current number of connections over
+        all hosts.
+        """
         self.lock.acquire()
         try:
-            self.conns.setdefault((scheme, host), []).append(conn)
+            return {
+                'hits': self.hits, 'misses': self.misses,
+                'waits': self.waits, 'evictions': self.evictions,
+                'stale': self.stale,
+                'idle': sum(len(conns) for conns in self.conns.values()),
+                'in_use': sum(self.in_use.values()),
+            }
         finally:
             self.lock.release()
 
+    def _checkout(self, key, request_deadline=None):
+        # Must be called with the lock held. Returns an idle connection, or
+        # `None` if the caller should open a new connection, which has
+        # already been accounted for.
+        deadline = None
+        waited = False
+        while True:
+            self._evict_idle(key)
+            conns = self.conns.setdefault(key, [])
+            in_use = self.in_use.get(key, 0)
+            if conns:
+                conn = conns.pop(-1)
+                del self.released_at[conn]
+                if self._is_expired(conn):
+                    self.evictions += 1
+                    self._close(conn)
+                    continue
+                if _is_connection_dropped(conn):
+                    self.stale += 1
+                    self._close(conn)
+                    continue
+                self.checked_out.add(conn)
+                self.hits += 1
+                break
+            if self.max_connections is None or in_use < self.max_connections:
+                conn = None
+                self.misses += 1
+                break
+            if not waited:
+                waited = True
+                self.waits += 1
+                if self.pool_timeout is not None:
+                    deadline = time.time() + self.pool_timeout
+            remaining = None
+            if request_deadline is not None:
+                remaining = request_deadline.check()
+            if deadline is not None and \
+                    (remaining is None or deadline - time.time() < remaining):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout('no connection to %s://%s available '
+                                      'within %s seconds' %
+                                      (key + (self.pool_timeout,)))
+            self.cond.wait(remaining)
+        self.in_use[key] = in_use + 1
+        return conn
+
+    def _checkin(self, key, conn):
+        # Must be called with the lock held.
+        if conn not in self.checked_out:
+            return False
+        self.checked_out.remove(conn)
+        self.in_use[key] -= 1
+        return True
+
+    def _evict_idle(self, key):
+        # Must be called with the lock held. Idle connections are ordered by
+        # release time, so expired ones are always at the front of the list.
+        if self.idle_timeout is None:
+            return
+        conns = self.conns.get(key)
+        cutoff = time.time() - self.idle_timeout
+        while conns and self.released_at[conns[0]] <= cutoff:
+            conn = conns.pop(0)
+            del self.released_at[conn]
+            self._close(conn)
+            self.evictions += 1
+
+    def _is_expired(self, conn):
+        # Must be called with the lock held.
+        if self.max_connection_age is None or conn not in self.connected_at:
+            return False
+        age = time.time() - self.connected_at[conn]
+        return age >= self.max_connection_age
+
+    def _close(self, conn):
+        # Must be called with the lock held.
+        self.connected_at.pop(conn, None)
+        conn.close()
+
+    def _connect(self, key, timeout):
+        scheme, host = key
+        if scheme == 'http':
+            cls = HTTPConnection
+        elif scheme == 'https':
+            if self.disable_ssl_verification:
+                cls = InsecureHTTPSConnection
+            else:
+                cls = HTTPSConnection
+        else:
+            raise ValueError('%s is not a supported scheme' % scheme)
+        conn = cls(host, timeout=timeout)
+        conn.connect()
+        return conn
+
     def __del__(self):
         for key, conns in list(self.conns.items()):
             for conn in conns:
                 conn.close()
 
 
+def _is_connection_dropped(conn):
+    """Return whether an idle connection can no longer be used.
+
+    An idle HTTP connection should never have anything to read, so a socket
+    that polls as readable has either been closed by the other end or is out
+    of sync with the protocol.
+    """
+    sock = getattr(conn, 'sock', None)
+    if sock is None:
+        return False # not connected, will reconnect on the next request
+    try:
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            poller.register(sock, select.POLLIN)
+            return bool(poller.poll(0))
+        return bool(select.select([sock], [], [], 0)[0])
+    except (select.error, socket.error, ValueError):
+        return True
+
+
 class Resource(object):
 
     def __init__(self, url, session, headers=None):
@@ -518,37 +2098,51 @@ class Resource(object):
         obj.headers = self.headers.copy()
         return obj
 
-    def delete(self, path=None, headers=None, **params):
-        return self._request('DELETE', path, headers=headers, **params)
+    def delete(self, path=None, headers=None, request_timeout=None,
+               **params):
+        return self._request('DELETE', path, headers=headers,
+                             request_timeout=request_timeout, **params)
 
-    def get(self, path=None, headers=None, **params):
-        return self._request('GET', path, headers=headers, **params)
+    def get(self, path=None, headers=None, request_timeout=None, **params):
+        return self._request('GET', path, headers=headers,
+                             request_timeout=request_timeout, **params)
 
-    def head(self, path=None, headers=None, **params):
-        return self._request('HEAD', path, headers=headers, **params)
+    def head(self, path=None, headers=None, request_timeout=None, **params):
+        return self._request('HEAD', path, headers=headers,
+                             request_timeout=request_timeout, **params)
 
-    def post(self, path=None, body=None, headers=None, **params):
+    def post(self, path=None, body=None, headers=None, request_timeout=None,
+             **params):
         return self._request('POST', path, body=body, headers=headers,
-                             **params)
+                             request_timeout=request_timeout, **params)
 
-    def put(self, path=None, body=None, headers=None, **params):
-        return self._request('PUT', path, body=body, headers=headers, **params)
+    def put(self, path=None, body=None, headers=None, request_timeout=None,
+            **params):
+        return self._request('PUT', path, body=body, headers=headers,
+                             request_timeout=request_timeout, **params)
 
-    def delete_json(self, path=None, headers=None, **params):
-        return self._request_json('DELETE', path, headers=headers, **params)
+    def delete_json(self, path=None, headers=None, request_timeout=None,
+                    **params):
+        return self._request_json('DELETE', path, headers=headers,
+                                  request_timeout=request_timeout, **params)
 
-    def get_json(self, path=None, headers=None, **params):
-        return self._request_json('GET', path, headers=headers, **params)
+    def get_json(self, path=None, headers=None, request_timeout=None,
+                 **params):
+        return self._request_json('GET', path, headers=headers,
+                                  request_timeout=request_timeout, **params)
 
-    def post_json(self, path=None, body=None, headers=None, **params):
+    def post_json(self, path=None, body=None, headers=None,
+                  request_timeout=None, **params):
         return self._request_json('POST', path, body=body, headers=headers,
-                                  **params)
+                                  request_timeout=request_timeout, **params)
 
-    def put_json(self, path=None, body=None, headers=None, **params):
+    def put_json(self, path=None, body=None, headers=None,
+                 request_timeout=None, **params):
         return self._request_json('PUT', path, body=body, headers=headers,
-                                  **params)
+                                  request_timeout=request_timeout, **params)
 
-    def _request(self, method, path=None, body=None, headers=None, **params):
+    def _request(self, method, path=None, body=None, headers=None,
+                 request_timeout=None, **params):
         all_headers = self.headers.copy()
         all_headers.update(headers or {})
         if path is not None:
@@ -557,11 +2151,15 @@ class Resource(object):
             url = urljoin(self.url, **params)
         return self.session.request(method, url, body=body,
                                     headers=all_headers,
-                                    credentials=self.credentials)
+                                    credentials=self.credentials,
+                                    timeout=request_timeout)
 
-    def _request_json(self, method, path=None, body=None, headers=None, **params):
+    def _request_json(self, method, path=None, body=None, headers=None,
+                      request_timeout=None, **params):
         status, headers, data = self._request(method, path, body=body,
-                                              headers=headers, **params)
+                                              headers=headers,
+                                              request_timeout=request_timeout,
+                                              **params)
         if 'application/json' in headers.get('content-type', ''):
             data = json.decode(data.read().decode('utf-8'))
         return status, headers, data
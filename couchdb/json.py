@@ -31,9 +31,11 @@ CouchDB-Python to use custom decoding and encoding functions::
 
 """
 
-__all__ = ['decode', 'encode', 'use']
+__all__ = ['decode', 'encode', 'iterdecode', 'use']
 
 from couchdb import util
+import codecs
+import re
 import warnings
 import os
 
@@ -69,6 +71,245 @@ def encode(obj):
     return _encode(obj)
 
 
+def iterdecode(fileobj, array=None, chunk_size=8192):
+    """Incrementally decode the JSON document read from the given file-like
+    object, so that large documents such as view results don't need to be
+    held in memory as a whole.
+
+    If the document is an object, a ``(name, value)`` tuple is yielded for
+    every member as soon as its value has been read, except for the member
+    called `array`, for which a ``(name, item)`` tuple is yielded for every
+    item of its value instead. If the document is an array, its items are
+    yielded as ``(None, item)`` tuples.
+
+    >>> body = util.StringIO(b'{"total_rows": 2, "offset": 0, "rows": ['
+    ...                      b'{"id": "a"}, {"id": "b"}]}')
+    >>> for name, value in iterdecode(body, 'rows', chunk_size=4):
+    ...     print('%s %r' % (name, value))
+    total_rows 2
+    offset 0
+    rows {u'id': u'a'}
+    rows {u'id': u'b'}
+
+    The individual values are decoded using `decode()`, so they are subject
+    to the configured JSON module.
+
+    :param fileobj: a file-like object with a ``read(size)`` method returning
+                    UTF-8 encoded data
+    :param array: the name of the member whose items should be yielded
+                  individually
+    :param chunk_size: the number of bytes to read at a time
+    :return: an iterator over ``(name, value)`` tuples
+    :raise ValueError: if the document is not valid JSON
+    """
+    parser = _StreamParser(array)
+    while True:
+        item = parser.parse()
+        if item is _MORE:
+            parser.feed(fileobj.read(chunk_size))
+        elif item is None:
+            break
+        else:
+            yield item
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING_END = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[ \t\n\r,\]}]')
+_MORE = object()
+
+
+class _StreamParser(object):
+    """Parser for `iterdecode` that is fed the document piece by piece, so
+    that it can also be used where data arrives asynchronously. It finds the
+    extent of JSON values without decoding them, and resumes scanning a value
+    where it stopped when more data is fed; the text of a value spanning
+    several pieces is collected in `parts` and joined once.
+    """
+
+    def __init__(self, array=None):
+        self.array = array
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.state = 'start'
+        self.name = None
+        self.start = None # the start of the value being scanned in buf
+        self.parts = []
+        self.depth = 0
+        self.in_string = self.escaped = self.scalar = False
+
+    def feed(self, chunk):
+        """Add the next piece of the document, or mark its end if `chunk` is
+        empty.
+        """
+        if isinstance(chunk, util.btype):
+            text = self.decoder.decode(chunk, not chunk)
+        else:
+            text = chunk
+        self.eof = not chunk
+        if self.start is not None:
+            self.parts.append(self.buf[self.start:])
+            self.start = 0
+            self.buf = text
+        else:
+            self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+
+    def parse(self):
+        """Return the next ``(name, value)`` tuple, `_MORE` if more data needs
+        to be fed first, or `None` at the end of the document.
+        """
+        while True:
+            state = self.state
+            if self.start is None:
+                char = self.peek()
+                if not char and not self.eof:
+                    return _MORE
+            else:
+                char = None # continue scanning the current value
+
+            if state == 'start':
+                self.state = 'members' if self.expect('{[', char) == '{' \
+                    else 'items'
+            elif state == 'members':
+                if char == '}':
+                    self.pos += 1
+                    self.state = 'end'
+                else:
+                    self.state = 'name'
+            elif state == 'name':
+                if char is not None and char != '"':
+                    raise ValueError('Expected member name in JSON data')
+                name = self.value(char)
+                if name is _MORE:
+                    return _MORE
+                self.name = name
+                self.state = 'colon'
+            elif state == 'colon':
+                self.expect(':', char)
+                self.state = 'value'
+            elif state == 'value':
+                if char == '[' and self.name == self.array:
+                    self.pos += 1
+                    self.state = 'items'
+                    continue
+                value = self.value(char)
+                if value is _MORE:
+                    return _MORE
+                self.state = 'next_member'
+                return self.name, value
+            elif state == 'next_member':
+                self.state = 'name' if self.expect(',}', char) == ',' \
+                    else 'end'
+            elif state == 'items':
+                if char == ']':
+                    self.pos += 1
+                    self.state = 'next_member' if self.name is not None \
+                        else 'end'
+                else:
+                    self.state = 'item'
+            elif state == 'item':
+                value = self.value(char)
+                if value is _MORE:
+                    return _MORE
+                self.state = 'next_item'
+                return self.name, value
+            elif state == 'next_item':
+                if self.expect(',]', char) == ',':
+                    self.state = 'item'
+                else:
+                    self.state = 'next_member' if self.name is not None \
+                        else 'end'
+            elif char:
+                raise ValueError('Extra data after JSON document')
+            else:
+                return None
+
+    def peek(self):
+        """Skip whitespace and return the next character, or an empty string
+        if there is none yet.
+        """
+        self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+        return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars, char):
+        if not char or char not in chars:
+            raise ValueError('Expected %s in JSON data' %
+                             ' or '.join(map(repr, chars)))
+        self.pos += 1
+        return char
+
+    def value(self, char):
+        """Scan the value starting with `char`, or continue scanning the
+        current one if `char` is `None`, and return it decoded, or `_MORE` if
+        its end hasn't been fed yet.
+        """
+        if char is not None:
+            if not char:
+                raise ValueError('Unexpected end of JSON data')
+            self.start = self.pos
+            self.depth = 0
+            self.in_string = self.escaped = False
+            self.scalar = char not in '{["'
+        if not self.scan():
+            if self.eof:
+                raise ValueError('Unexpected end of JSON data')
+            return _MORE
+        text = self.buf[self.start:self.pos]
+        if self.parts:
+            self.parts.append(text)
+            text = ''.join(self.parts)
+            self.parts = []
+        self.start = None
+        return decode(text)
+
+    def scan(self):
+        buf = self.buf
+        if self.scalar:
+            match = _SCALAR_END.search(buf, self.pos)
+            if match is None:
+                self.pos = len(buf)
+                return self.eof
+            self.pos = match.start()
+            return True
+        while True:
+            if self.in_string:
+                if self.escaped:
+                    if self.pos >= len(buf):
+                        return False
+                    self.pos += 1
+                    self.escaped = False
+                match = _STRING_END.search(buf, self.pos)
+                if match is None:
+                    self.pos = len(buf)
+                    return False
+                self.pos = match.end()
+                if match.group() == '"':
+                    self.in_string = False
+                    if not self.depth:
+                        return True
+                else:
+                    self.escaped = True
+            else:
+                match = _STRUCTURE.search(buf, self.pos)
+                if match is None:
+                    self.pos = len(buf)
+                    return False
+                self.pos = match.end()
+                char = match.group()
+                if char == '"':
+                    self.in_string = True
+                elif char in '{[':
+                    self.depth += 1
+                else:
+                    self.depth -= 1
+                    if not self.depth:
+                        return True
+
+
 def use(module=None, decode=None, encode=None):
     """Set the JSON library that should be used, either by specifying a known
     module name, or by providing a decode and encode function.
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+
+"""Periodic sampling of server statistics, active tasks and database
+information into an in-memory time series.
+
+>>> from couchdb import Server
+>>> server = Server()
+>>> db = server.create('python-tests')
+>>> sampler = Sampler(server, databases=['python-tests'], interval=10)
+>>> t, values = sampler.sample()
+>>> values['databases/python-tests/doc_count']
+0
+>>> del server['python-tests']
+
+Samples map metric names to numbers. The names of server statistics are the
+paths into the ``_stats`` response, e.g. ``couchdb/database_reads`` (CouchDB
+2.x) or ``couchdb/database_reads/current`` (CouchDB 1.x). Active tasks are
+summarized per task type as ``tasks/<type>/count``, with the number of changes
+that remain to be processed as ``tasks/<type>/pending_changes``, which for the
+``indexer`` type is the backlog of the view indexes. Database information is
+available as ``databases/<name>/<field>``, e.g. ``databases/mydb/doc_count``.
+
+Call `Sampler.start()` to sample in a background thread until
+`Sampler.stop()` is called, or use the sampler as a context manager (for an
+`aio.AsyncServer`, use `aio.AsyncSampler`, which samples in an asyncio task
+instead)::
+
+    with Sampler(server, databases=['orders'], interval=5) as sampler:
+        ...
+        backlog = sampler.latest()[1]['tasks/indexer/pending_changes']
+        writes = sampler.rate('couchdb/database_writes')
+"""
+
+from collections import deque
+import numbers
+import threading
+import time
+
+from couchdb.client import Database
+
+__all__ = ['Sampler']
+__docformat__ = 'restructuredtext en'
+
+
+class Sampler(object):
+    """Collects samples of a server's statistics at a fixed interval, keeping
+    the most recent ones in a ring buffer.
+    """
+
+    def __init__(self, server, databases=(), interval=10, size=360,
+                 stats=True, tasks=True, counters=()):
+        """Initialize the sampler.
+
+        :param server: the `client.Server` to sample
+        :param databases: names of the databases to sample the info of
+        :param interval: number of seconds between samples
+        :param size: maximum number of samples to keep
+        :param stats: whether to sample the server statistics
+        :param tasks: whether to sample the active tasks
+        :param counters: names of metrics to include the rates of in
+                         snapshots, in addition to the ones CouchDB marks
+                         as counters
+        """
+        self.server = server
+        self.databases = list(databases)
+        self._databases = [(name, self._database(name))
+                           for name in self.databases]
+        self.interval = interval
+        self.buffer = deque(maxlen=size)
+        self.stats = stats
+        self.tasks = tasks
+        self.counters = set(counters)
+        self.errors = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def start(self):
+        """Start sampling in a background thread."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='couchdb-sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread, waiting for a sample in progress."""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopped.set()
+            thread.join()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                # Keep sampling, the server might just be restarting.
+                self.errors += 1
+                self.last_error = e
+            self._stopped.wait(self.interval)
+
+    def sample(self):
+        """Take a sample now and add it to the buffer.
+
+        :return: the ``(timestamp, values)`` tuple of the sample
+        """
+        stats = self.server.stats() if self.stats else None
+        tasks = self.server.tasks() if self.tasks else None
+        infos = [(name, db.info()) for name, db in self._databases]
+        return self._add(stats, tasks, infos)
+
+    def _database(self, name):
+        # Unlike server[name], this doesn't check that the database exists,
+        # which would add a request to every sample.
+        return Database(self.server.resource(name), name)
+
+    def _add(self, stats, tasks, infos):
+        values = {}
+        counters = set()
+        if stats is not None:
+            _flatten(stats, '', values, counters)
+        for task in tasks or ():
+            prefix = 'tasks/%s/' % task.get('type', 'unknown')
+            values[prefix + 'count'] = values.get(prefix + 'count', 0) + 1
+            if 'total_changes' in task and 'changes_done' in task:
+                pending = task['total_changes'] - task['changes_done']
+                name = prefix + 'pending_changes'
+                values[name] = values.get(name, 0) + max(pending, 0)
+        for name, info in infos:
+            _flatten(info, 'databases/%s/' % name, values, counters)
+        sample = (time.time(), values)
+        self.lock.acquire()
+        try:
+            self.buffer.append(sample)
+            self.counters.update(counters)
+        finally:
+            self.lock.release()
+        return sample
+
+    def samples(self):
+        """Return a list of the buffered ``(timestamp, values)`` tuples, from
+        oldest to newest.
+        """
+        self.lock.acquire()
+        try:
+            return list(self.buffer)
+        finally:
+            self.lock.release()
+
+    def latest(self):
+        """Return the most recent ``(timestamp, values)`` tuple, or `None` if
+        there are no samples yet.
+        """
+        self.lock.acquire()
+        try:
+            if not self.buffer:
+                return None
+            return self.buffer[-1]
+        finally:
+            self.lock.release()
+
+    def series(self, name):
+        """Return a list of ``(timestamp, value)`` tuples for the given
+        metric, from oldest to newest, leaving out samples without it.
+        """
+        return [(t, values[name]) for t, values in self.samples()
+                if name in values]
+
+    def rate(self, name, window=None):
+        """Return the average increase per second of the given counter over
+        the buffered samples, or those of the last `window` seconds, or `None`
+        if there are less than two samples of it.
+
+        A decrease of the value is taken to mean that the counter was reset
+        (e.g. by a server restart), and counted as an increase from zero.
+
+        :param name: the name of the metric
+        :param window: the number of seconds to compute the rate over
+        :rtype: `float`
+        """
+        series = self.series(name)
+        if window is not None and series:
+            start = series[-1][0] - window
+            series = [(t, value) for t, value in series if t >= start]
+        if len(series) < 2:
+            return None
+        increase = 0
+        for (t0, value0), (t1, value1) in zip(series, series[1:]):
+            increase += value1 - value0 if value1 >= value0 else value1
+        elapsed = series[-1][0] - series[0][0]
+        if elapsed <= 0:
+            return None
+        return float(increase) / elapsed
+
+    def snapshot(self, window=None):
+        """Return a dictionary with the `time` and `values` of the latest
+        sample, and the `rates` of the metrics that are counters, i.e. those
+        marked as such in the statistics of CouchDB 2.x and later, and those
+        given to the constructor.
+
+        :param window: the number of seconds to compute the rates over
+        :rtype: `dict`
+        """
+        latest = self.latest()
+        if latest is None:
+            return {'time': None, 'values': {}, 'rates': {}}
+        self.lock.acquire()
+        try:
+            counters = sorted(self.counters)
+        finally:
+            self.lock.release()
+        return {
+            'time': latest[0],
+            'values': dict(latest[1]),
+            'rates': dict((name, self.rate(name, window))
+                          for name in counters),
+        }
+
+
+def _flatten(data, prefix, values, counters):
+    """Collect the numbers in nested dictionaries by their slash separated
+    paths. A ``value`` member holds the value of its parent, as in the
+    ``_stats`` response of CouchDB 2.x, where counters are marked by a
+    ``type`` member.
+    """
+    for key, value in data.items():
+        if key == 'value':
+            name = prefix.rstrip('/')
+        else:
+            name = prefix + key
+        if isinstance(value, dict):
+            _flatten(value, name + '/', values, counters)
+        elif isinstance(value, numbers.Number) and \
+                not isinstance(value, bool):
+            values[name] = value
+            if data.get('type') == 'counter':
+                counters.add(name)
@@ -6,10 +6,14 @@
 # This software is licensed as described in the file COPYING, which
 # you should have received as part of this distribution.
 
+import sys
 import unittest
 
 from couchdb.tests import client, couch_tests, design, couchhttp, \
-                          multipart, mapping, view, package, tools
+                          couchjson, follower, multipart, mapping, view, \
+                          package, sampler, tools
+if sys.version_info >= (3, 6):
+    from couchdb.tests import aio
 
 
 def suite():
@@ -17,12 +21,17 @@ def suite():
     suite.addTest(client.suite())
     suite.addTest(design.suite())
     suite.addTest(couchhttp.suite())
+    suite.addTest(couchjson.suite())
     suite.addTest(multipart.suite())
     suite.addTest(mapping.suite())
     suite.addTest(view.suite())
     suite.addTest(couch_tests.suite())
     suite.addTest(package.suite())
+    suite.addTest(sampler.suite())
+    suite.addTest(follower.suite())
     suite.addTest(tools.suite())
+    if sys.version_info >= (3, 6):
+        suite.addTest(aio.suite())
     return suite
 
 
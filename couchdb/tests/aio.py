@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+
+import asyncio
+import threading
+import unittest
+
+from couchdb import aio, client, http
+from couchdb.tests import testutil
+
+
+class AsyncTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(AsyncTestCase, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.aserver = aio.AsyncServer(client.DEFAULT_BASE_URL)
+
+    def tearDown(self):
+        self.aserver.close()
+        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        self.loop.close()
+        super(AsyncTestCase, self).tearDown()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def async_db(self):
+        name, db = self.temp_db()
+        return db, self.aserver[name]
+
+
+class AsyncServerTestCase(AsyncTestCase):
+
+    def test_version(self):
+        version = self.run_async(self.aserver.version())
+        self.assertEqual(version, self.server.version())
+
+    def test_contains(self):
+        name, db = self.temp_db()
+        self.assertTrue(self.run_async(self.aserver.contains(name)))
+        self.assertFalse(self.run_async(
+            self.aserver.contains('couchdb-python/missing')))
+
+    def test_all_dbs(self):
+        name, db = self.temp_db()
+        self.assertTrue(name in self.run_async(self.aserver.all_dbs()))
+
+    def test_create_delete(self):
+        name = 'couchdb-python/async-create'
+        adb = self.run_async(self.aserver.create(name))
+        self.assertTrue(name in self.server)
+        self.assertRaises(http.PreconditionFailed, self.run_async,
+                          self.aserver.create(name))
+        self.run_async(self.aserver.delete(name))
+        self.assertFalse(name in self.server)
+        self.assertRaises(http.ResourceNotFound, self.run_async,
+                          self.aserver.delete(name))
+
+
+class AsyncDatabaseTestCase(AsyncTestCase):
+
+    def test_save_get(self):
+        db, adb = self.async_db()
+        doc = {'_id': 'foo', 'bar': 42}
+        id, rev = self.run_async(adb.save(doc))
+        self.assertEqual(doc['_rev'], rev)
+        self.assertEqual(db['foo']['bar'], 42)
+        doc = self.run_async(adb.get('foo'))
+        self.assertTrue(isinstance(doc, client.Document))
+        self.assertEqual((doc.id, doc.rev), (id, rev))
+        self.assertEqual(self.run_async(adb.get('missing')), None)
+
+    def test_delete(self):
+        db, adb = self.async_db()
+        db['foo'] = doc = {}
+        self.run_async(adb.delete(doc))
+        self.assertFalse(self.run_async(adb.contains('foo')))
+
+    def test_conflict(self):
+        db, adb = self.async_db()
+        db['foo'] = {}
+        self.assertRaises(http.ResourceConflict, self.run_async,
+                          adb.save({'_id': 'foo'}))
+
+    def test_concurrent_gets(self):
+        db, adb = self.async_db()
+        db.update([{'_id': str(i), 'i': i} for i in range(50)])
+        async def get_all():
+            return await asyncio.gather(*[adb.get(str(i))
+                                          for i in range(50)])
+        docs = self.run_async(get_all())
+        self.assertEqual([doc['i'] for doc in docs], list(range(50)))
+
+    def test_max_connections(self):
+        name, db = self.temp_db()
+        db.update([{'_id': str(i)} for i in range(20)])
+        session = aio.AsyncSession(max_connections=2)
+        adb = aio.AsyncServer(client.DEFAULT_BASE_URL, session=session)[name]
+        async def get_all():
+            return await asyncio.gather(*[adb.get(str(i))
+                                          for i in range(20)])
+        self.assertEqual(len(self.run_async(get_all())), 20)
+        stats = session.connection_pool.stats()
+        self.assertTrue(stats['misses'] <= 2)
+        self.assertEqual(stats['in_use'], 0)
+        session.close()
+
+    def test_update(self):
+        db, adb = self.async_db()
+        docs = [{'_id': 'a'}, {'_id': 'b'}]
+        results = self.run_async(adb.update(docs))
+        self.assertEqual([r[0] for r in results], [True, True])
+        self.assertEqual(docs[0]['_rev'], results[0][2])
+        results = self.run_async(adb.update([{'_id': 'a'}]))
+        self.assertTrue(isinstance(results[0][2], http.ResourceConflict))
+
+    def test_view(self):
+        db, adb = self.async_db()
+        db.update([{'_id': str(i)} for i in range(5)])
+        async def collect(results):
+            return [row async for row in results]
+        results = adb.view('_all_docs')
+        rows = self.run_async(collect(results))
+        self.assertEqual([row.id for row in rows], ['0', '1', '2', '3', '4'])
+        self.assertEqual(results.total_rows, 5)
+        rows = self.run_async(collect(adb.view('_all_docs')['1':'2']))
+        self.assertEqual([row.id for row in rows], ['1', '2'])
+        rows = self.run_async(collect(adb.view('_all_docs', keys=['3', '0'])))
+        self.assertEqual([row.id for row in rows], ['3', '0'])
+
+    def test_view_streams(self):
+        db, adb = self.async_db()
+        db.update([{'_id': str(i), 'text': 'x' * 100} for i in range(200)])
+        pool = adb.resource.session.connection_pool
+        async def first():
+            results = adb.view('_all_docs', include_docs=True)
+            rows = results.__aiter__()
+            row = await rows.__anext__()
+            in_use = pool.stats()['in_use']
+            await rows.aclose()
+            return row, in_use, results
+        row, in_use, results = self.run_async(first())
+        self.assertEqual(row.id, '0')
+        # The rest of the response hadn't been read yet.
+        self.assertEqual(in_use, 1)
+        self.assertEqual(pool.stats()['in_use'], 0)
+        self.assertEqual(results.total_rows, 200)
+        self.assertEqual(results.rows, None)
+
+    def test_file_body(self):
+        db, adb = self.async_db()
+        threads = []
+        class Body(object):
+            def read(self):
+                threads.append(threading.current_thread())
+                return b'{"docs": [{"_id": "foo"}]}'
+        self.run_async(adb.resource.post_json(
+            '_bulk_docs', body=Body(),
+            headers={'Content-Type': 'application/json'}))
+        self.assertTrue('foo' in db)
+        self.assertNotEqual(threads, [threading.current_thread()])
+
+    def test_changes(self):
+        db, adb = self.async_db()
+        db['foo'] = {}
+        self.assertEqual(
+            self.run_async(adb.changes(since=0))['results'][0]['id'], 'foo')
+        async def first():
+            async for change in adb.changes(feed='continuous'):
+                return change
+        self.assertEqual(self.run_async(first())['id'], 'foo')
+
+    def test_changes_releases_conn(self):
+        db, adb = self.async_db()
+        db['foo'] = {}
+        async def consume():
+            return [change async for change in
+                    adb.changes(feed='continuous', timeout=0)]
+        changes = self.run_async(consume())
+        self.assertTrue('last_seq' in changes[-1])
+        self.assertEqual(adb.resource.session.connection_pool.stats()['idle'],
+                         1)
+
+
+class AsyncSamplerTestCase(AsyncTestCase):
+
+    def test_sample(self):
+        name, db = self.temp_db()
+        db['foo'] = {}
+        sampler = aio.AsyncSampler(self.aserver, databases=[name])
+        t, values = self.run_async(sampler.sample())
+        self.assertEqual(values['databases/%s/doc_count' % name], 1)
+        self.assertEqual(sampler.latest(), (t, values))
+
+    def test_start_stop(self):
+        sampler = aio.AsyncSampler(self.aserver, interval=0.01)
+        async def run():
+            async with sampler:
+                while len(sampler) < 2:
+                    await asyncio.sleep(0.01)
+        self.run_async(run())
+        self.assertEqual(sampler.errors, 0)
+        self.assertIsNone(sampler._task)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(AsyncServerTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(AsyncDatabaseTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(AsyncSamplerTestCase, 'test'))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
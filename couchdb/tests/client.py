@@ -6,6 +6,7 @@
 # This software is licensed as described in the file COPYING, which
 # you should have received as part of this distribution.
 
+import array
 from datetime import datetime
 import os
 import os.path
@@ -15,7 +16,7 @@ import tempfile
 import threading
 import unittest
 
-from couchdb import client, http, util
+from couchdb import client, http, json, util
 from couchdb.tests import testutil
 
 
@@ -400,6 +401,78 @@ class DatabaseTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
     def test_bulk_update_bad_doc(self):
         self.assertRaises(TypeError, self.db.update, [object()])
 
+    def test_get_many(self):
+        self.db.update([{'_id': str(i), 'i': i} for i in range(5)])
+        del self.db['3']
+        ids = ['4', 'missing', '3', '0', '4']
+        for options in [{}, {'batch': 2}, {'batch': 1, 'workers': 3},
+                        {'bulk_get': True, 'batch': 2, 'workers': 2}]:
+            docs = self.db.get_many(ids, **options)
+            self.assertEqual([doc and doc['i'] for doc in docs],
+                             [4, None, None, 0, 4])
+            self.assertTrue(isinstance(docs[0], client.Document))
+
+    def test_get_many_empty(self):
+        self.assertEqual(self.db.get_many([]), [])
+        self.assertRaises(ValueError, self.db.get_many, ['foo'], batch=0)
+
+    def test_get_many_error(self):
+        db = client.Database(client.DEFAULT_BASE_URL + 'couchdb-python%2Fnone')
+        self.assertRaises(http.ResourceNotFound, db.get_many, ['a', 'b'],
+                          batch=1, workers=2)
+
+    def test_bulk_update_generator(self):
+        docs = ({'_id': str(i), 'i': i} for i in range(100))
+        results = self.db.update(docs)
+        self.assertEqual(len(results), 100)
+        self.assertTrue(all(success for success, docid, rev in results))
+        self.assertEqual(self.db['42']['i'], 42)
+
+    def test_bulk_docs_body(self):
+        body = client._BulkDocsBody(iter([{'a': 1}, {'b': 2}]),
+                                    {'new_edits': False})
+        chunks = []
+        while True:
+            chunk = body.read(5)
+            if not chunk:
+                break
+            self.assertTrue(len(chunk) <= 5)
+            chunks.append(chunk)
+        self.assertEqual(json.decode(b''.join(chunks).decode('utf-8')),
+                         {'new_edits': False, 'docs': [{'a': 1}, {'b': 2}]})
+        body = client._BulkDocsBody([], {})
+        self.assertEqual(body.read(), b'{"docs": []}')
+
+    def test_upsert_many(self):
+        self.db['a'] = {'x': 1, 'y': 1}
+        docs = [{'_id': 'a', 'y': 2}, {'_id': 'b', 'y': 3, '_rev': '1-x'}]
+        results = self.db.upsert_many(docs)
+        self.assertEqual([result[:2] for result in results],
+                         [(True, 'a'), (True, 'b')])
+        self.assertEqual(dict(self.db['a'], _rev=None),
+                         {'_id': 'a', '_rev': None, 'y': 2})
+        self.assertEqual(self.db['b'].rev, results[1][2])
+        self.assertEqual(docs[1]['_rev'], '1-x')
+
+    def test_upsert_many_merge_conflicts(self):
+        self.db['a'] = {'n': 0}
+        merge = lambda current, doc: dict(current, n=current['n'] + doc['n'])
+        docs = [{'_id': 'a', 'n': 1}, {'_id': 'a', 'n': 2},
+                {'_id': 'a', 'n': 4}]
+        results = self.db.upsert_many(docs, merge=merge)
+        self.assertTrue(all(result[0] for result in results))
+        self.assertEqual(self.db['a']['n'], 7)
+
+    def test_upsert_many_max_attempts(self):
+        docs = [{'_id': 'a'}, {'_id': 'a'}]
+        results = self.db.upsert_many(docs, max_attempts=1)
+        self.assertEqual(len([result for result in results if result[0]]), 1)
+        failed = [result for result in results if not result[0]][0]
+        self.assertTrue(isinstance(failed[2], http.ResourceConflict))
+        self.assertRaises(ValueError, self.db.upsert_many, [{}])
+        self.assertRaises(ValueError, self.db.upsert_many, [{'_id': 'a'}],
+                          max_attempts=0)
+
     def test_copy_doc(self):
         self.db['foo'] = {'status': 'testing'}
         result = self.db.copy('foo', 'bar')
@@ -462,6 +535,68 @@ class DatabaseTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
         self.assertEqual(first['seq'], 1)
         self.assertEqual(first['id'], 'foo')
 
+    def test_changes_stream(self):
+        self.db.update([{'_id': str(i)} for i in range(3)])
+        changes = self.db.changes(stream=True, since=1)
+        self.assertEqual(changes.last_seq, None)
+        self.assertEqual([change['id'] for change in changes], ['1', '2'])
+        self.assertEqual(changes.last_seq, 3)
+        # Iterating again makes a new request.
+        self.db.save({'_id': '3'})
+        self.assertEqual([change['id'] for change in changes], ['1', '2', '3'])
+        self.assertEqual(changes.last_seq, 4)
+
+    def test_changes_stream_close(self):
+        self.db.update([{'_id': str(i)} for i in range(200)])
+        with self.db.changes(stream=True, include_docs=True) as changes:
+            self.assertEqual(next(iter(changes))['id'], '0')
+        self.assertEqual(changes.last_seq, None)
+        self.assertEqual(self.db.resource.session.connection_pool.stats()
+                         ['in_use'], 0)
+        self.assertEqual(self.db.info()['doc_count'], 200)
+
+    def test_iterchanges(self):
+        self.db.update([{'_id': str(i)} for i in range(5)])
+        started = []
+        class Hooks(http.RequestHooks):
+            def request_started(self, info):
+                started.append(info.url)
+        db = client.Database(self.db.resource.url,
+                             session=http.Session(hooks=[Hooks()]))
+        changes = list(db.iterchanges(2, since=1))
+        self.assertEqual([change['id'] for change in changes],
+                         ['1', '2', '3', '4'])
+        self.assertEqual(len(started), 3)
+        self.assertTrue('since=3' in started[1])
+        self.assertTrue('limit=2' in started[1])
+
+    def test_iterchanges_follow(self):
+        self.db.save({'_id': 'a'})
+        def wakeup():
+            time.sleep(.3)
+            self.db.save({'_id': 'b'})
+        threading.Thread(target=wakeup).start()
+        changes = self.db.iterchanges(10, follow=True, timeout=5000)
+        self.assertEqual(next(changes)['id'], 'a')
+        self.assertEqual(next(changes)['id'], 'b')
+        changes.close()
+
+    def test_iterchanges_batch(self):
+        self.assertRaises(ValueError, list, self.db.iterchanges(0))
+
+    def test_request_timeout(self):
+        timeout = http.Timeout(total=10, read=5)
+        self.db.update([{'_id': 'foo'}], request_timeout=timeout)
+        doc = self.db.get('foo', request_timeout=timeout)
+        self.assertEqual(doc.id, 'foo')
+        self.assertEqual(self.db.save(doc, request_timeout=timeout)[0], 'foo')
+        rows = list(self.db.view('_all_docs', request_timeout=timeout))
+        self.assertEqual([row.id for row in rows], ['foo'])
+        self.assertEqual(self.db.changes(request_timeout=timeout)['last_seq'],
+                         2)
+        self.db.delete(doc, request_timeout=timeout)
+        self.assertFalse('foo' in self.db)
+
     def test_changes_releases_conn(self):
         # Consume an entire changes feed to read the whole response, then check
         # that the HTTP connection made it to the pool.
@@ -646,6 +781,175 @@ class ViewTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
         for attr in ['rows', 'total_rows', 'offset']:
             self.assertTrue(getattr(self.db.view('_all_docs'), attr) is not None)
 
+    def test_iterrows(self):
+        self.db.update([{'_id': '%03d' % i, 'data': 'x' * 100}
+                        for i in range(200)])
+        results = self.db.view('_all_docs', include_docs=True)
+        rows = results.iterrows()
+        row = next(rows)
+        self.assertEqual(row.id, '000')
+        self.assertEqual(row.doc['data'], 'x' * 100)
+        self.assertEqual(results.total_rows, 200)
+        self.assertEqual(results.offset, 0)
+        self.assertEqual(len(list(rows)), 199)
+        self.assertEqual(results._rows, None)
+
+    def test_iterrows_keys(self):
+        self.db.update([{'_id': str(i)} for i in range(5)])
+        rows = self.db.view('_all_docs', keys=['3', '1', 'missing']).iterrows()
+        self.assertEqual([row.key for row in rows], ['3', '1', 'missing'])
+
+    def test_iterrows_wrapper(self):
+        class Wrapper(object):
+            def __init__(self, doc):
+                pass
+        self.db['foo'] = {}
+        rows = self.db.view('_all_docs', wrapper=Wrapper).iterrows()
+        self.assertTrue(isinstance(next(rows), Wrapper))
+
+    def test_stream(self):
+        self.db.update([{'_id': '%03d' % i} for i in range(50)])
+        results = self.db.view('_all_docs', stream=True)
+        self.assertEqual(results.total_rows, 50)
+        self.assertEqual(results.offset, 0)
+        self.assertEqual([row.id for row in results],
+                         ['%03d' % i for i in range(50)])
+        self.assertRaises(TypeError, len, results)
+        self.assertRaises(TypeError, lambda: results.rows)
+        self.assertEqual(results._body, None)
+        pool = self.db.resource.session.connection_pool
+        self.assertEqual(pool.stats()['in_use'], 0)
+        # Iterating again makes a new request.
+        self.assertEqual(len(list(results)), 50)
+
+    def test_stream_close(self):
+        self.db.update([{'_id': '%03d' % i, 'data': 'x' * 100}
+                        for i in range(200)])
+        pool = self.db.resource.session.connection_pool
+        with self.db.view('_all_docs', include_docs=True,
+                          stream=True) as results:
+            rows = iter(results)
+            self.assertEqual(next(rows).id, '000')
+            self.assertEqual(pool.stats()['in_use'], 1)
+        self.assertEqual(pool.stats()['in_use'], 0)
+        self.assertEqual(results['010':'012'].stream, True)
+        self.assertEqual([row.id for row in results['010':'012']],
+                         ['010', '011', '012'])
+
+    def test_compact_row(self):
+        self.db.update([{'_id': str(i), 'i': i} for i in range(10)])
+        rows = list(self.db.view('_all_docs', include_docs=True,
+                                 wrapper=client.CompactRow))
+        row = rows[3]
+        self.assertTrue(isinstance(row, client.CompactRow))
+        self.assertFalse(hasattr(row, '__dict__'))
+        self.assertEqual((row.id, row.key, row.error), ('3', '3', None))
+        self.assertEqual(row.value['rev'], row.doc.rev)
+        self.assertEqual(row.doc['i'], 3)
+        self.assertEqual(row['key'], '3')
+        self.assertRaises(KeyError, lambda: row['_doc'])
+        self.assertTrue(repr(row).startswith("<CompactRow id="))
+        rows = self.db.iterview('_all_docs', 3, wrapper=client.CompactRow)
+        self.assertEqual([row.id for row in rows],
+                         [str(i) for i in range(10)])
+
+    def test_session_row_type(self):
+        self.db['foo'] = {}
+        session = http.Session(row_type=client.CompactRow)
+        db = client.Database(self.db.resource.url, session=session)
+        self.assertTrue(isinstance(list(db.view('_all_docs'))[0],
+                                   client.CompactRow))
+        rows = db.view('_all_docs', stream=True)
+        self.assertTrue(isinstance(list(rows)[0], client.CompactRow))
+        rows = db.view('_all_docs', wrapper=client.Row)
+        self.assertTrue(isinstance(list(rows)[0], client.Row))
+
+    def test_to_columns(self):
+        self.db.update([{'_id': str(i)} for i in range(5)])
+        columns = self.db.view('_all_docs').to_columns(['id', 'value'],
+                                                        use_numpy=False)
+        self.assertEqual(columns['id'], [str(i) for i in range(5)])
+        self.assertEqual(len(columns['value']), 5)
+        columns = self.db.view('_all_docs', limit=0).to_columns(
+            use_numpy=False)
+        self.assertEqual(columns['key'], array.array(client._INT_TYPECODE))
+
+    def test_column_types(self):
+        column = client._Column()
+        column.append(1)
+        column.append(2)
+        self.assertEqual(column.values.typecode, client._INT_TYPECODE)
+        column.append(2.5)
+        self.assertEqual(column.values, array.array('d', [1, 2, 2.5]))
+        column.append(True)
+        self.assertEqual(column.values, [1.0, 2.0, 2.5, True])
+        column = client._Column()
+        column.append(2 ** 70)
+        self.assertEqual(column.values, [2 ** 70])
+
+    @unittest.skipIf(client.numpy is None, 'NumPy is not installed')
+    def test_to_columns_numpy(self):
+        self.db.update([{'_id': str(i)} for i in range(3)])
+        columns = self.db.view('_all_docs').to_columns()
+        self.assertEqual(columns['key'].dtype, object)
+        self.assertEqual(list(columns['key']), ['0', '1', '2'])
+        column = client._Column()
+        column.append(1.5)
+        self.assertEqual(column.to_numpy().dtype.kind, 'f')
+
+    def test_view_cache(self):
+        self.db.update([{'_id': str(i)} for i in range(3)])
+        started = []
+        class Hooks(http.RequestHooks):
+            def request_started(self, info):
+                started.append(info.url)
+        cache = client.ViewCache()
+        session = http.Session(hooks=[Hooks()], view_cache=cache)
+        db = client.Database(self.db.resource.url, session=session)
+        first = db.view('_all_docs').rows
+        second = db.view('_all_docs').rows
+        self.assertEqual([row.id for row in second], ['0', '1', '2'])
+        self.assertTrue(first[0] is second[0])
+        self.assertEqual(db.view('_all_docs').total_rows, 3)
+        self.assertEqual(cache.stats(),
+                         {'hits': 2, 'misses': 1, 'entries': 1})
+        self.assertEqual(len(started), 3)
+
+        # Cached rows are used without a request with stale=ok.
+        self.assertEqual(len(db.view('_all_docs', stale='ok').rows), 3)
+        self.assertEqual(len(started), 3)
+        self.assertEqual(cache.stats()['hits'], 3)
+
+        self.db['3'] = {}
+        self.assertEqual(len(db.view('_all_docs').rows), 4)
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(len(db.view('_all_docs', keys=['1']).rows), 1)
+        self.assertEqual(len(cache), 1)
+
+    def test_view_cache_stale(self):
+        self.db.update([{'_id': str(i)} for i in range(3)])
+        cache = client.ViewCache()
+        db = client.Database(self.db.resource.url,
+                             session=http.Session(view_cache=cache))
+        self.assertEqual(len(db.view('_all_docs', stale='ok').rows), 3)
+        # Results stored for a stale request are revalidated by others.
+        self.db['3'] = {}
+        self.assertEqual(len(db.view('_all_docs', stale='ok').rows), 3)
+        self.assertEqual(len(db.view('_all_docs').rows), 4)
+        self.assertEqual(len(db.view('_all_docs', stale='ok').rows), 4)
+        self.assertEqual(len(cache), 1)
+
+    def test_view_cache_lru(self):
+        cache = client.ViewCache(max_entries=2)
+        cache.put('a', '"1"', ())
+        cache.put('b', '"2"', ())
+        cache.get('a')
+        cache.put('c', '"3"', ())
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), ('"1"', ()))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
     def test_rowrepr(self):
         self.db['foo'] = {}
         rows = list(self.db.query("function(doc) {emit(null, 1);}"))
@@ -769,7 +1073,9 @@ class ViewIterationTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
         super(ViewIterationTestCase, self).setUp()
         design_doc = {'_id': '_design/test',
                       'views': {'nums': {'map': 'function(doc) {emit(doc.num, null);}'},
-                                'nulls': {'map': 'function(doc) {emit(null, null);}'}}}
+                                'nulls': {'map': 'function(doc) {emit(null, null);}'},
+                                'counts': {'map': 'function(doc) {emit(doc.num, 1);}',
+                                           'reduce': '_sum'}}}
         self.db.save(design_doc)
         self.db.update([self.docfromnum(num) for num in range(self.num_docs)])
 
@@ -824,6 +1130,187 @@ class ViewIterationTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
     def test_nullkeys(self):
         self.assertEqual(len(list(self.db.iterview('test/nulls', 10))), self.num_docs)
 
+    def test_prefetch(self):
+        started = []
+        class Hooks(http.RequestHooks):
+            def request_started(self, info):
+                started.append(info.url)
+        db = client.Database(self.db.resource.url,
+                             session=http.Session(hooks=[Hooks()]))
+        rows = db.iterview('_all_docs', 10, prefetch=2)
+        first = next(rows)
+        deadline = time.time() + 5
+        while len(started) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(len(started) >= 3)
+        self.assertEqual([first.id] + [row.id for row in rows],
+                         [row.id for row in self.db.iterview('_all_docs', 10)])
+
+    def test_scanview(self):
+        expected = [self.docfromnum(num) for num in range(self.num_docs)]
+        for workers in [1, 3, 8]:
+            rows = list(self.db.scanview('test/nums', 7, workers=workers))
+            self.assertEqual([self.docfromrow(row) for row in rows], expected)
+        rows = self.db.scanview('test/nums', 7, workers=3, ordered=False)
+        self.assertEqual(sorted(row.id for row in rows),
+                         sorted(doc['_id'] for doc in expected))
+
+    def test_scanview_splits(self):
+        rows = list(self.db.scanview('test/nums', 7, splits=[10, 30, 31]))
+        self.assertEqual([self.docfromrow(row) for row in rows],
+                         [self.docfromnum(num) for num in range(self.num_docs)])
+
+    def test_scanview_all_docs(self):
+        ids = sorted(row.id for row in self.db.view('_all_docs'))
+        for ordered in [True, False]:
+            rows = self.db.scanview('_all_docs', 9, workers=4,
+                                    ordered=ordered)
+            row_ids = [row.id for row in rows]
+            self.assertEqual(row_ids if ordered else sorted(row_ids), ids)
+        rows = self.db.scanview('_all_docs', 9, splits=['3', '50'])
+        self.assertEqual([row.id for row in rows], ids)
+
+    def test_scanview_reduce(self):
+        self.assertRaises(ValueError, lambda: next(
+            self.db.scanview('test/counts', 7, workers=3)))
+        self.assertRaises(ValueError, lambda: next(
+            self.db.scanview('test/counts', 7, splits=[10], reduce=True)))
+        rows = list(self.db.scanview('test/counts', 7, workers=3,
+                                     reduce=False))
+        self.assertEqual([self.docfromrow(row) for row in rows],
+                         [self.docfromnum(num) for num in range(self.num_docs)])
+
+    def test_scanview_close(self):
+        rows = self.db.scanview('_all_docs', 1, workers=4)
+        self.assertTrue(next(rows).id)
+        rows.close()
+
+    def test_scanview_options(self):
+        self.assertRaises(ValueError, lambda: next(
+            self.db.scanview('test/nums', 10, limit=5)))
+        self.assertRaises(ValueError, lambda: next(
+            self.db.scanview('test/nums', 10, workers=0)))
+
+class BulkWriterTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
+
+    def test_write(self):
+        seen = []
+        writer = self.db.bulk_writer(max_docs=3, workers=2,
+                                     callback=lambda doc, result:
+                                     seen.append(doc['_id']))
+        with writer:
+            docs = [{'_id': str(i)} for i in range(7)]
+            results = [writer.write(doc) for doc in docs]
+        self.assertTrue(all(result.done() for result in results))
+        self.assertEqual([result.result()[:2] for result in results],
+                         [(True, str(i)) for i in range(7)])
+        self.assertEqual(docs[0]['_rev'], results[0].result()[2])
+        self.assertEqual(sorted(seen), [str(i) for i in range(7)])
+        self.assertEqual(len(self.db), 7)
+        self.assertRaises(ValueError, writer.write, {})
+
+    def test_conflict(self):
+        self.db['foo'] = {}
+        with self.db.bulk_writer() as writer:
+            result = writer.write({'_id': 'foo'})
+        success, docid, exc = result.result()
+        self.assertFalse(success)
+        self.assertEqual(docid, 'foo')
+        self.assertTrue(isinstance(exc, http.ResourceConflict))
+
+    def test_max_latency(self):
+        with self.db.bulk_writer(max_latency=0.05) as writer:
+            result = writer.write({'_id': 'foo'})
+            self.assertTrue(result.result(timeout=5)[0])
+            self.assertTrue('foo' in self.db)
+
+    def test_batches(self):
+        db = FakeBulkDatabase()
+        with client.BulkWriter(db, max_docs=3, max_bytes=40,
+                               workers=1) as writer:
+            for i in range(4):
+                writer.write({'_id': str(i)})
+            writer.write({'_id': 'x' * 50})
+            writer.flush()
+            writer.write({'_id': 'y'})
+        self.assertEqual([[doc['_id'] for doc in batch]
+                          for batch in db.batches],
+                         [['0', '1', '2'], ['3', 'x' * 50], ['y']])
+
+    def test_backpressure(self):
+        db = FakeBulkDatabase()
+        db.blocked.clear()
+        writer = client.BulkWriter(db, max_docs=1, workers=1, max_pending=1)
+        writer.write({'_id': 'saving'})
+        writer.write({'_id': 'waiting'})
+        writing = threading.Thread(target=writer.write, args=({'_id': 'x'},))
+        writing.start()
+        writing.join(0.1)
+        self.assertTrue(writing.is_alive())
+        db.blocked.set()
+        writing.join(5)
+        self.assertFalse(writing.is_alive())
+        writer.close()
+        self.assertEqual(len(db.batches), 3)
+
+    def test_close_during_timer_flush(self):
+        # Delay queueing, as if the timer thread was preempted after taking
+        # a batch.
+        class SlowQueue(client.queue.Queue):
+            def put(self, item, *args, **kwargs):
+                if item is not None:
+                    time.sleep(0.2)
+                client.queue.Queue.put(self, item, *args, **kwargs)
+        Queue = client.queue.Queue
+        client.queue.Queue = SlowQueue
+        try:
+            writer = client.BulkWriter(FakeBulkDatabase(), max_latency=0)
+        finally:
+            client.queue.Queue = Queue
+        result = writer.write({'_id': 'foo'})
+        deadline = time.time() + 5
+        while writer._batch and time.time() < deadline:
+            time.sleep(0.01)
+        writer.close()
+        self.assertEqual(result.result(timeout=0), (True, 'foo', '1-x'))
+
+    def test_options(self):
+        db = FakeBulkDatabase()
+        self.assertRaises(ValueError, client.BulkWriter, db, max_docs=0)
+        self.assertRaises(ValueError, client.BulkWriter, db, workers=0)
+        self.assertRaises(ValueError, client.BulkWriter, db, max_pending=0)
+
+    def test_error(self):
+        db = FakeBulkDatabase(error=http.ServerError('down'))
+        with client.BulkWriter(db) as writer:
+            result = writer.write({'_id': 'foo'})
+        self.assertEqual(result.result(), (False, 'foo', db.error))
+
+    def test_callback_error(self):
+        def callback(doc, result):
+            raise ValueError('callback failed')
+        writer = client.BulkWriter(FakeBulkDatabase(), callback=callback)
+        writer.write({})
+        self.assertRaises(ValueError, writer.close)
+        self.assertTrue(writer.closed)
+
+
+class FakeBulkDatabase(object):
+
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+        self.blocked = threading.Event()
+        self.blocked.set()
+
+    def update(self, docs):
+        self.blocked.wait()
+        self.batches.append(docs)
+        if self.error is not None:
+            raise self.error
+        return [(True, doc.get('_id'), '1-x') for doc in docs]
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(ServerTestCase, 'test'))
@@ -832,6 +1319,7 @@ def suite():
     suite.addTest(unittest.makeSuite(ShowListTestCase, 'test'))
     suite.addTest(unittest.makeSuite(UpdateHandlerTestCase, 'test'))
     suite.addTest(unittest.makeSuite(ViewIterationTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(BulkWriterTestCase, 'test'))
     suite.addTest(testutil.doctest_suite(client))
     return suite
 
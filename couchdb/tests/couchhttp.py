@@ -6,11 +6,16 @@
 # This software is licensed as described in the file COPYING, which
 # you should have received as part of this distribution.
 
+import io
+import os
+import shutil
 import socket
+import tempfile
+import threading
 import time
 import unittest
 
-from couchdb import http, util
+from couchdb import client, http, json, util
 from couchdb.tests import testutil
 
 
@@ -25,12 +30,77 @@ class SessionTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
         self.assertRaises(socket.timeout, body.read)
         self.assertTrue(time.time() - start < timeout * 1.3)
 
+    def test_compression(self):
+        dbname, db = self.temp_db()
+        session = http.Session(compression=True, compress_requests=True)
+        docs = [{'_id': str(i), 'data': 'x' * 100} for i in range(100)]
+        status, headers, body = session.request(
+            'POST', db.resource.url + '/_bulk_docs', body={'docs': docs})
+        self.assertEqual(len(json.decode(body.read().decode('utf-8'))), 100)
+        status, headers, body = session.request(
+            'GET', db.resource.url + '/_all_docs?include_docs=true')
+        rows = json.decode(body.read().decode('utf-8'))['rows']
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(rows[0]['doc']['data'], 'x' * 100)
+
     def test_timeout_retry(self):
         dbname, db = self.temp_db()
         timeout = 1e-12
         session = http.Session(timeout=timeout, retryable_errors=["timed out"])
         self.assertRaises(socket.timeout, session.request, 'GET', db.resource.url)
 
+    def test_hooks(self):
+        dbname, db = self.temp_db()
+        events = []
+        class Recorder(http.RequestHooks):
+            def request_started(self, info):
+                events.append(('started', info.template))
+            def connection_acquired(self, info):
+                events.append(('acquired', info.acquired_at is not None))
+            def response_started(self, info):
+                events.append(('response', info.status))
+            def request_finished(self, info):
+                events.append(('finished', info.bytes_received > 0))
+        session = http.Session(hooks=[Recorder()])
+        session.request('PUT', db.resource.url + '/foo', body={'a': 1})
+        self.assertEqual(events, [('started', '/{db}/{docid}'),
+                                  ('acquired', True), ('response', 201),
+                                  ('finished', True)])
+
+    def test_hooks_streamed(self):
+        dbname, db = self.temp_db()
+        db.update([{'_id': str(i), 'data': 'x' * 100} for i in range(100)])
+        infos = []
+        class Recorder(http.RequestHooks):
+            def request_finished(self, info):
+                infos.append(info)
+        session = http.Session(hooks=[Recorder()])
+        status, headers, body = session.request(
+            'GET', db.resource.url + '/_all_docs?include_docs=true')
+        self.assertEqual(infos, [])
+        data = body.read()
+        self.assertEqual(len(infos), 1)
+        info = infos[0]
+        self.assertEqual(info.template, '/{db}/_all_docs')
+        self.assertEqual(info.bytes_received, len(data))
+        self.assertEqual(info.bytes_sent, 0)
+        self.assertTrue(info.started_at <= info.connect_started_at <=
+                        info.connected_at <= info.acquired_at <=
+                        info.sent_at <= info.response_at <= info.finished_at)
+        self.assertTrue(info.ttfb <= info.duration)
+
+    def test_hooks_error(self):
+        infos = []
+        class Recorder(http.RequestHooks):
+            def request_finished(self, info):
+                infos.append(info)
+        session = http.Session(hooks=[Recorder()], retry_delays=[])
+        self.assertRaises(socket.error, session.request, 'GET',
+                          'http://127.0.0.1:1/')
+        self.assertEqual(len(infos), 1)
+        self.assertTrue(isinstance(infos[0].error, socket.error))
+        self.assertEqual(infos[0].status, None)
+
 
 class ResponseBodyTestCase(unittest.TestCase):
     def test_close(self):
@@ -71,6 +141,42 @@ class ResponseBodyTestCase(unittest.TestCase):
         self.assertEqual(list(response.iterchunks()), [b'foobarbaz'])
         self.assertEqual(list(response.iterchunks()), [])
 
+    def test_read_gzip(self):
+        class TestStream(util.StringIO):
+            msg = {'content-encoding': 'gzip'}
+            def isclosed(self):
+                return len(self.getvalue()) == self.tell()
+
+        data = b'foobarbaz' * 10000
+        stream = TestStream(http.gzip_compress(data))
+        response = http.ResponseBody(stream, None, None, None)
+        self.assertEqual(response.read(3), b'foo')
+        self.assertEqual(response.read(6), b'barbaz')
+        self.assertEqual(response.read(), data[9:])
+
+    def test_iterchunks_gzip(self):
+        class TestHttpResp(object):
+            msg = {'transfer-encoding': 'chunked', 'content-encoding': 'gzip'}
+            def __init__(self, fp):
+                self.fp = fp
+            def close(self):
+                pass
+            def isclosed(self):
+                return len(self.fp.getvalue()) == self.fp.tell()
+
+        class ConnPool(object):
+            def release(self, url, conn):
+                pass
+
+        lines = [('{"seq": %d}' % i).encode('utf-8') for i in range(100)]
+        data = http.gzip_compress(b'\n'.join(lines) + b'\n')
+        chunks = [data[i:i + 10] for i in range(0, len(data), 10)] + [b'']
+        data = b''.join([hex(len(chunk))[2:].encode('utf-8') + b'\r\n' +
+                         chunk + b'\r\n' for chunk in chunks])
+        response = http.ResponseBody(TestHttpResp(util.StringIO(data)),
+                                     ConnPool(), 'a', 'b')
+        self.assertEqual(list(response.iterchunks()), lines)
+
 
 class CacheTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
 
@@ -82,15 +188,737 @@ class CacheTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
         cache.remove(url)
         cache.remove(url)
 
-    def test_cache_clean(self):
+    def test_lru_eviction(self):
+        cache = http.Cache(max_entries=2)
+        cache.put('foo', (None, {}, None))
+        cache.put('bar', (None, {}, None))
+        cache.get('foo')
+        cache.put('baz', (None, {}, None))
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.get('bar') is None)
+        self.assertTrue(cache.get('foo') is not None)
+        self.assertTrue(cache.get('baz') is not None)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_max_bytes(self):
+        cache = http.Cache(max_entries=None, max_bytes=10)
+        cache.put('foo', (200, {}, b'12345'))
+        cache.put('bar', (200, {}, b'12345'))
+        self.assertEqual(cache.stats()['bytes'], 10)
+        cache.put('baz', (200, {}, b'1'))
+        self.assertTrue(cache.get('foo') is None)
+        self.assertEqual(cache.stats()['bytes'], 6)
+        cache.put('big', (200, {}, b'12345678901'))
+        self.assertTrue(cache.get('big') is None)
+        self.assertEqual(len(cache), 2)
+
+    def test_replace(self):
+        cache = http.Cache(max_bytes=10)
+        cache.put('foo', (200, {}, b'12345'))
+        cache.put('foo', (200, {}, b'123'))
+        self.assertEqual(cache.get('foo'), (200, {}, b'123'))
+        self.assertEqual(cache.stats()['bytes'], 3)
+
+    def test_ttl(self):
+        cache = http.Cache(ttl=0.01)
+        cache.put('foo', (200, {}, b'foo'))
+        self.assertTrue(cache.get('foo') is not None)
+        time.sleep(0.02)
+        self.assertTrue(cache.get('foo') is None)
+        self.assertEqual(len(cache), 0)
+
+    def test_session_cache(self):
+        cache = http.Cache()
+        self.assertTrue(http.Session(cache=cache).cache is cache)
+        session = http.Session(cache={'foo': (200, {}, b'foo')})
+        self.assertEqual(session.cache.get('foo'), (200, {}, b'foo'))
+
+    def test_shared_cache(self):
         cache = http.Cache()
-        cache.put('foo', (None, {'Date': 'Sat, 14 Feb 2009 02:31:28 -0000'}, None))
-        cache.put('bar', (None, {'Date': 'Sat, 14 Feb 2009 02:31:29 -0000'}, None))
-        cache.put('baz', (None, {'Date': 'Sat, 14 Feb 2009 02:31:30 -0000'}, None))
-        cache.keep_size = 1
-        cache._clean()
-        self.assertEqual(len(cache.by_url), 1)
-        self.assertTrue('baz' in cache.by_url)
+        first, second = http.Session(cache=cache), http.Session(cache=cache)
+        self.db['foo'] = {}
+        url = self.db.resource('foo').url
+        first.request('GET', url)
+        self.assertTrue(cache.get(url) is not None)
+        status, headers, body = second.request('GET', url)
+        self.assertEqual(json.decode(body.read().decode('utf-8'))['_id'],
+                         'foo')
+
+    def test_own_if_none_match(self):
+        server = MockServer([(200, {'ETag': '"1"'}, b'{"n": 1}'),
+                             (304, {'ETag': '"2"'}, b''),
+                             (304, {'ETag': '"1"'}, b'')])
+        try:
+            session = http.Session()
+            session.request('GET', server.url + 'doc')
+            # The caller's own header is sent, and the 304 returned.
+            status, headers, body = session.request(
+                'GET', server.url + 'doc', headers={'If-None-Match': '"2"'})
+            self.assertEqual(server.requests[1][2]['if-none-match'], '"2"')
+            self.assertEqual((status, body), (304, None))
+            # Unless it's the ETag of the cached response.
+            status, headers, body = session.request(
+                'GET', server.url + 'doc', headers={'If-None-Match': '"1"'})
+            self.assertEqual((status, body.read()), (200, b'{"n": 1}'))
+        finally:
+            server.close()
+
+
+class SQLiteCacheTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(SQLiteCacheTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(SQLiteCacheTestCase, self).tearDown()
+
+    def test_roundtrip(self):
+        cache = http.SQLiteCache(self.path)
+        cache.put('foo', (200, {'ETag': '"1-abc"'}, b'{}'))
+        status, headers, body = cache.get('foo')
+        self.assertEqual((status, body), (200, b'{}'))
+        self.assertEqual(headers.get('etag'), '"1-abc"')
+        self.assertTrue(cache.get('bar') is None)
+        cache.remove('foo')
+        cache.remove('foo')
+        self.assertTrue(cache.get('foo') is None)
+
+    def test_shared(self):
+        first, second = http.SQLiteCache(self.path), http.SQLiteCache(self.path)
+        first.put('foo', (200, {}, b'foo'))
+        self.assertEqual(second.get('foo')[2], b'foo')
+
+    def test_max_entries(self):
+        cache = http.SQLiteCache(self.path, max_entries=2)
+        for url in ['foo', 'bar', 'baz']:
+            cache.put(url, (200, {}, b''))
+        self.assertTrue(cache.get('foo') is None)
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_ttl(self):
+        cache = http.SQLiteCache(self.path, ttl=0.01)
+        cache.put('foo', (200, {}, b'foo'))
+        time.sleep(0.02)
+        self.assertTrue(cache.get('foo') is None)
+
+    def test_threads(self):
+        cache = http.SQLiteCache(self.path)
+        def put(i):
+            cache.put(str(i), (200, {}, b'x'))
+        threads = [threading.Thread(target=put, args=(i,)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.stats()['entries'], 5)
+
+    def test_session_revalidation(self):
+        self.db['foo'] = {'bar': 42}
+        url = self.db.resource('foo').url
+        http.Session(cache=http.SQLiteCache(self.path)).request('GET', url)
+        # A new session, as in a restarted process, reuses the cached body.
+        session = http.Session(cache=http.SQLiteCache(self.path))
+        status, headers, body = session.request('GET', url)
+        self.assertEqual(json.decode(body.read().decode('utf-8'))['bar'], 42)
+        self.assertEqual(session.cache.stats()['hits'], 1)
+
+    def test_session_large_body(self):
+        self.db['foo'] = {'bar': 'x' * 20000}
+        url = self.db.resource('foo').url
+        http.Session(cache=http.SQLiteCache(self.path)).request('GET', url)
+        finished = []
+        hooks = http.RequestHooks()
+        hooks.request_finished = finished.append
+        session = http.Session(cache=http.SQLiteCache(self.path),
+                               hooks=[hooks])
+        status, headers, body = session.request('GET', url)
+        self.assertEqual(len(json.decode(body.read().decode('utf-8'))['bar']),
+                         20000)
+        self.assertEqual(finished[0].status, 304)
+        # Bodies above the limit are streamed and not cached.
+        session = http.Session(cache=http.SQLiteCache(self.path),
+                               cache_max_body_size=1000)
+        session.cache.remove(url)
+        status, headers, body = session.request('GET', url)
+        body.read()
+        self.assertEqual(session.cache.get(url), None)
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # A listening socket is enough for connect() to succeed, no requests
+        # are made over the pooled connections.
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(16)
+        self.url = 'http://127.0.0.1:%d/db' % self.listener.getsockname()[1]
+
+    def tearDown(self):
+        self.listener.close()
+
+    def test_reuse(self):
+        pool = http.ConnectionPool(None)
+        conn = pool.get(self.url)
+        pool.release(self.url, conn)
+        self.assertTrue(pool.get(self.url) is conn)
+        stats = pool.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual((stats['idle'], stats['in_use']), (0, 1))
+
+    def test_double_release(self):
+        pool = http.ConnectionPool(None, max_connections=1)
+        conn = pool.get(self.url)
+        pool.release(self.url, conn)
+        pool.release(self.url, conn)
+        self.assertEqual(pool.stats()['idle'], 1)
+        self.assertTrue(pool.get(self.url) is conn)
+
+    def test_max_connections_timeout(self):
+        pool = http.ConnectionPool(None, max_connections=2, pool_timeout=0.05)
+        pool.get(self.url)
+        pool.get(self.url)
+        self.assertRaises(http.PoolTimeout, pool.get, self.url)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_max_connections_wait(self):
+        pool = http.ConnectionPool(None, max_connections=1, pool_timeout=5)
+        conn = pool.get(self.url)
+        timer = threading.Timer(0.05, pool.release, (self.url, conn))
+        timer.start()
+        self.assertTrue(pool.get(self.url) is conn)
+        timer.join()
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_discard_frees_slot(self):
+        pool = http.ConnectionPool(None, max_connections=1, pool_timeout=0)
+        conn = pool.get(self.url)
+        pool.discard(self.url, conn)
+        self.assertTrue(pool.get(self.url) is not conn)
+
+    def test_idle_timeout(self):
+        pool = http.ConnectionPool(None, idle_timeout=0.01)
+        conn = pool.get(self.url)
+        pool.release(self.url, conn)
+        time.sleep(0.02)
+        self.assertTrue(pool.get(self.url) is not conn)
+        stats = pool.stats()
+        self.assertEqual((stats['evictions'], stats['misses']), (1, 2))
+
+    def test_stale_connection(self):
+        pool = http.ConnectionPool(None)
+        conn = pool.get(self.url)
+        server_side, _ = self.listener.accept()
+        pool.release(self.url, conn)
+        server_side.close()
+        self.assertTrue(pool.get(self.url) is not conn)
+        self.assertEqual(pool.stats()['stale'], 1)
+
+    def test_live_connection(self):
+        pool = http.ConnectionPool(None)
+        conn = pool.get(self.url)
+        server_side, _ = self.listener.accept()
+        pool.release(self.url, conn)
+        self.assertTrue(pool.get(self.url) is conn)
+        self.assertEqual(pool.stats()['stale'], 0)
+        server_side.close()
+
+    def test_max_connection_age(self):
+        pool = http.ConnectionPool(None, max_connection_age=0.01)
+        conn = pool.get(self.url)
+        pool.release(self.url, conn)
+        self.assertTrue(pool.get(self.url) is conn)
+        time.sleep(0.02)
+        pool.release(self.url, conn)
+        self.assertEqual(pool.stats()['idle'], 0)
+        self.assertEqual(pool.stats()['evictions'], 1)
+
+    def test_session_options(self):
+        session = http.Session(max_connections=3, pool_timeout=1,
+                               idle_timeout=60, max_connection_age=300)
+        session.disable_ssl_verification()
+        pool = session.connection_pool
+        self.assertEqual(pool.max_connections, 3)
+        self.assertEqual(pool.pool_timeout, 1)
+        self.assertEqual(pool.idle_timeout, 60)
+        self.assertEqual(pool.max_connection_age, 300)
+
+
+class MockServer(object):
+    """HTTP server answering requests with canned responses, optionally after
+    a delay, which records the requests it received as ``(method, path,
+    headers, body)`` tuples. A response of `None` closes the connection
+    instead.
+    """
+
+    def __init__(self, responses, delay=0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.requests = []
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(16)
+        self.url = 'http://127.0.0.1:%d/' % self.listener.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.listener.close()
+
+    def serve(self):
+        while True:
+            try:
+                conn, addr = self.listener.accept()
+            except socket.error:
+                return
+            thread = threading.Thread(target=self.handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def handle(self, conn):
+        fp = conn.makefile('rb')
+        try:
+            while self.handle_request(conn, fp):
+                pass
+        finally:
+            fp.close()
+            conn.close()
+
+    def handle_request(self, conn, fp):
+        line = fp.readline().decode('latin-1')
+        if not line:
+            return False
+        method, path, version = line.split()
+        headers = {}
+        while True:
+            line = fp.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, value = line.split(':', 1)
+            headers[name.lower()] = value.strip()
+        if 'content-length' in headers:
+            body = fp.read(int(headers['content-length']))
+        else:
+            chunks = []
+            while True:
+                size = int(fp.readline().strip(), 16)
+                chunks.append(fp.read(size))
+                fp.readline()
+                if not size:
+                    break
+            body = b''.join(chunks)
+        self.requests.append((method, path, headers, body))
+        time.sleep(self.delay)
+        response = self.responses.pop(0)
+        if response is None:
+            # Close the connection without responding.
+            return False
+        status, extra_headers, data = response
+        response = ['HTTP/1.1 %d Mock' % status,
+                    'Content-Type: application/json']
+        if 'Content-Length' not in extra_headers:
+            response.append('Content-Length: %d' % len(data))
+        response.extend('%s: %s' % item for item in extra_headers.items())
+        conn.sendall(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1')
+                     + data)
+        return True
+
+
+def unused_url():
+    """Return the URL of a local port nothing is listening on."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return 'http://127.0.0.1:%d/' % port
+
+
+class UploadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer([(201, {}, b'{"ok":true}')])
+        self.url = self.server.url + 'db/doc/att'
+
+    def tearDown(self):
+        self.server.close()
+
+    @property
+    def headers(self):
+        return self.server.requests[0][2]
+
+    @property
+    def body(self):
+        return self.server.requests[0][3]
+
+    def upload(self, body, **options):
+        session = http.Session(**options)
+        status, headers, data = session.request('PUT', self.url, body=body)
+        self.assertEqual(status, 201)
+        return session
+
+    def test_regular_file(self):
+        content = os.urandom(300000)
+        with tempfile.TemporaryFile() as fileobj:
+            fileobj.write(content)
+            fileobj.seek(10)
+            self.upload(fileobj)
+        self.assertEqual(self.headers['content-length'], '299990')
+        self.assertFalse('transfer-encoding' in self.headers)
+        self.assertEqual(self.body, content[10:])
+
+    def test_seekable(self):
+        content = os.urandom(10000)
+        self.upload(util.StringIO(content), upload_chunk_size=1000)
+        self.assertEqual(self.headers['content-length'], '10000')
+        self.assertEqual(self.body, content)
+
+    def test_explicit_content_length(self):
+        class Stream(object):
+            def __init__(self, data):
+                self.data = util.StringIO(data)
+            def read(self, size):
+                return self.data.read(size)
+        session = http.Session(upload_chunk_size=7)
+        session.request('PUT', self.url, body=Stream(b'x' * 100),
+                        headers={'Content-Length': '100'})
+        self.assertEqual(self.headers['content-length'], '100')
+        self.assertEqual(self.body, b'x' * 100)
+
+    def test_chunked_readinto(self):
+        class Stream(object):
+            def __init__(self, data):
+                self.data = util.StringIO(data)
+            def read(self, size):
+                raise AssertionError('read() should not be used')
+            def readinto(self, buf):
+                return self.data.readinto(buf)
+            def seekable(self):
+                return False
+        content = os.urandom(10000)
+        hooks = http.RequestHooks()
+        infos = []
+        hooks.request_finished = infos.append
+        self.upload(Stream(content), upload_chunk_size=999, hooks=[hooks])
+        self.assertEqual(self.headers['transfer-encoding'], 'chunked')
+        self.assertEqual(self.body, content)
+        self.assertEqual(infos[0].bytes_sent, 10000)
+
+    def test_compressed_stream(self):
+        content = json.encode({'docs': [{'n': i} for i in range(1000)]})
+        class Stream(object):
+            def __init__(self, data):
+                self.data = util.StringIO(data)
+            def read(self, size):
+                return self.data.read(size)
+        session = http.Session(compress_requests=True, upload_chunk_size=1000)
+        session.request('PUT', self.url, body=Stream(content.encode('utf-8')),
+                        headers={'Content-Type': 'application/json'})
+        self.assertEqual(self.headers['content-encoding'], 'gzip')
+        self.assertEqual(self.headers['transfer-encoding'], 'chunked')
+        self.assertTrue(len(self.body) < len(content) / 2)
+        decoder = http.content_decoder('gzip')
+        self.assertEqual(decoder.decompress(self.body) + decoder.flush(),
+                         content.encode('utf-8'))
+
+    def test_chunked_text(self):
+        self.upload(io.StringIO(u'\xe9t\xe9' * 1000), upload_chunk_size=100)
+        self.assertEqual(self.headers['transfer-encoding'], 'chunked')
+        self.assertEqual(self.body.decode('utf-8'), u'\xe9t\xe9' * 1000)
+
+
+class RetryTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        self.server.close()
+
+    def request(self, responses, method='GET', path='db/doc', body=None,
+                **options):
+        self.server = MockServer(responses)
+        self.policy = http.RetryPolicy(backoff=0.001, **options)
+        session = http.Session(retry_policy=self.policy)
+        return session.request(method, self.server.url + path, body=body)
+
+    def test_status_retry(self):
+        status, headers, data = self.request([
+            (503, {}, b'{"error":"unavailable"}'),
+            (429, {'Retry-After': '0'}, b'{}'),
+            (200, {}, b'{"ok":true}'),
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual(len(self.server.requests), 3)
+        stats = self.policy.stats()
+        self.assertEqual(stats['status_retries'], 2)
+        self.assertEqual(stats['requests'], 1)
+
+    def test_max_retries(self):
+        self.assertRaises(http.ServerError, self.request,
+                          [(503, {}, b'{}')] * 3, max_retries=2)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.policy.stats()['exhausted'], 1)
+
+    def test_retry_after_too_long(self):
+        self.assertRaises(http.ServerError, self.request,
+                          [(503, {'Retry-After': '3600'}, b'{}')])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_not_idempotent(self):
+        self.assertRaises(http.ServerError, self.request,
+                          [(503, {}, b'{}')], method='POST', path='db',
+                          body={'foo': 'bar'})
+        self.assertEqual(self.policy.stats()['retries'], 0)
+
+    def test_bulk_docs(self):
+        status, headers, data = self.request(
+            [(503, {}, b'{}'), (201, {}, b'[]')], method='POST',
+            path='db/_bulk_docs', body={'docs': [{'_id': 'a'}]})
+        self.assertEqual(status, 201)
+        self.assertEqual(self.server.requests[0][3],
+                         self.server.requests[1][3])
+
+    def bulk_docs_body(self, docs):
+        return client._BulkDocsBody(docs, {})
+
+    def test_bulk_docs_stream(self):
+        body = self.bulk_docs_body([{'_id': 'a'}, {'_id': 'b'}])
+        status, headers, data = self.request(
+            [(503, {}, b'{}'), (201, {}, b'[]')], method='POST',
+            path='db/_bulk_docs', body=body)
+        self.assertEqual(status, 201)
+        self.assertEqual(json.decode(self.server.requests[1][3]),
+                         {'docs': [{'_id': 'a'}, {'_id': 'b'}]})
+        self.assertEqual(self.server.requests[0][3],
+                         self.server.requests[1][3])
+
+    def test_bulk_docs_stream_missing_ids(self):
+        body = self.bulk_docs_body([{'_id': 'a'}, {}])
+        self.assertRaises(http.ServerError, self.request,
+                          [(503, {}, b'{}')], method='POST',
+                          path='db/_bulk_docs', body=body)
+        self.assertEqual(self.policy.stats()['retries'], 0)
+
+    def test_bulk_docs_iterator(self):
+        # Documents produced by an iterator can't be encoded again.
+        body = self.bulk_docs_body(iter([{'_id': 'a'}]))
+        self.assertRaises(http.ServerError, self.request,
+                          [(503, {}, b'{}')], method='POST',
+                          path='db/_bulk_docs', body=body)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_seekable_body(self):
+        body = util.StringIO(b'{"foo": "bar"}')
+        status, headers, data = self.request(
+            [(503, {}, b'{}'), (201, {}, b'{}')], method='PUT', body=body)
+        self.assertEqual(status, 201)
+        self.assertEqual(self.server.requests[1][3], b'{"foo": "bar"}')
+
+    def test_budget(self):
+        self.assertRaises(http.ServerError, self.request,
+                          [(503, {}, b'{}')] * 3, budget=1)
+        stats = self.policy.stats()
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(stats['budget_exhausted'], 1)
+
+    def test_socket_error_stream(self):
+        # The connection is closed after the body has been read.
+        self.server = MockServer([None, (201, {}, b'[]')])
+        body = self.bulk_docs_body([{'_id': 'a'}])
+        session = http.Session()
+        status, headers, data = session.request(
+            'POST', self.server.url + 'db/_bulk_docs', body=body,
+            headers={'Content-Type': 'application/json'})
+        self.assertEqual(status, 201)
+        self.assertEqual(self.server.requests[1][3], b'{"docs": [{"_id": "a"}]}')
+
+    def test_socket_error_unrewindable(self):
+        self.server = MockServer([None, (201, {}, b'[]')])
+        body = self.bulk_docs_body(iter([{'_id': 'a'}]))
+        session = http.Session()
+        self.assertRaises(socket.error, session.request, 'POST',
+                          self.server.url + 'db/_bulk_docs', body=body)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_socket_error(self):
+        self.server = MockServer([])
+        policy = http.RetryPolicy(backoff=0.001, max_retries=2)
+        session = http.Session(retry_policy=policy)
+        self.assertRaises(socket.error, session.request, 'POST',
+                          unused_url(), body={})
+        self.assertEqual(policy.stats()['error_retries'], 2)
+
+
+class TimeoutTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer([(200, {}, b'{"ok":true}')] * 3, delay=0.3)
+
+    def tearDown(self):
+        self.server.close()
+
+    def assertTimesOut(self, func, *args, **kwargs):
+        start = time.time()
+        self.assertRaises(socket.timeout, func, *args, **kwargs)
+        self.assertTrue(time.time() - start < 0.25)
+
+    def test_total(self):
+        session = http.Session(timeout=http.Timeout(total=0.1))
+        self.assertTimesOut(session.request, 'GET', self.server.url)
+
+    def test_per_request(self):
+        session = http.Session(timeout=http.Timeout(read=5))
+        self.assertTimesOut(session.request, 'GET', self.server.url,
+                            timeout=0.1)
+        # The connection doesn't keep the shorter timeout.
+        status, headers, data = session.request('GET', self.server.url)
+        self.assertEqual(status, 200)
+
+    def test_resource(self):
+        resource = http.Resource(self.server.url, http.Session())
+        self.assertTimesOut(resource.get_json, 'db', include_docs=True,
+                            request_timeout=http.Timeout(total=0.1))
+        self.assertEqual(self.server.requests[0][1], '/db?include_docs=true')
+
+    def test_no_retry_past_deadline(self):
+        self.server.responses = [(503, {'Retry-After': '1'}, b'{}')]
+        self.server.delay = 0
+        session = http.Session(retry_policy=http.RetryPolicy(),
+                               timeout=http.Timeout(total=0.5))
+        start = time.time()
+        self.assertRaises(http.ServerError, session.request, 'GET',
+                          self.server.url)
+        self.assertTrue(time.time() - start < 0.25)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stalled_body(self):
+        # The server sends less of the body than announced.
+        self.server.responses = [(200, {'Content-Length': '100'}, b'{"ok"'),
+                                 (200, {}, b'{"ok":true}')]
+        self.server.delay = 0
+        finished = []
+        hooks = http.RequestHooks()
+        hooks.request_finished = finished.append
+        session = http.Session(max_connections=1, hooks=[hooks],
+                               timeout=http.Timeout(read=0.1), pool_timeout=1)
+        self.assertRaises(socket.timeout, session.request, 'GET',
+                          self.server.url)
+        self.assertEqual(len(finished), 1)
+        self.assertTrue(isinstance(finished[0].error, socket.timeout))
+        stats = session.connection_pool.stats()
+        self.assertEqual((stats['in_use'], stats['idle']), (0, 0))
+        status, headers, data = session.request('GET', self.server.url)
+        self.assertEqual(status, 200)
+
+    def test_pool_wait(self):
+        session = http.Session(max_connections=1)
+        conn = session.connection_pool.get(self.server.url)
+        self.assertRaises(http.RequestTimeout, session.request, 'GET',
+                          self.server.url, timeout=http.Timeout(total=0.1))
+        session.connection_pool.release(self.server.url, conn)
+
+
+class ClusterSessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+
+    def server(self, count=3, delay=0):
+        server = MockServer([(200, {}, b'{"ok":true}')] * count, delay)
+        self.servers.append(server)
+        return server
+
+    def test_outstanding(self):
+        slow, fast = self.server(delay=0.2), self.server()
+        session = http.ClusterSession([slow.url, fast.url])
+        thread = threading.Thread(target=session.request,
+                                  args=('GET', slow.url + 'db'))
+        thread.start()
+        time.sleep(0.05)
+        session.request('GET', slow.url + 'db')
+        thread.join()
+        self.assertEqual(len(slow.requests), 1)
+        self.assertEqual(len(fast.requests), 1)
+        self.assertEqual(fast.requests[0][1], '/db')
+
+    def test_latency(self):
+        slow, fast = self.server(delay=0.05), self.server()
+        session = http.ClusterSession([slow.url, fast.url], balance='latency')
+        for i in range(4):
+            session.request('GET', slow.url)
+        self.assertEqual(len(slow.requests), 1)
+        self.assertEqual(len(fast.requests), 3)
+
+    def test_failover(self):
+        dead, live = unused_url(), self.server()
+        session = http.ClusterSession([dead, live.url], failure_threshold=2)
+        for i in range(3):
+            status, headers, data = session.request('GET', dead + 'db/doc')
+            self.assertEqual(status, 200)
+        dead_stats, live_stats = session.node_stats()
+        self.assertEqual(dead_stats['errors'], 2)
+        self.assertFalse(dead_stats['up'])
+        self.assertEqual(live_stats['requests'], 3)
+        self.assertTrue(live_stats['up'])
+
+    def test_no_failover(self):
+        dead, live = unused_url(), self.server()
+        session = http.ClusterSession([dead, live.url])
+        self.assertRaises(socket.error, session.request, 'POST', dead + 'db',
+                          body={})
+        self.assertEqual(live.requests, [])
+
+    def test_failover_stream(self):
+        dropping, live = MockServer([None, None]), self.server()
+        self.servers.append(dropping)
+        session = http.ClusterSession(
+            [dropping.url, live.url],
+            retry_policy=http.RetryPolicy(max_retries=1, backoff=0.001))
+        body = client._BulkDocsBody([{'_id': 'a'}], {})
+        status, headers, data = session.request(
+            'POST', dropping.url + 'db/_bulk_docs', body=body,
+            headers={'Content-Type': 'application/json'})
+        self.assertEqual(status, 200)
+        self.assertEqual(live.requests[0][3], b'{"docs": [{"_id": "a"}]}')
+
+    def test_recovery(self):
+        dead, live = unused_url(), self.server()
+        session = http.ClusterSession([dead, live.url], failure_threshold=1,
+                                      recovery_timeout=0.05)
+        session.request('GET', live.url)
+        session.request('GET', live.url)
+        self.assertEqual(session.node_stats()[0]['requests'], 1)
+        time.sleep(0.05)
+        session.request('GET', live.url)
+        self.assertEqual(session.node_stats()[0]['requests'], 2)
+
+    def test_all_down(self):
+        session = http.ClusterSession([unused_url(), unused_url()],
+                                      failure_threshold=1)
+        self.assertRaises(socket.error, session.request, 'GET',
+                          session.nodes[0].url)
+        self.assertRaises(socket.error, session.request, 'GET',
+                          session.nodes[0].url)
+        self.assertEqual([node['requests'] for node in session.node_stats()],
+                         [2, 2])
+
+    def test_other_urls(self):
+        server = self.server()
+        session = http.ClusterSession([unused_url()])
+        status, headers, data = session.request('GET', server.url)
+        self.assertEqual(status, 200)
+
+    def test_server(self):
+        node1, node2 = self.server(), self.server()
+        server = client.Server([node1.url, node2.url])
+        self.assertTrue(isinstance(server.resource.session,
+                                   http.ClusterSession))
+        self.assertEqual(server.resource.url, node1.url)
 
 
 def suite():
@@ -99,6 +927,12 @@ def suite():
     suite.addTest(unittest.makeSuite(SessionTestCase, 'test'))
     suite.addTest(unittest.makeSuite(ResponseBodyTestCase, 'test'))
     suite.addTest(unittest.makeSuite(CacheTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(SQLiteCacheTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(ConnectionPoolTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(UploadTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(RetryTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(TimeoutTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(ClusterSessionTestCase, 'test'))
     return suite
 
 
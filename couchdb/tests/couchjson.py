@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+
+import unittest
+
+from couchdb import json, util
+from couchdb.tests import testutil
+
+
+class IterDecodeTestCase(unittest.TestCase):
+
+    def iterdecode(self, data, array=None, chunk_size=1):
+        return list(json.iterdecode(util.StringIO(data), array, chunk_size))
+
+    def test_object(self):
+        data = b'{"total_rows": 2, "rows": [{"id": "a"}, {"id": "b"}],' \
+               b' "last": [1, {"x": null}]}'
+        self.assertEqual(self.iterdecode(data, 'rows'), [
+            ('total_rows', 2), ('rows', {'id': 'a'}), ('rows', {'id': 'b'}),
+            ('last', [1, {'x': None}])
+        ])
+        self.assertEqual(self.iterdecode(data), [
+            ('total_rows', 2), ('rows', [{'id': 'a'}, {'id': 'b'}]),
+            ('last', [1, {'x': None}])
+        ])
+
+    def test_array(self):
+        self.assertEqual(self.iterdecode(b' [1, "two", [3]] '),
+                         [(None, 1), (None, 'two'), (None, [3])])
+
+    def test_empty(self):
+        self.assertEqual(self.iterdecode(b'{}'), [])
+        self.assertEqual(self.iterdecode(b'[]'), [])
+        self.assertEqual(self.iterdecode(b'{"rows": []}', 'rows'), [])
+
+    def test_strings(self):
+        data = u'["}]\\"{[", "\\\\", "é中"]'.encode('utf-8')
+        self.assertEqual(self.iterdecode(data),
+                         [(None, '}]"{['), (None, '\\'),
+                          (None, u'é中')])
+
+    def test_lines(self):
+        data = b'{"total_rows":2,"offset":0,"rows":[\r\n' \
+               b'{"id":"a","key":"a","value":{}},\r\n' \
+               b'{"id":"b","key":"b","value":{}}\r\n' \
+               b']}\n'
+        self.assertEqual([row['id'] for name, row in
+                          self.iterdecode(data, 'rows', 7) if name == 'rows'],
+                         ['a', 'b'])
+
+    def test_large_value(self):
+        doc = {'_id': 'big', 'text': u'x\\"\u00e9' * 50000,
+               'list': list(range(10000))}
+        data = json.encode({'rows': [{'doc': doc}, 1]}).encode('utf-8')
+        self.assertEqual(self.iterdecode(data, 'rows', 100),
+                         [('rows', {'doc': doc}), ('rows', 1)])
+
+    def test_lazy(self):
+        body = util.StringIO(b'{"rows": [1, 2, ' + b' ' * 10000 + b'3]}')
+        rows = json.iterdecode(body, 'rows', chunk_size=16)
+        self.assertEqual(next(rows), ('rows', 1))
+        self.assertTrue(body.tell() < 100)
+
+    def test_invalid(self):
+        for data in (b'', b'{"a": 1', b'{"a": 1}x', b'{"rows": [1,',
+                     b'[1 2]', b'{1: 2}'):
+            self.assertRaises(ValueError, self.iterdecode, data, 'rows')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(IterDecodeTestCase, 'test'))
+    suite.addTest(testutil.doctest_suite(json))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+
+import errno
+import itertools
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from couchdb import follower, http
+from couchdb.tests import testutil
+
+
+class ChangesFollowerTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
+
+    def follow(self, follower_, count):
+        ids = []
+        for batch in follower_:
+            ids.append([change['id'] for change in batch])
+            if sum(len(batch) for batch in ids) >= count:
+                follower_.stop()
+        return ids
+
+    def test_batches(self):
+        self.db.update([{'_id': str(i)} for i in range(5)])
+        f = follower.ChangesFollower(self.db, batch_size=2,
+                                     batch_timeout=0.1, heartbeat=50)
+        self.assertEqual(self.follow(f, 5), [['0', '1'], ['2', '3'], ['4']])
+        self.assertEqual(f.since, 5)
+
+    def test_since(self):
+        self.db.update([{'_id': str(i)} for i in range(3)])
+        f = follower.ChangesFollower(self.db, since=2, batch_timeout=0.1,
+                                     heartbeat=50)
+        self.assertEqual(self.follow(f, 1), [['2']])
+
+    def test_batch_timeout(self):
+        # A steady trickle of changes without heartbeats in between doesn't
+        # hold back a batch.
+        self.db.resource = TrickleResource(self.db.resource, 0.05)
+        f = follower.ChangesFollower(self.db, batch_timeout=0.3)
+        start = time.time()
+        batch = next(iter(f))
+        f.stop()
+        self.assertTrue(time.time() - start < 1)
+        self.assertTrue(0 < len(batch) < 100)
+
+    def test_batch_timeout_quiet(self):
+        # The feed going quiet doesn't hold back a batch until the next
+        # heartbeat.
+        self.db.resource = TrickleResource(self.db.resource, 0.01, count=3)
+        f = follower.ChangesFollower(self.db, batch_timeout=0.2,
+                                     heartbeat=30000)
+        start = time.time()
+        batch = next(iter(f))
+        f.stop()
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual([change['id'] for change in batch], ['1', '2', '3'])
+
+    def test_options(self):
+        self.assertRaises(ValueError, follower.ChangesFollower, self.db,
+                          feed='longpoll')
+
+    def test_reconnect(self):
+        self.db.update([{'_id': str(i)} for i in range(3)])
+        self.db.resource = FlakyResource(self.db.resource, failures=2)
+        f = follower.ChangesFollower(self.db, batch_timeout=0.1,
+                                     heartbeat=50, backoff=0.01)
+        self.assertEqual(self.follow(f, 3), [['0', '1', '2']])
+        self.assertEqual(f.failures, 0)
+        self.assertTrue(isinstance(f.last_error, socket.error))
+
+    def test_client_error(self):
+        self.db.resource = FlakyResource(self.db.resource, failures=1,
+                                         error=http.ServerError((400, '')))
+        f = follower.ChangesFollower(self.db, backoff=0.01)
+        self.assertRaises(http.ServerError, next, iter(f))
+
+    def test_callable_checkpoint(self):
+        self.db.update([{'_id': str(i)} for i in range(3)])
+        saved = []
+        f = follower.ChangesFollower(self.db, checkpoint=saved.append,
+                                     batch_size=2, batch_timeout=0.1,
+                                     heartbeat=50)
+        self.follow(f, 3)
+        self.assertEqual(saved, [2, 3])
+
+    def test_local_checkpoint(self):
+        self.db.update([{'_id': str(i)} for i in range(3)])
+        checkpoint = follower.LocalCheckpoint(self.db, 'follower')
+        self.assertEqual(checkpoint.load(), None)
+        f = follower.ChangesFollower(self.db, checkpoint=checkpoint,
+                                     batch_size=2, batch_timeout=0.1,
+                                     heartbeat=50)
+        self.follow(f, 2)
+        self.assertEqual(self.db['_local/follower']['seq'], 2)
+        checkpoint = follower.LocalCheckpoint(self.db, 'follower')
+        f = follower.ChangesFollower(self.db, checkpoint=checkpoint,
+                                     batch_timeout=0.1, heartbeat=50)
+        self.assertEqual(self.follow(f, 1)[0][0], '2')
+        self.assertEqual(checkpoint.load(), f.since)
+
+
+class FileCheckpointTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'seq')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_save_load(self):
+        checkpoint = follower.FileCheckpoint(self.path)
+        self.assertEqual(checkpoint.load(), None)
+        checkpoint.save('12-abc')
+        self.assertEqual(follower.FileCheckpoint(self.path).load(), '12-abc')
+        checkpoint.save(13)
+        self.assertEqual(checkpoint.load(), 13)
+        self.assertEqual(os.listdir(self.tempdir), ['seq'])
+
+
+class FlakyResource(object):
+
+    def __init__(self, resource, failures, error=None):
+        self.resource = resource
+        self.failures = failures
+        self.error = error or socket.error(errno.ECONNRESET, 'reset')
+
+    def __getattr__(self, name):
+        return getattr(self.resource, name)
+
+    def get(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        return self.resource.get(*args, **kwargs)
+
+
+class TrickleResource(object):
+
+    def __init__(self, resource, interval, count=None):
+        self.resource = resource
+        self.interval = interval
+        self.count = count
+
+    def __getattr__(self, name):
+        return getattr(self.resource, name)
+
+    def get(self, *args, **kwargs):
+        interval, count = self.interval, self.count
+
+        class Body(object):
+            def iterchunks(self):
+                for seq in itertools.islice(itertools.count(1), count):
+                    time.sleep(interval)
+                    yield ('{"seq": %d, "id": "%d", "changes": []}'
+                           % (seq, seq)).encode('utf-8')
+                # Stay quiet, without sending heartbeats.
+                time.sleep(2)
+            def close(self):
+                pass
+
+        return 200, {}, Body()
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ChangesFollowerTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(FileCheckpointTestCase, 'test'))
+    suite.addTest(testutil.doctest_suite(follower))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
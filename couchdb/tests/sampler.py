@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+
+import time
+import unittest
+
+from couchdb import client, http, sampler
+from couchdb.tests import testutil
+
+
+class SamplerTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
+
+    def test_sample(self):
+        self.db['foo'] = {}
+        s = sampler.Sampler(self.server, databases=[self.db.name])
+        t, values = s.sample()
+        self.assertEqual(values['databases/%s/doc_count' % self.db.name], 1)
+        self.assertEqual(s.latest(), (t, values))
+
+    def test_database_requests(self):
+        requests = []
+        hooks = http.RequestHooks()
+        hooks.request_started = lambda info: requests.append(info.method)
+        server = client.Server(self.server.resource.url,
+                               session=http.Session(hooks=[hooks]))
+        s = sampler.Sampler(server, databases=[self.db.name], stats=False,
+                            tasks=False)
+        s.sample()
+        s.sample()
+        self.assertEqual(requests, ['GET', 'GET'])
+
+    def test_tasks(self):
+        s = sampler.Sampler(FakeServer(), stats=False)
+        t, values = s.sample()
+        self.assertEqual(values, {'tasks/indexer/count': 2,
+                                  'tasks/indexer/pending_changes': 90,
+                                  'tasks/replication/count': 1})
+
+    def test_ring_buffer(self):
+        s = sampler.Sampler(self.server, databases=[self.db.name], size=3,
+                            stats=False, tasks=False)
+        for i in range(5):
+            s.sample()
+        self.assertEqual(len(s), 3)
+        series = s.series('databases/%s/doc_count' % self.db.name)
+        self.assertEqual([value for t, value in series], [0, 0, 0])
+
+    def test_rate(self):
+        s = sampler.Sampler(self.server, counters=['requests'])
+        s.buffer.extend([(100.0, {'requests': 10}), (102.0, {'requests': 20}),
+                         (104.0, {'requests': 5}), (106.0, {'requests': 9})])
+        # The drop to 5 is a reset, so the increase is 10 + 5 + 4.
+        self.assertEqual(s.rate('requests'), 19 / 6.0)
+        self.assertEqual(s.rate('requests', window=2), 2.0)
+        self.assertEqual(s.rate('missing'), None)
+        snapshot = s.snapshot()
+        self.assertEqual(snapshot['time'], 106.0)
+        self.assertEqual(snapshot['values'], {'requests': 9})
+        self.assertEqual(snapshot['rates'], {'requests': 19 / 6.0})
+
+    def test_counters(self):
+        values, counters = {}, set()
+        sampler._flatten({'couchdb': {
+            'database_reads': {'value': 5, 'type': 'counter', 'desc': 'x'},
+            'request_time': {'value': {'min': 1, 'max': 2},
+                             'type': 'histogram'},
+        }}, '', values, counters)
+        self.assertEqual(values, {'couchdb/database_reads': 5,
+                                  'couchdb/request_time/min': 1,
+                                  'couchdb/request_time/max': 2})
+        self.assertEqual(counters, set(['couchdb/database_reads']))
+
+    def test_background(self):
+        with sampler.Sampler(self.server, interval=0.01) as s:
+            deadline = time.time() + 5
+            while len(s) < 3 and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertTrue(len(s) >= 3)
+        self.assertEqual(s.errors, 0)
+        count = len(s)
+        time.sleep(0.05)
+        self.assertEqual(len(s), count)
+
+    def test_errors(self):
+        s = sampler.Sampler(self.server, databases=['missing'], interval=0.01)
+        s.start()
+        time.sleep(0.1)
+        s.stop()
+        self.assertTrue(s.errors > 0)
+        self.assertEqual(len(s), 0)
+
+
+class FakeServer(object):
+
+    def tasks(self):
+        return [{'type': 'indexer', 'changes_done': 50, 'total_changes': 100},
+                {'type': 'indexer', 'changes_done': 60, 'total_changes': 100},
+                {'type': 'replication'}]
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(SamplerTestCase, 'test'))
+    suite.addTest(testutil.doctest_suite(sampler))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')